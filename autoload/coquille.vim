@@ -3,9 +3,13 @@ function! coquille#Commands()
     command CoqNext call CoqNext()
     command CoqUndo call CoqUndo()
     command CoqToCursor call CoqToCursor()
+    command CoqFastForward call CoqFastForward()
     command CoqStop call CoqStop()
     command CoqCancel call CoqCancel()
     command CoqDebug call CoqDebug()
+    command -nargs=? CoqTrace call CoqTrace(<f-args>)
+    command CoqWorkers call CoqWorkers()
+    command CoqAllGoals call CoqAllGoals()
     command CoqVersion call CoqVersion()
     command CoqBuild call CoqBuild()
     command -nargs=1 CoqQuery call CoqQuery(<f-args>)
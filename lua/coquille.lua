@@ -0,0 +1,55 @@
+-- First line changed in the buffers that coquille checks, since coquille last
+-- asked for it.  Every change is seen through nvim_buf_attach, whether it is
+-- made by typing, a substitution over the whole buffer, an undo, another
+-- window or another plugin.
+local M = {}
+
+-- For each attached buffer, the first changed line (0-based), or false if
+-- nothing changed.
+local first = {}
+
+function M.attach(buf)
+  if first[buf] ~= nil then
+    return
+  end
+  first[buf] = false
+  vim.api.nvim_buf_attach(buf, false, {
+    on_lines = function(_, b, _, line)
+      if first[b] == nil then
+        -- Detached: returning true stops the callbacks.
+        return true
+      end
+      if first[b] == false or line < first[b] then
+        first[b] = line
+      end
+    end,
+    on_reload = function(_, b)
+      if first[b] ~= nil then
+        first[b] = 0
+      end
+    end,
+    on_detach = function(_, b)
+      first[b] = nil
+    end,
+  })
+end
+
+function M.detach(buf)
+  first[buf] = nil
+end
+
+-- Return the first line changed in buf since the last call, or -1 if nothing
+-- changed.  Anything may have changed in a buffer that is not attached.
+function M.take(buf)
+  local line = first[buf]
+  if line == nil then
+    return 0
+  end
+  first[buf] = false
+  if line == false then
+    return -1
+  end
+  return line
+end
+
+return M
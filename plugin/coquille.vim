@@ -27,6 +27,14 @@ function! coquille#Register()
     hi default SentToCoq ctermbg=60 guibg=LimeGreen
     hi default CoqErrorCommand ctermbg=226 ctermfg=black guibg=LimeGreen
     hi link CoqError Error
+    " Markup of the terms in the Goals and Infos panels
+    hi default link CoqKeyword Keyword
+    hi default link CoqVariable Identifier
+    hi default link CoqConstant Constant
+    hi default link CoqNotation Operator
+    hi default link CoqType Type
+    hi default link CoqMessageWarning WarningMsg
+    hi default link CoqMessageError ErrorMsg
 endfunction
 
 function! coquille#KillSession()
@@ -78,6 +86,14 @@ function! coquille#stop()
     endif
 endfunction
 
-autocmd VimLeavePre * call coquille#stop()
+function! coquille#leave()
+    call coquille#stop()
+    " The sessions started in advance for the next CoqLaunch.
+    if get(g:, 'coquille_pool_running', 0)
+        call CoqClosePool()
+    endif
+endfunction
+
+autocmd VimLeavePre * call coquille#leave()
 autocmd QuitPre * call coquille#stop()
 autocmd BufReadPre * call coquille#stop()
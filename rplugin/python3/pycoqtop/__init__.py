@@ -5,12 +5,22 @@ from .coqapi import Ok, Err
 from .xmltype import *
 from .projectparser import ProjectParser, CoqtopNotFoundException
 from .coqc import coqbuild
-from threading import Event, Lock, Thread
-from .parser import Parser
+from threading import Condition, Event, Thread
+from .sentences import SentenceIndex
+from .columns import ColumnIndex
+from .sentcache import SentenceCache
+from .log import Log, DEBUG
+from .events import Died, Processed, ErrorMessage
+from .richpp import highlights
+from .trace import TRACER, TracedLock, traced
+from .pool import PRELUDE, SessionPool, adopt
+from .workers import async_options
+from .journal import replay
+from .hibernation import LiveSessions
+from bisect import bisect_left, bisect_right
+from collections import deque
 
 import os
-import re
-import subprocess
 import time
 import uuid
 
@@ -18,8 +28,8 @@ def recolor(obj):
     obj.redraw()
 def regoal(obj, msg):
     obj.showGoal(msg)
-def reerror(obj, pos, start, end):
-    obj.showError(pos, start, end)
+def reerror(obj, pos, start, end, prev=None):
+    obj.showError(pos, start, end, prev)
 def step(obj):
     obj.next()
 def cursor(obj):
@@ -36,14 +46,29 @@ class Main(object):
         self.info_wins = {}
         self.goal_wins = {}
         self.vim = vim
+        # Sessions started in advance, as set by g:coquille_pool_size.
+        self.pool = SessionPool(0)
+        self.live = LiveSessions()
 
     def diditdieyet(self):
         "Checks whether the actionner thread died and re-raise its exception."
         for name in self.actionners:
             actionner = self.actionners[name]
-            if not actionner.isAlive():
+            if not actionner.is_alive():
                 raise actionner.exception
 
+    def use(self, name):
+        """ Record that the session name is used, and hibernate the least
+            recently used ones if too many are live.  The sessions of the pool
+            count as live, and are stopped first. """
+        if self.live.live[-1:] == [name]:
+            # Already the last one used, as for every change of its buffer.
+            return
+        for other in self.live.use(name, lambda n: self.actionners[n].idle()):
+            self.actionners[other].add_action('hibernate')
+        if self.live.size > 0:
+            self.pool.shrink(self.live.size - len(self.live.live))
+
     @neovim.function('CoqLaunch', sync=True)
     def launch(self, args=[]):
         self.vim.call("coquille#define_running")
@@ -68,7 +93,14 @@ class Main(object):
                 .format(self.currentVersion))
             return
         self.vim.command("let w:coquille_running='"+random_name+"'")
-        if self.actionners[random_name].restart():
+        self.pool.size = int(self.vim.eval("get(g:, 'coquille_pool_size', 0)"))
+        self.live.size = int(self.vim.eval("get(g:, 'coquille_max_sessions', 0)"))
+        if self.live.size > 0:
+            # Room is left for the new session.
+            self.pool.size = min(self.pool.size, self.live.size - len(self.live.live) - 1)
+        if self.pool.size > 0:
+            self.vim.command("let g:coquille_pool_running = 1")
+        if self.actionners[random_name].restart(self.pool if self.pool.size > 0 else None):
             self.vim.call('coquille#Register')
             self.vim.call('coquille#ShowPanels')
             self.info_wins[random_name] = self.vim.eval("g:new_info_buf")
@@ -76,6 +108,9 @@ class Main(object):
             self.actionners[random_name].goal_buf = self.vim.eval("g:new_goal_buf")
             self.actionners[random_name].info_buf = self.vim.eval("g:new_info_buf")
             self.actionners[random_name].start()
+            self.use(random_name)
+            if self.actionners[random_name].valid_dots != []:
+                self.actionners[random_name].ask_redraw()
         else:
             self.vim.command('echo "Coq could not be launched!"')
             self.vim.command("let w:coquille_running='false'")
@@ -99,6 +134,10 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.vim.command("let w:coquille_running='false'")
+        try:
+            self.vim.exec_lua("require('coquille').detach(...)", actionner.buf.number)
+        except:
+            pass
         actionner.stop()
         self.vim.call('coquille#KillSession')
         self.vim.command('bdelete '+str(self.info_wins[name]))
@@ -106,9 +145,18 @@ class Main(object):
         self.vim.command("let w:coquille_running='false'")
         self.vim.command("au! * <buffer>")
         actionner.join()
+        self.live.forget(name)
         del self.actionners[name]
         del self.goal_wins[name]
         del self.info_wins[name]
+        if self.actionners == {}:
+            self.closePool()
+
+    @neovim.function('CoqClosePool', sync=True)
+    def closePool(self, args=[]):
+        """ Stop the sessions started in advance. """
+        self.pool.close()
+        self.vim.command("let g:coquille_pool_running = 0")
 
     @neovim.function('CoqModify', sync=True)
     def modify(self, args=[]):
@@ -117,6 +165,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('modified')
 
     @neovim.function('CoqNext', sync=True)
@@ -126,6 +175,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('next')
 
     @neovim.function('CoqUndo', sync=False)
@@ -135,6 +185,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('undo')
 
     @neovim.function('CoqToCursor', sync=False)
@@ -144,8 +195,19 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('cursor')
 
+    @neovim.function('CoqFastForward', sync=False)
+    def fastForward(self, args=[]):
+        name = self.vim.eval("w:coquille_running")
+        if name == 'false':
+            return
+        actionner = self.actionners[name]
+        self.diditdieyet()
+        self.use(name)
+        actionner.add_action('fastforward')
+
     @neovim.function('CoqCancel')
     def cancel(self, args=[]):
         name = self.vim.eval("w:coquille_running")
@@ -153,6 +215,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('cancel')
 
     @neovim.function('CoqSearch', sync=True)
@@ -162,6 +225,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('search', args)
 
     @neovim.function('CoqCheck', sync=True)
@@ -171,6 +235,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('check', args)
 
     @neovim.function('CoqSearchAbout', sync=True)
@@ -180,6 +245,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('searchabout', args)
 
     @neovim.function('CoqLocate', sync=True)
@@ -189,6 +255,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('locate', args)
 
     @neovim.function('CoqPrint', sync=True)
@@ -198,6 +265,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('print', args)
 
     @neovim.function('CoqQuery', sync=True)
@@ -207,6 +275,7 @@ class Main(object):
             return
         actionner = self.actionners[name]
         self.diditdieyet()
+        self.use(name)
         actionner.add_action('query', args)
 
     @neovim.function('CoqRedraw', sync=True)
@@ -222,12 +291,39 @@ class Main(object):
     def debug(self, args=[]):
         name = self.vim.eval("w:coquille_running")
         actionner = self.actionners[name]
-        actionner.debug_wanted = True
-        self.vim.command('echo "running: ' + str(actionner.running_dots) + '"')
+        actionner.log.setLevel(min(actionner.log.level, DEBUG))
+        self.vim.command('echo "running: ' + str(list(actionner.running_dots)) + '"')
         self.vim.command('echo "valid: ' + str(actionner.valid_dots).replace("\"", "\\\"") + '"')
         self.vim.command('echo "state: ' + str(actionner.ct.state_id) + '"')
+        self.vim.command('echo "reader: {bytes} bytes in {reads} reads, {messages} messages, {bytes_per_s:.0f} bytes/s"'
+                .format(**actionner.ct.stats()))
         self.vim.command('echo "debug: '+str(actionner.flush_debug()).replace("\"", "\\\"")+'"')
 
+    @neovim.function('CoqWorkers', sync=True)
+    def workers(self, args=[]):
+        name = self.vim.eval("w:coquille_running")
+        if name == 'false':
+            return
+        actionner = self.actionners[name]
+        for line in actionner.ct.workers.report():
+            self.vim.command('echo "{}"'.format(line.replace('\\', '\\\\').replace('"', '\\"')))
+
+    @neovim.function('CoqWorkersStatus', sync=True)
+    def workersStatus(self, args=[]):
+        name = self.vim.eval("get(w:, 'coquille_running', 'false')")
+        if name == 'false' or name not in self.actionners:
+            return ''
+        return self.actionners[name].ct.workers.summary()
+
+    @neovim.function('CoqTrace', sync=True)
+    def trace(self, args=[]):
+        filename = args[0] if len(args) > 0 else self.vim.eval("get(g:, 'coquille_trace_file', '')")
+        if not TRACER.enabled or filename == '':
+            self.vim.command('echo "Set g:coquille_trace_file before CoqLaunch to trace sessions"')
+            return
+        count = TRACER.save(filename)
+        self.vim.command('echo "{} trace events written to {}"'.format(count, filename.replace('"', '\\"')))
+
     @neovim.function('CoqErrorAt', sync=True)
     def showError(self, pos, start, end):
         name = self.vim.eval("w:coquille_running")
@@ -255,6 +351,15 @@ class Main(object):
         self.diditdieyet()
         actionner.showGoal(goal)
 
+    @neovim.function('CoqAllGoals', sync=True)
+    def showAllGoals(self, args=[]):
+        name = self.vim.eval("w:coquille_running")
+        if name == 'false':
+            return
+        actionner = self.actionners[name]
+        self.diditdieyet()
+        actionner.showAllGoals()
+
     @neovim.function('CoqBuild', sync=False)
     def build(self, args):
         name = self.vim.eval("w:coquille_running")
@@ -272,12 +377,14 @@ class Main(object):
 
 # Start a request from a thread
 def request(vim, requester):
-    vim.async_call(run_request, requester)
-    return requester.waitResult()
+    with TRACER.span(type(requester).__name__, 'rpc'):
+        vim.async_call(run_request, requester)
+        return requester.waitResult()
 
 # Execute the request from nvim thread
 def run_request(requester):
-    requester.request()
+    with TRACER.span(type(requester).__name__, 'nvim'):
+        requester.request()
 
 class Requester:
     def __init__(self):
@@ -322,37 +429,55 @@ class FullstepRequester(Requester):
         self.setResult(res)
 
 class FullstepsRequester(FullstepRequester):
-    def __init__(self, obj, cline, ccol):
+    """ Send every sentence up to (cline, ccol), or to the end of the buffer
+        if cline is None.  With observe, they are executed with Observe, which
+        does not wait for the proofs. """
+    def __init__(self, obj, cline, ccol, observe=False):
         FullstepRequester.__init__(self, obj)
         self.cline = cline
         self.ccol = ccol
+        self.observe = observe
 
     def request(self):
-        steps = []
+        encoding = 'utf-8'
+        sent = 0
+        if self.cline is None:
+            (self.cline, self.ccol) = (len(self.obj.buf), 0)
         with self.obj.running_lock:
+            # Index every sentence up to the cursor in a single pass
+            self.obj.sentences.find(self.cline, self.ccol)
+            # Only the goals after the last sentence are shown, so they are
+            # only asked once, and that executes every sentence.  Comments
+            # need no call at all.
+            comments = True
             while True:
-                encoding = 'utf-8'
                 FullstepRequester.request(self)
                 res = self.waitResult()
                 if res['step'] == None:
                     break
                 if res['step']['stop'] <= (self.cline, self.ccol):
-                    self.obj.running_dots.insert(0, res['running'])
+                    self.obj.running_dots.append(res['running'])
                     self.obj.ct.advance(res['message'], res['type'], encoding)
-                    self.obj.ct.goals(True)
+                    sent += 1
+                    comments = comments and res['type'] == 'comment'
                 else:
                     break
-        self.setResult(steps)
-
-class BetweenRequester(Requester):
-    def __init__(self, obj, start, stop):
+            if not comments and self.observe:
+                self.obj.ct.observe(True)
+                self.obj.ct.goals()
+            elif not comments:
+                self.obj.ct.goals(True, True)
+        self.setResult(sent)
+
+class UnchangedRequester(Requester):
+    def __init__(self, obj, dots, n):
         Requester.__init__(self)
         self.obj = obj
-        self.start = start
-        self.stop = stop
+        self.dots = dots
+        self.n = n
 
     def request(self):
-        self.setResult(self.obj._between(self.start, self.stop))
+        self.setResult(self.obj._unchanged(self.dots, self.n))
 
 class CursorRequester(Requester):
     def __init__(self, vim, buf):
@@ -366,6 +491,23 @@ class CursorRequester(Requester):
         else:
             self.setResult(self.vim.current.window.cursor)
 
+class ModificationRequester(Requester):
+    """ The first line changed since the last request, as lua/coquille.lua
+        follows the changes of the buffer, or -1 if none was, and the number
+        of lines of the buffer.  Without the lua module, any line may have
+        changed. """
+    def __init__(self, vim, buf):
+        Requester.__init__(self)
+        self.vim = vim
+        self.buf = buf
+
+    def request(self):
+        try:
+            first = self.vim.exec_lua("return require('coquille').take(...)", self.buf.number)
+        except:
+            first = 0
+        self.setResult((first, len(self.buf)))
+
 class LineRequester(Requester):
     def __init__(self, buf, line):
         Requester.__init__(self)
@@ -406,7 +548,7 @@ class RemoveInfoRequester(Requester):
 
 class Printer(Thread):
     def __init__(self, printer):
-        Thread.__init__(self)
+        Thread.__init__(self, name='Printer')
 
         self.printer = printer
         self.info = []
@@ -414,7 +556,7 @@ class Printer(Thread):
         self.event = Event()
         self.event.clear()
         self.cont = True
-        self.lock = Lock()
+        self.lock = TracedLock('printer')
         self.info_modified = False
         self.goal_modified = False
         self.flushing = False
@@ -444,11 +586,13 @@ class Printer(Thread):
 
     def stop(self):
         self.cont = False
+        self.event.set()
 
     def run(self):
         try:
             while self.cont:
-                self.event.wait(0.1)
+                # Woken up by new goals or messages, or by stop.
+                self.event.wait()
                 with self.lock:
                     self.event.clear()
                     canFlush = False
@@ -461,12 +605,19 @@ class Printer(Thread):
                     if self.goal_modified and self.goal != []:
                         request(self.printer.vim, GoalRequester(self.printer, self.goal.pop()))
                         self.goal_modified = False
-        except e:
-            self.printer.debug(str(e))
+        except Exception as e:
+            self.printer.error("%s\n", e)
 
 class Actionner(Thread):
+    # Number of times in a row that coqtop is started again when it dies,
+    # without any action from the user in between.
+    max_recoveries = 3
+    # Seconds between two reports of the progress of a recovery.
+    progress_interval = 0.5
+
     def __init__(self, vim):
-        Thread.__init__(self)
+        Thread.__init__(self, name='Actionner')
+        self.log = Log()
 
         # Find current filename or use current working directory if there is
         # no open file.
@@ -480,28 +631,72 @@ class Actionner(Thread):
         coqproject = self.findCoqProject(filename)
         self.parser = ProjectParser(coqproject)
         self.ct = new_coqtop(self, self.parser)
+        self.ct.events.subscribe(ErrorMessage, self.proofError)
+        self.ct.events.subscribe(Died, self.died)
         self.coqtopbin = self.parser.getCoqtop()
         self.vim = vim
         self.buf = self.vim.current.buffer
+        self.sentences = SentenceIndex(self.buf)
+        self.columns = ColumnIndex(self.buf)
+        self.sentcache = SentenceCache()
+        self.sentcache.fillProject(self.parser)
         self.printer = Printer(self)
         self.printer.start()
 
         self.info = []
         self.must_stop = False
-        self.running_lock = Lock()
-        self.running_dots = []
+        self.running_lock = TracedLock('running_lock')
+        # Dots sent to coqtop, oldest first.
+        self.running_dots = deque()
         self.valid_dots = []
-        self.actions = []
+        # State ids given by coqtop to the oldest running dots, whose Add was
+        # answered, in the same order.
+        self.running_states = deque()
+        # Position of the last running dot with each state id, counted from
+        # the first dot ever added, and the position of the oldest one.
+        self.state_positions = {}
+        self.first_state = 0
+        # Dots removed by the last undo.  When it goes back inside a closed
+        # proof, coqtop keeps the states after the proof, and their dots in
+        # tail_dots stay checked, from tail_start, until the proof is closed
+        # again.  joining is set from then until the proof is checked.
+        self.undone = None
+        self.tail_dots = None
+        self.tail_start = None
+        self.joining = None
+        # Set while coqtop is stopped to save memory, until the session is
+        # used again.
+        self.hibernated = False
+        # Number of times coqtop died since the last action of the user.
+        self.recoveries = 0
+        # Number of valid dots there are once the ones replayed by resume are
+        # checked again, until they are.
+        self.replayed = 0
+        # Exit code of coqtop and number of dots to check again while they are
+        # replayed after it died, and when the progress was last shown.
+        self.recovering = None
+        self.reported = 0
+        # Number of lines of the buffer, to move the tail when lines are
+        # added or removed above it.
+        self.lines = 0
+        # Actions asked from nvim, run in order by this thread.
+        self.actions = deque()
+        self.actions_ready = Condition()
+        # Set while an action runs.
+        self.acting = False
         self.redrawing = False
         self.redraw_asked = False
         self.error_shown = False
-        self.debug_msg = ""
-        self.debug_wanted = False
         self.exception = Exception('No information')
         self.hl_error_src = None
         self.hl_error_command_src = None
         self.hl_ok_src = None
         self.hl_progress_src = None
+        # Highlights of the markup of goals and messages.
+        self.hl_goal_src = None
+        self.hl_info_src = None
+        # Panels whose syntax no longer highlights terms, as they have markup.
+        self.markup_bufs = set()
 
     def findCoqProject(self, directory):
         if '_CoqProject' in os.listdir(directory):
@@ -510,12 +705,155 @@ class Actionner(Thread):
             return self.findCoqProject('/'.join(directory.split('/')[:-1]))
         return None
 
-    def restart(self):
+    def restart(self, pool=None):
+        """ Start coqtop, or take a session of pool that already ran the start
+            of the buffer, and put a new session for this project in pool. """
+        level = self.vim.eval("get(g:, 'coquille_log_level', 'off')")
+        self.log.setLevel(level)
+        self.log.setFile(self.vim.eval("get(g:, 'coquille_log_file', '')"))
+        record_file = self.vim.eval("get(g:, 'coquille_record_file', '')")
+        self.ct.setRecordFile(record_file)
+        if self.vim.eval("get(g:, 'coquille_trace_file', '')") != '':
+            TRACER.enable()
         self.buf = self.vim.current.buffer
-        return self.ct.restart()
+        self.sentences = SentenceIndex(self.buf)
+        self.columns = ColumnIndex(self.buf)
+        self.sentcache.preload(self.sentences, self.buf.name)
+        self.lines = len(self.buf)
+        try:
+            self.vim.exec_lua("require('coquille').attach(...)", self.buf.number)
+        except:
+            # Every modification is checked from the start of the buffer.
+            pass
+        options = async_options(int(self.vim.eval("get(g:, 'coquille_async_workers', 0)")) or None,
+                self.vim.eval("get(g:, 'coquille_async_priority', '')"),
+                self.vim.eval("get(g:, 'coquille_async_threshold', '')"))
+        self.ct.setAsyncOptions(options)
+        # Sessions of the pool are not recorded from their start.
+        if pool is None or record_file != '':
+            return self.ct.restart()
+        header = self.header()
+        warm = pool.take(self.parser, self, options)
+        if warm is None:
+            if not self.ct.restart():
+                return False
+        else:
+            (self.ct, prelude) = warm
+            self.ct.events.subscribe(ErrorMessage, self.proofError)
+            self.ct.events.subscribe(Died, self.died)
+            self.valid_dots = adopt(self.ct, prelude, header)
+        pool.fill(self.parser, [dot[2] for (dot, typ) in header if typ != 'comment'], options)
+        return True
+
+    def header(self):
+        """ Return the sentences at the start of the buffer that import
+            libraries or set options, and the comments between them, as
+            (dot, type) pairs. """
+        sentences = []
+        (line, col) = (0, 0)
+        while True:
+            try:
+                (line, col, content, typ) = self.sentences.unit(line, col)
+            except:
+                break
+            if typ != 'comment' and not PRELUDE.match(content):
+                break
+            sentences.append(((line, col, content), typ))
+        return sentences
+
+    def idle(self):
+        """ Whether nothing runs in the session, nor waits to.  It is only a
+            hint outside of the thread of the session. """
+        return not self.acting and self.settled()
+
+    def settled(self):
+        """ Whether no action waits, and coqtop has nothing to run. """
+        return (not self.actions and not self.running_dots and self.joining is None
+                and (self.ct.messenger is None or self.ct.messenger.is_empty()))
+
+    def hibernate(self):
+        """ Stop coqtop if the session is idle, keeping the valid dots to
+            replay them when it is used again. """
+        with self.running_lock:
+            # This action runs, the session hibernates if nothing else does.
+            if self.hibernated or not self.settled():
+                return
+            self.hibernated = True
+            self.tail_dots = None
+            self.undone = None
+        # The threads of coqtop may wait for running_lock until they stop.
+        self.ct.kill()
+
+    def died(self, event):
+        """ coqtop died: start it again before anything else is done. """
+        with self.actions_ready:
+            self.actions.appendleft(('recover', [event.code]))
+            self.actions_ready.notify()
+
+    def recover(self, code):
+        """ Start coqtop again after it died, and replay the valid dots.  The
+            running ones are forgotten, the one that killed coqtop may be
+            among them. """
+        self.recoveries += 1
+        if self.recoveries > self.max_recoveries:
+            raise Exception('coqtop died {} times in a row'.format(self.recoveries))
+        with self.running_lock:
+            # When coqtop died while valid dots were replayed, they are still
+            # valid, and they are the oldest running ones.
+            pending = min(max(self.replayed - len(self.valid_dots), 0), len(self.running_dots))
+            for i in range(pending):
+                self.valid_dots.append(self.running_dots.popleft())
+            self.dropRunning()
+            self.joining = None
+            self.tail_dots = None
+            self.undone = None
+            count = len(self.valid_dots)
+            self.recovering = (code, count)
+            self.reported = time.monotonic()
+        self.printer.flushInfo()
+        self.printer.addInfo('coqtop died (exit code {}), checking the {} valid sentences again'
+                .format(code, count))
+        self.wake()
+
+    def reportProgress(self):
+        """ Show how many dots were checked again since coqtop died, at most
+            once per progress_interval, and when they all are. """
+        with self.running_lock:
+            if self.recovering is None:
+                return
+            (code, count) = self.recovering
+            done = len(self.valid_dots)
+            now = time.monotonic()
+            if done < count and now - self.reported < self.progress_interval:
+                return
+            self.reported = now
+            if done >= count:
+                self.recovering = None
+        self.printer.flushInfo()
+        self.printer.addInfo('coqtop died (exit code {}), {}/{} valid sentences checked again'
+                .format(code, done, count))
+
+    def wake(self):
+        """ Start coqtop again, after hibernate or when it died, and replay
+            the valid dots. """
+        if not self.ct.restart():
+            raise Exception('coqtop could not be started again')
+        self.hibernated = False
+        with self.running_lock:
+            self.resume(self.valid_dots)
+        self.ask_redraw()
+
+    def resume(self, dots):
+        """ Run dots again in a new coqtop process, in a single pass. """
+        self.valid_dots = []
+        self.running_dots = deque(dots)
+        self.replayed = len(dots)
+        replay(self.ct, [msg for (line, col, msg) in dots])
 
     def stop(self):
-        self.must_stop = True
+        with self.actions_ready:
+            self.must_stop = True
+            self.actions_ready.notify()
         self.ct.kill()
         self.printer.stop()
         self.printer.join()
@@ -531,9 +869,11 @@ class Actionner(Thread):
             self.buf.clear_highlight(self.hl_ok_src)
         Thread.join(self)
 
-    def debug(self, msg):
-        if self.debug_wanted:
-            self.debug_msg += msg
+    def debug(self, msg, *args):
+        self.log.debug(msg, *args)
+
+    def error(self, msg, *args):
+        self.log.error(msg, *args)
 
     def version(self, args=[]):
         return self.parser.version()
@@ -545,9 +885,7 @@ class Actionner(Thread):
                     self.parser.getArgs())
 
     def flush_debug(self):
-        m = self.debug_msg
-        self.debug_msg = ""
-        return m
+        return self.log.flush()
 
     def ask_redraw(self):
         quit = False
@@ -564,27 +902,40 @@ class Actionner(Thread):
         if self.error_shown:
             self.error_shown = False
             self.ask_redraw()
-        # It would be too long to check everything, but incorect to simply
-        # revert anything after the current position of the cursor, since it is
-        # the position *after* the modification, not the position of the modification.
-        # We cannot get the position of the modification, so look for the cursor
-        # position and check everything from at most 3 lines above, just to be
-        # sure we don't forget anything.
-        ans = request(self.vim, CursorRequester(self.vim, self.buf))
-        (line, col) = (0,0)
-        predicate = lambda x: x <= (line-3, 0)
-        valid = list(filter(predicate, self.valid_dots))
-        if valid and len(valid) > 0:
-            (line, col, msg) = valid[-1]
-        n = len(valid)
-        for v in self.valid_dots[n:]:
-            (vline, vcol, vmsg) = v
-            cmsg = request(self.vim, BetweenRequester(self, (line, col), (vline, vcol-1)))
-            if cmsg != vmsg:
-                self.undo([len(self.valid_dots) - n])
-                break
-            (line, col) = (vline, vcol)
-            n += 1
+        # Everything before the first changed line is unchanged.  The cursor
+        # says nothing about it: substitutions, undo, other windows and other
+        # plugins change lines far from it.
+        (line, lines) = request(self.vim, ModificationRequester(self.vim, self.buf))
+        if line < 0:
+            return
+        (delta, self.lines) = (lines - self.lines, lines)
+        self.sentences.invalidate(line)
+        self.columns.invalidate(line)
+        with self.running_lock:
+            self.moveTail(line, delta)
+        dots = list(self.valid_dots)
+        n = bisect_right(dots, (line, 0))
+        n = request(self.vim, UnchangedRequester(self, dots, n))
+        if n < len(dots) and self.hibernated:
+            # Only the dots that are kept are replayed when it wakes up.
+            with self.running_lock:
+                del self.valid_dots[n:]
+            self.ask_redraw()
+        elif n < len(dots):
+            self.undo([len(self.valid_dots) - n], delta)
+
+    def moveTail(self, line, delta):
+        """ Follow a modification from line, that added delta lines, in the
+            dots kept after a focused proof: they move if it is above them,
+            and the ones after it are not kept otherwise. """
+        if self.tail_dots is None:
+            return
+        n = bisect_left(self.tail_dots, (line, 0))
+        if n == 0 and delta != 0:
+            self.tail_dots = [(l + delta, c, msg) for (l, c, msg) in self.tail_dots]
+            self.tail_start = (self.tail_start[0] + delta, self.tail_start[1])
+        elif n > 0:
+            del self.tail_dots[n:]
 
     def next(self):
         encoding = 'utf-8'
@@ -593,31 +944,39 @@ class Actionner(Thread):
             step = res['step']
             if step is not None:
                 message = res['message']
-                self.running_dots.insert(0, res['running'])
+                self.running_dots.append(res['running'])
                 self.ct.advance(res['message'], res['type'], encoding)
-                self.ct.goals(True)
+                if res['type'] != 'comment':
+                    self.ct.goals(True)
         self.ask_redraw()
 
-    def undo(self, args = []):
+    def undo(self, args = [], delta = 0):
+        """ Go back args[0] dots, or one.  delta is the number of lines that
+            were added before the removed dots since they were checked. """
         steps = args[0] if len(args) > 0 else  1
 
         should_stop = False
         with self.running_lock:
-            should_stop = self.running_dots != []
+            should_stop = len(self.running_dots) > 0
         if should_stop:
             self.cancel()
 
         if steps < 1 or self.valid_dots == []:
             return
 
-        self.ct.rewind(steps)
         with self.running_lock:
+            self.undone = [(l + delta, c, msg) for (l, c, msg) in self.valid_dots[len(self.valid_dots) - steps:]]
+            self.ct.rewind(steps)
             self.valid_dots = self.valid_dots[:len(self.valid_dots) - steps]
             self.ct.goals()
         if len(args) == 0:
             self.vim.async_call(goto_last_dot, self)
         self.ask_redraw()
 
+    def fastForward(self, args=[]):
+        request(self.vim, FullstepsRequester(self, None, 0, True))
+        self.ask_redraw()
+
     def cursor(self, args=[]):
         encoding = 'utf-8'
 
@@ -628,25 +987,22 @@ class Actionner(Thread):
         cline -= 1
         (line, col, msg)  = self.valid_dots[-1] if self.valid_dots and self.valid_dots != [] else (0,0,"")
         if cline <= line or (cline == line and ccol <= col):
-            predicate = lambda x: x <= (cline, ccol+2)
-            lst = list(filter(predicate, self.valid_dots))
-            steps = len(self.valid_dots) - len(lst)
-            (line, col, msg)  = lst[-1] if lst and lst != [] else (0,0,"")
+            steps = len(self.valid_dots) - bisect_right(self.valid_dots, (cline, ccol+2))
             self.undo([steps])
         else:
-            res = request(self.vim, FullstepsRequester(self, cline, ccol))
+            request(self.vim, FullstepsRequester(self, cline, ccol))
             self.ask_redraw()
 
     def goto_last_dot(self):
         if self.vim.eval("g:coquille_auto_move") == 'true':
             (line, col, msg) = (0,1,"") if self.valid_dots == [] else self.valid_dots[-1]
-            (line, col, msg) = (line,col,"") if self.running_dots == [] else self.running_dots[-1]
+            (line, col, msg) = (line,col,"") if not self.running_dots else self.running_dots[0]
             if self.buf.name == self.vim.current.buffer.name:
-                self.vim.current.window.cursor = (line+1, col)
+                self.vim.current.window.cursor = (line+1, self.columns.byteCol(line, col))
 
     def cancel(self, args=[]):
         with self.running_lock:
-            if self.running_dots != []:
+            if self.running_dots:
                 self.ct.interupt()
         self.ask_redraw()
 
@@ -675,25 +1031,55 @@ class Actionner(Thread):
             self.ct.searchabout(terms)
 
     def add_action(self, typ, args=[]):
-        self.actions.append((typ, args))
+        with self.actions_ready:
+            self.actions.append((typ, args))
+            self.actions_ready.notify()
+
+    def next_action(self):
+        """ Wait for the next action, and return it, or None once the
+            session is stopped. """
+        with self.actions_ready:
+            self.acting = False
+            while not self.actions and not self.must_stop:
+                self.actions_ready.wait()
+            if self.must_stop:
+                return None
+            self.acting = True
+            return self.actions.popleft()
 
     def run(self):
         try:
-            while not self.must_stop:
-                if self.actions == []:
-                    time.sleep(0.01)
+            while True:
+                action = self.next_action()
+                if action is None:
+                    break
+                (typ, args) = action
+                if typ == 'recover':
+                    self.recover(*args)
+                    continue
+                # Changes of the buffer are not actions of the user on the
+                # session, and do not need coqtop while it hibernates.
+                if typ not in ('joined', 'hibernate', 'modified'):
+                    self.recoveries = 0
+                if typ == 'hibernate':
+                    self.hibernate()
                     continue
-                (typ, args) = self.actions[0]
+                if self.hibernated and typ != 'modified':
+                    self.wake()
                 if typ == 'next':
                     self.next()
                 if typ == 'cursor':
                     self.cursor()
+                if typ == 'fastforward':
+                    self.fastForward()
                 if typ == 'undo':
                     self.undo()
                 if typ == 'cancel':
                     self.cancel()
                 if typ == 'modified':
                     self.check_modification()
+                if typ == 'joined':
+                    self.joined(*args)
                 if typ == 'check':
                     self.check(args[0])
                 if typ == 'print':
@@ -706,34 +1092,198 @@ class Actionner(Thread):
                     self.search(args[0])
                 if typ == 'query':
                     self.query(args[0])
-                self.actions = self.actions[1:]
         except BaseException as e:
             self.exception = e
 
     def parseMessage(self, msg, msgtype):
         if isinstance(msg, Ok):
-            if msgtype == "addgoal":
+            if msgtype == "add" and msg.state_id is not None:
                 with self.running_lock:
-                    if self.running_dots != []:
-                        dot = self.running_dots.pop()
-                        self.valid_dots.append(dot)
+                    moved = self.added(msg.state_id)
+                    if msg.tip is not None:
+                        self.closed()
+                if moved:
+                    self.vim.async_call(goto_last_dot, self)
+            if msgtype == "addgoal" or msgtype == "observe":
+                with self.running_lock:
+                    # Goal executes every sentence added before it.
+                    self.validate(len(self.running_states))
+                self.reportProgress()
                 self.vim.async_call(goto_last_dot, self)
+            if msgtype == "undo":
+                with self.running_lock:
+                    self.focused()
+            if msgtype == "cancel":
+                with self.running_lock:
+                    # The sentences added before an interrupt were executed,
+                    # the other ones were dropped.
+                    self.validate(len(self.running_states))
+                    self.dropRunning()
             self.ask_redraw()
-        elif msgtype == "goal":
+        elif msgtype == "goal" or msgtype == "cancel":
             with self.running_lock:
-                self.running_dots = []
+                self.dropRunning()
             self.ask_redraw()
         else:
             if isinstance(msg, Err):
                 with self.running_lock:
                     self.printer.flushInfo()
                     self.printer.addInfo(msg.err)
-                    if self.running_dots != []:
-                        self.vim.async_call(reerror, self, self.running_dots.pop(), msg.loc_s, msg.loc_e)
-                    self.ct.silent_interupt()
-                    self.running_dots = []
+                    # The sentences that were added before a failed Add stay
+                    # running until the Goal that was asked after them.
+                    kept = 0
+                    if msgtype in ('addgoal', 'observe') and msg.state_id is not None:
+                        self.validate(self.executed(msg.state_id.id))
+                    elif msgtype == 'add':
+                        kept = len(self.running_states)
+                    if len(self.running_dots) > kept:
+                        if kept > 0:
+                            prev = self.running_dots[kept - 1]
+                        else:
+                            prev = self.valid_dots[-1] if self.valid_dots != [] else None
+                        self.vim.async_call(reerror, self, self.running_dots[kept],
+                                msg.loc_s, msg.loc_e, prev)
+                    self.dropRunning(kept)
                 self.ask_redraw()
 
+    def added(self, state_id):
+        """ Record that the Add of the oldest running dot that was not added
+            yet created state_id, and return whether dots were validated. """
+        if len(self.running_states) >= len(self.running_dots):
+            return False
+        # Comments are answered with the current state, as nothing is run.
+        comment = state_id == self.ct.state_id
+        self.state_positions[state_id.id] = self.first_state + len(self.running_states)
+        self.running_states.append(state_id.id)
+        if comment and len(self.running_states) == 1:
+            self.validate(1)
+            return True
+        if not comment:
+            self.watchProcessed(state_id.id)
+        return False
+
+    def executed(self, state_id):
+        """ Return the number of running dots that are executed once state_id
+            is: the ones up to the last whose state is state_id. """
+        position = self.state_positions.get(state_id)
+        return 0 if position is None else position - self.first_state + 1
+
+    def validate(self, n):
+        """ Move the n oldest running dots to the valid ones. """
+        for i in range(n):
+            state_id = self.running_states.popleft()
+            if self.state_positions.get(state_id) == self.first_state:
+                del self.state_positions[state_id]
+            self.first_state += 1
+            self.ct.events.forget(state_id)
+            self.valid_dots.append(self.running_dots.popleft())
+        if len(self.valid_dots) >= self.replayed:
+            self.replayed = 0
+        if self.joining is not None and not self.running_dots:
+            self.attach()
+
+    def dropRunning(self, kept=0):
+        """ Forget the running dots, except the kept oldest ones. """
+        if self.joining is not None and len(self.running_dots) > kept:
+            # The proof that was closed again is not checked.
+            self.joining = None
+            self.tail_dots = None
+        if len(self.running_dots) > kept:
+            # The dots that were checked again before a failure stay valid.
+            self.replayed = 0
+            self.recovering = None
+        while len(self.running_dots) > kept:
+            self.running_dots.pop()
+        if len(self.running_states) > kept:
+            while len(self.running_states) > kept:
+                self.ct.events.forget(self.running_states.pop())
+            # A comment has the state of the dot before it.
+            self.state_positions = {state_id: self.first_state + i
+                    for (i, state_id) in enumerate(self.running_states)}
+
+    def focused(self):
+        """ Keep the dots after the proof that coqtop focuses on when the last
+            Edit_at went back inside it. """
+        tail = self.ct.tail
+        if self.joining is not None:
+            pass
+        elif tail is None:
+            self.tail_dots = None
+        elif self.tail_dots is None:
+            # Dots removed by the last undo end with the proof and the dots
+            # after it.  After a failure, nothing is known about them.
+            dots = self.undone or []
+            if len(tail) < len(dots):
+                self.tail_dots = dots[len(dots) - len(tail):]
+                self.tail_start = dots[len(dots) - len(tail) - 1][:2]
+            else:
+                self.tail_dots = []
+        self.undone = None
+
+    def closed(self):
+        """ The last Add closed the focused proof again.  The Adds after it
+            were not sent: the states after the proof follow it instead, and
+            the dots that were sent after it are sent again once the dots
+            after the proof are checked to be unchanged. """
+        beyond = None
+        if len(self.running_dots) > len(self.running_states):
+            beyond = self.running_dots[-1]
+        self.dropRunning(len(self.running_states))
+        self.joining = (len(self.ct.tail or []), beyond)
+        if self.tail_dots is None:
+            self.tail_dots = []
+
+    def attach(self):
+        """ The focused proof was checked, put the dots that were after it
+            back after it. """
+        (count, beyond) = self.joining
+        first = len(self.valid_dots)
+        self.valid_dots += self.tail_dots
+        if count > len(self.tail_dots):
+            # Some of the dots after the proof changed in the meantime.
+            self.ct.rewind(count - len(self.tail_dots))
+        self.tail_dots = None
+        self.joining = None
+        self.add_action('joined', [first, beyond])
+
+    def joined(self, first, beyond):
+        """ Check that the dots put back after a proof from first are still
+            the same in the buffer, and then send the ones up to beyond. """
+        dots = list(self.valid_dots)
+        n = request(self.vim, UnchangedRequester(self, dots, first))
+        if n < len(dots):
+            self.undo([len(self.valid_dots) - n])
+        elif beyond is not None and (dots == [] or beyond[:2] > dots[-1][:2]):
+            request(self.vim, FullstepsRequester(self, beyond[0], beyond[1]))
+        self.ask_redraw()
+
+    def proofError(self, event):
+        """ Show an error that coqtop found in a sentence after it was
+            validated, like the proofs it delegates to workers. """
+        with self.running_lock:
+            if event.state_id in self.state_positions:
+                # The answer of the call that runs it shows the error.
+                return
+            states = self.ct.states + [self.ct.state_id]
+            if StateId(event.state_id) not in states:
+                return
+            i = states.index(StateId(event.state_id)) - 1
+            if i < 0 or i >= len(self.valid_dots):
+                return
+            prev = self.valid_dots[i - 1] if i > 0 else None
+            self.vim.async_call(reerror, self, self.valid_dots[i], event.loc_s, event.loc_e, prev)
+
+    def watchProcessed(self, state_id):
+        """ Validate the running dots up to the one of state_id as soon as
+            coqtop reports that state_id is processed, without waiting for the
+            answer to the following Goal call. """
+        def promote(event):
+            with self.running_lock:
+                self.validate(self.executed(state_id))
+            self.reportProgress()
+            self.ask_redraw()
+        self.ct.events.subscribe(Processed, promote, state_id)
+
     def addInfo(self, info):
         self.printer.addInfo(info)
 
@@ -743,56 +1293,44 @@ class Actionner(Thread):
     def addGoal(self, goals):
         self.printer.addGoal(goals)
 
-    def showError(self, pos, start, end):
+    def showError(self, pos, start, end, prev=None):
         """Show error by highlighting the area. POS is the position of the next dot,
 START is the begining of the actual error, in number of bytes from the
 previous dot. END is the end of the actual error, in number of bytes from
-the previous dot."""
-        encoding = 'utf-8'
-        if self.valid_dots == []:
+the previous dot. PREV is the previous dot, by default the last valid one."""
+        if prev is not None:
+            (line, col, msg) = prev
+        elif self.valid_dots == []:
             (line, col) = (0, 0)
         else:
             (line, col, msg) = self.valid_dots[-1]
-        (eline, ecol, msg) = pos
-        ecol = len(bytes(self.buf[eline][:ecol], encoding))
-        col = len(bytes(self.buf[line][:col], encoding))
+        (sline, scol) = self.columns.locate(line, col, start)
+        (eline, ecol) = self.columns.locate(line, col, end)
+        (cline, ccol, msg) = pos
+        ccol = self.columns.byteCol(cline, ccol)
+        col = self.columns.byteCol(line, col)
         self.error_shown = True
 
         # Show the yellow background
         self.hl_error_command_src = self.vim.new_highlight_source()
-        self.buf.add_highlight("CoqErrorCommand", line, col, ecol if line == eline else -1,
+        self.buf.add_highlight("CoqErrorCommand", line, col, ccol if line == cline else -1,
                 src_id=self.hl_error_command_src)
         if self.hl_progress_src != None:
             self.buf.clear_highlight(self.hl_progress_src)
             self.hl_progress_src = None
-        for i in range(line+1, eline):
+        for i in range(line+1, cline):
             self.buf.add_highlight("CoqErrorCommand", i, 0, -1, src_id=self.hl_error_command_src)
-        if line != eline:
-            self.buf.add_highlight("CoqErrorCommand", eline, 0, ecol, src_id=self.hl_error_command_src)
+        if line != cline:
+            self.buf.add_highlight("CoqErrorCommand", cline, 0, ccol, src_id=self.hl_error_command_src)
 
         # Show the red background
-        self.debug('error: {} :: {}\n'.format(start, end))
+        self.debug('error: %s :: %s\n', start, end)
         self.hl_error_src = self.vim.new_highlight_source()
-        while len(bytes(self.buf[line], encoding)) - col < start:
-            diff = len(bytes(self.buf[line], encoding)) - col + 1
-            line = line+1
-            col = 0
-            start = start - diff
-            end = end - diff
-        ecol = col
-        col = col + start
-        eline = line
-        while len(bytes(self.buf[eline], encoding)) - ecol < end:
-            diff = len(bytes(self.buf[eline], encoding)) - ecol
-            eline = eline+1
-            ecol = 0
-            end = end - diff
-        ecol = ecol + end
-        self.buf.add_highlight("CoqError", line, col, ecol if line == eline else -1,
+        self.buf.add_highlight("CoqError", sline, scol, ecol if sline == eline else -1,
                 src_id=self.hl_error_src)
-        for i in range(line+1, eline):
+        for i in range(sline+1, eline):
             self.buf.add_highlight("CoqError", i, 0, -1, src_id=self.hl_error_src)
-        if line != eline:
+        if sline != eline:
             self.buf.add_highlight("CoqError", eline, 0, ecol, src_id=self.hl_error_src)
 
     def removeInfo(self):
@@ -801,72 +1339,112 @@ the previous dot."""
         buf = self.find_buf(self.info_buf)
         del buf[:]
 
+    @traced('showInfo', 'ui')
     def showInfo(self, info):
         if not hasattr(self, 'info_buf'):
             return
         buf = self.find_buf(self.info_buf)
-        self.debug("Print info: " + str(info) + "\n")
-        if isinstance(info, list):
-            for i in info:
-                self.showOneInfo(buf, i)
-        else:
-            self.showOneInfo(buf, info)
-
-    def showOneInfo(self, buf, info):
+        self.debug("Print info: %s\n", info)
+        # Lines are appended after the ones already shown, all at once.
+        first = len(buf)
+        lines = []
+        hls = []
+        self.showOneInfo(info, first, lines, hls)
+        if lines == []:
+            return
+        buf.append(lines)
+        if hls != []:
+            if self.hl_info_src is None:
+                self.hl_info_src = self.vim.new_highlight_source()
+            buf.update_highlights(self.hl_info_src, hls)
+            self.useMarkup(buf)
+
+    def showOneInfo(self, info, first, lines, hls):
         if info is None:
             return
         if isinstance(info, list):
             for i in info:
-                self.showOneInfo(buf, i)
+                self.showOneInfo(i, first, lines, hls)
             return
         if isinstance(info, RichPP):
-            info = info.parts
-            try:
-                info.remove(None)
-            except:
-                pass
-            info = ''.join(info)
-        lst = map(lambda s: s.encode('utf-8'), info.split('\n'))
-        for l in lst:
-            buf.append(l)
+            hls.extend(highlights(info, first + len(lines)))
+            info = info.text
+        lines.extend(l.encode('utf-8') for l in info.split('\n'))
 
-    def showGoal(self, goals):
+    @traced('showGoal', 'ui')
+    def showGoal(self, goals, everything=False):
         if not hasattr(self, 'goal_buf'):
             return
+        self.goals = goals
         buf = self.find_buf(self.goal_buf)
         blines = []
+        hls = []
         if goals is None:
             blines.append('No goals.')
         else:
             sub_goals = goals.fg
-            nb_unfocused = goals.bg
+            nb_unfocused = len(goals.bg)
             nb_subgoals = len(sub_goals)
 
             plural_opt = '' if nb_subgoals == 1 else 's'
-            blines.append('%d subgoal%s (%d unfocused)' % (nb_subgoals, plural_opt, nb_unfocused))
+            others = ''
+            if goals.shelved != []:
+                others += ', %d shelved' % len(goals.shelved)
+            if goals.given_up != []:
+                others += ', %d given up' % len(goals.given_up)
+            blines.append('%d subgoal%s (%d unfocused%s)' % (nb_subgoals, plural_opt, nb_unfocused, others))
             blines.append('')
 
             for idx, sub_goal in enumerate(sub_goals):
                 _id = sub_goal.id
-                hyps = sub_goal.hyp
-                ccl = sub_goal.ccl
                 if idx == 0:
                     # we print the environment only for the current subgoal
-                    for hyp in hyps:
-                        lst = map(lambda s: s.encode('utf-8'), hyp.split('\n'))
-                        for line in lst:
-                            blines.append(line)
+                    for i in range(len(sub_goal.ends) - 1):
+                        self.addGoalText(sub_goal.rich(i), blines, hls)
                 blines.append('')
                 blines.append('======================== ( %d / %d )' % (idx+1 , nb_subgoals))
-                lines = map(lambda s: s.encode('utf-8'), ccl.split('\n'))
-                for line in lines:
-                    blines.append(line)
+                self.addGoalText(sub_goal.rich(len(sub_goal.ends) - 1), blines, hls)
                 blines.append('')
+            if everything:
+                for (title, others) in [('unfocused', goals.bg), ('shelved', goals.shelved),
+                        ('given up', goals.given_up)]:
+                    for idx, goal in enumerate(others):
+                        blines.append('------------------------ %s ( %d / %d )' % (title, idx+1, len(others)))
+                        self.addGoalText(goal.rich(len(goal.ends) - 1), blines, hls)
+                        blines.append('')
         del buf[:]
         buf.append(blines)
-
+        if self.hl_goal_src is None:
+            self.hl_goal_src = self.vim.new_highlight_source()
+        buf.update_highlights(self.hl_goal_src, hls, clear=True)
+        if hls != []:
+            self.useMarkup(buf)
+
+    def useMarkup(self, buf):
+        """ Load the syntax of the panel buf again without the regexes for the
+            terms, which are highlighted from their markup instead. """
+        if buf.number in self.markup_bufs:
+            return
+        self.markup_bufs.add(buf.number)
+        self.vim.command('call setbufvar({0}, "coquille_richpp", 1) | '
+                'call setbufvar({0}, "&syntax", getbufvar({0}, "&syntax"))'.format(buf.number))
+
+    def addGoalText(self, rich, blines, hls):
+        """ Add the lines of rich to blines, and the highlights of its markup to
+            hls.  The goal buffer keeps an empty first line, so blines start at
+            line 1. """
+        hls.extend(highlights(rich, 1 + len(blines)))
+        for line in rich.text.split('\n'):
+            blines.append(line.encode('utf-8'))
+
+    def showAllGoals(self):
+        """ Show the last goals again, with the unfocused, shelved and given up
+            ones. """
+        if hasattr(self, 'goals'):
+            self.showGoal(self.goals, True)
+
+    @traced('redraw', 'ui')
     def redraw(self, args=[]):
-        encoding = 'utf-8'
         old_hl_ok_src = self.hl_ok_src
         old_hl_progress_src = self.hl_progress_src
         self.hl_ok_src = None
@@ -883,11 +1461,11 @@ the previous dot."""
             (eline, ecol, msg) = self.valid_dots[-1]
         else:
             (eline, ecol) = (0, 0)
-        ecol = len(bytes(self.buf[eline][:ecol], encoding))
+        ecol = self.columns.byteCol(eline, ecol)
 
-        if self.running_dots != []:
-            (line, col, msg) = self.running_dots[0]
-            col = len(bytes(self.buf[line][:col], encoding))
+        if self.running_dots:
+            (line, col, msg) = self.running_dots[-1]
+            col = self.columns.byteCol(line, col)
             self.hl_progress_src = self.vim.new_highlight_source()
             self.buf.add_highlight("SentToCoq", eline, ecol, col if eline == line else -1, src_id=self.hl_progress_src)
             for i in range(eline+1, line):
@@ -901,6 +1479,21 @@ the previous dot."""
                 self.buf.add_highlight("CheckedByCoq", i, 0, -1, src_id=self.hl_ok_src)
             self.buf.add_highlight("CheckedByCoq", eline, 0, ecol, src_id=self.hl_ok_src)
 
+        tail = self.tail_dots
+        if tail:
+            # The dots kept after a proof that is checked again.
+            (line, col) = self.tail_start
+            col = self.columns.byteCol(line, col)
+            (tline, tcol, msg) = tail[-1]
+            tcol = self.columns.byteCol(tline, tcol)
+            if self.hl_ok_src is None:
+                self.hl_ok_src = self.vim.new_highlight_source()
+            self.buf.add_highlight("CheckedByCoq", line, col, tcol if tline == line else -1, src_id=self.hl_ok_src)
+            for i in range(line+1, tline):
+                self.buf.add_highlight("CheckedByCoq", i, 0, -1, src_id=self.hl_ok_src)
+            if tline != line:
+                self.buf.add_highlight("CheckedByCoq", tline, 0, tcol, src_id=self.hl_ok_src)
+
         if old_hl_ok_src:
             self.buf.clear_highlight(old_hl_ok_src)
         if old_hl_progress_src:
@@ -915,13 +1508,12 @@ the previous dot."""
 
     def findNextStep(self):
         (line, col) = (0,0)
-        if self.running_dots != []:
-            (line, col, msg)  = self.running_dots[0] if self.running_dots else (0,0,"")
+        if self.running_dots:
+            (line, col, msg)  = self.running_dots[-1]
         else:
             (line, col, msg)  = self.valid_dots[-1] if self.valid_dots and self.valid_dots != [] else (0,0,"")
-        p = Parser(self.buf)
         try:
-            unit = p.getUnit(line, col)
+            unit = self.sentences.unit(line, col)
         except:
             return None
         return { 'start':(line,col) , 'stop':(unit[0], unit[1]), 'content': unit[2],
@@ -933,17 +1525,19 @@ the previous dot."""
                 return b
         return None
 
-    def _between(self, begin, end):
+    def _unchanged(self, dots, n):
         """
-        Returns a string corresponding to the portion of the buffer between the
-        [begin] and [end] positions.
+        Returns the number of sentences in [dots] that are still the same in the
+        buffer, knowing that the first [n] ones are.
         """
-        (bline, bcol) = begin
-        (eline, ecol) = end
-        acc = ""
-        for line, str in enumerate(self.buf[bline:eline + 1]):
-            start = bcol if line == 0 else 0
-            stop  = ecol + 1 if line == eline - bline else len(str)
-            stopchr = '' if line == eline - bline else '\n'
-            acc += str[start:stop] + stopchr
-        return acc
+        if n >= len(dots):
+            return n
+        (line, col, msg) = dots[-1]
+        self.sentences.find(line, col)
+        while n < len(dots) and n < len(self.sentences):
+            (start, stop, content, typ) = self.sentences.get(n)
+            (line, col, msg) = dots[n]
+            if stop != (line, col) or content != msg:
+                break
+            n += 1
+        return n
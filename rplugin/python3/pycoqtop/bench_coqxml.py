@@ -0,0 +1,125 @@
+"""
+Benchmarks for the handler of coqtop output, on recorded sessions.
+
+Run "python3 -m pycoqtop.bench_coqxml [FILE...]" from rplugin/python3 to print
+a report for each session recorded with g:coquille_record_file, see
+record.py.  Without a file, two sessions are recorded first against
+fake_coqtop.py: one that asks for a large Goal answer, and one with a Search
+query that has many results.  The output of coqtop is fed to the handler in
+the pieces it was read in, like CoqParser does.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from .bench_parser import calibrate
+from .bench_session import FakeSession
+from .coqxml import CoqHandler, new_parser
+from .record import READ, records
+
+def goal_session(session):
+    """ A proof with many goals, and the Goal call after it. """
+    session.step('Lemma big : True.')
+    session.printer.wait(1, 'addgoal', timeout=600)
+
+def search_session(session):
+    """ A Search query, with many results. """
+    session.ct.search('_ + _ = _ + _')
+    session.printer.wait(1, 'query', timeout=600)
+
+# Sessions recorded when no file is given, and the configuration of the fake
+# coqtop for them.
+SESSIONS = {
+    'goal': (goal_session, {'goals': 200, 'bg': 500, 'hyps': 30}),
+    'search': (search_session, {'query_results': 5000}),
+}
+
+def record_session(filename, play, **config):
+    """ Record the session that play runs against the fake coqtop. """
+    session = FakeSession(**config)
+    session.ct.setRecordFile(filename)
+    session.start()
+    try:
+        play(session)
+    finally:
+        session.close()
+
+class NullManager:
+    def pull_event(self, event):
+        pass
+
+    def feedback(self, event):
+        pass
+
+    def died(self, process):
+        pass
+
+class NullPrinter:
+    def debug(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
+        pass
+
+    def addInfo(self, info):
+        pass
+
+    def flushInfo(self):
+        pass
+
+    def addGoal(self, goal):
+        pass
+
+def reads(filename):
+    """ The bytes read from coqtop in a recording, in the pieces they were
+        read in. """
+    return [data for (kind, t, data) in records(filename) if kind == READ]
+
+def feed(chunks):
+    """ Feed chunks to a new handler. """
+    handler = CoqHandler(NullManager(), NullPrinter())
+    parser = new_parser(handler)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return handler
+
+def measure(chunks, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        feed(chunks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(filenames=[]):
+    """ Return a report for each recording in filenames, by their name, or for
+        each of SESSIONS if there is none. """
+    unit = calibrate()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        recordings = {os.path.basename(f): f for f in filenames}
+        if recordings == {}:
+            for (name, (play, config)) in SESSIONS.items():
+                recordings[name] = os.path.join(directory, name + '.rec')
+                record_session(recordings[name], play, **config)
+        for (name, filename) in recordings.items():
+            chunks = reads(filename)
+            size = sum(len(chunk) for chunk in chunks)
+            elapsed = measure(chunks)
+            results[name] = {
+                'bytes': size,
+                'time': elapsed,
+                'bytes_per_s': size / elapsed if elapsed > 0 else 0,
+                'score': elapsed / unit,
+            }
+    return results
+
+def print_report(results):
+    for (name, report) in sorted(results.items()):
+        print('{}: {} bytes in {:.3f}s, {:.1f} MB/s, score {:.2f}'.format(name,
+            report['bytes'], report['time'], report['bytes_per_s'] / 1e6, report['score']))
+
+if __name__ == '__main__':
+    print_report(run(sys.argv[1:]))
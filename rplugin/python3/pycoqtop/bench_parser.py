@@ -0,0 +1,187 @@
+"""
+Benchmarks for the sentence parser.
+
+Run "python3 -m pycoqtop.bench_parser" from rplugin/python3 to print a
+report, or "python3 -m pycoqtop.bench_parser --save" to record the current
+timings as the baseline that test_bench_parser.py compares against.
+
+Timings are divided by the time of a fixed amount of pure python work, so
+that the baseline can be compared between machines of different speeds.
+"""
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from .parser import Parser
+from .sentences import SentenceIndex
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'test_data', 'parser_bench.json')
+
+def nested_comments(count=2000, depth=20):
+    """ Comments nested depth times, each one followed by a command. """
+    lines = []
+    for i in range(count):
+        lines.append('(* ' * depth + 'comment {} '.format(i) + '*) ' * depth)
+        lines.append('Check {}.'.format(i))
+    return lines
+
+def long_strings(count=5000, length=2000):
+    """ Commands with long strings that contain dots and comment openers. """
+    text = ('a. b (* c ' * length)[:length]
+    return ['Definition s{} := "{}".'.format(i, text) for i in range(count)]
+
+def bullets(count=5000):
+    """ A single proof with thousands of bullets and goal selectors. """
+    lines = ['Goal True.', 'Proof.']
+    for i in range(count):
+        lines.append('- auto.')
+        lines.append('  + auto.')
+        lines.append('    * auto.')
+        lines.append('  {} : {{ auto. }}'.format(i % 9 + 1))
+        lines.append('  [goal{}] : {{ auto. }}'.format(i))
+    lines.append('Qed.')
+    return lines
+
+BLOCK = [
+    '(** * Lemma {0}: about (* nested *) lists *)',
+    'Lemma app_length_{0} : forall (A : Type) (l l\' : list A),',
+    '  length (l ++ l\') = length l + length l\'.',
+    'Proof.',
+    '  intros A l l\'. induction l as [| x l IH]; simpl.',
+    '  - reflexivity.',
+    '  - rewrite IH. reflexivity.',
+    'Qed.',
+    '',
+    'Notation "x ⊕{0} y" := (x + y) (at level 50).',
+    'Ltac crush{0} := repeat (intros; simpl; auto with *); idtac "done... {0}".',
+    'Theorem plus_comm_{0} : forall n m : nat, n ⊕{0} m = m ⊕{0} n.',
+    'Proof.',
+    '  intros n m. unfold "⊕{0}". induction n.',
+    '  { simpl. auto. }',
+    '  2: { simpl. rewrite IHn. auto. }',
+    'Qed.',
+    '',
+]
+
+def large_file(lines=50000):
+    """ A realistic development of the given number of lines. """
+    result = []
+    i = 0
+    while len(result) < lines:
+        result += [l.replace("{0}", str(i)) for l in BLOCK]
+        i += 1
+    return result[:lines]
+
+CORPORA = {
+    'nested_comments': nested_comments,
+    'long_strings': long_strings,
+    'bullets': bullets,
+    'large_file': large_file,
+}
+
+def calibrate(repeat=5):
+    """ Return the time of a fixed amount of pure python work, similar to what
+        the parser does. """
+    regexp = re.compile(r'\(\*|"|\.(?=[ \t\n]|$)')
+    lines = ['  rewrite IH. (* ok *) reflexivity.'] * 20000
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = 0
+        for line in lines:
+            col = 0
+            m = regexp.search(line, col)
+            while m is not None:
+                n += len(line[col:m.end()])
+                col = m.end()
+                m = regexp.search(line, col)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measure(lines, repeat=3):
+    """ Parse lines and return a report of the time and memory it takes. """
+    best = None
+    for _ in range(repeat):
+        types = {}
+        start = time.perf_counter()
+        last = start
+        for (_, _, content, typ) in Parser(lines).units():
+            now = time.perf_counter()
+            (count, elapsed, size) = types.get(typ, (0, 0.0, 0))
+            types[typ] = (count + 1, elapsed + now - last, size + len(content))
+            last = now
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, types)
+    (elapsed, types) = best
+    sentences = sum(count for (count, _, _) in types.values())
+
+    tracemalloc.start()
+    for _ in Parser(lines).units():
+        pass
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    index = SentenceIndex(lines)
+    index.find(len(lines), 0)
+    (retained, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'sentences': sentences,
+        'time': elapsed,
+        'types': {typ: {
+                'sentences': count,
+                'sentences_per_s': count / elapsed if elapsed > 0 else 0,
+                'chars_per_s': size / elapsed if elapsed > 0 else 0,
+            } for (typ, (count, elapsed, size)) in types.items()},
+        'peak_bytes_per_sentence': peak / max(sentences, 1),
+        'index_bytes_per_sentence': retained / max(sentences, 1),
+    }
+
+def run(corpora=CORPORA):
+    """ Measure every corpus.  The score of a corpus is its parsing time
+        divided by the calibration time. """
+    unit = calibrate()
+    results = {}
+    for (name, make) in corpora.items():
+        report = measure(make())
+        report['score'] = report['time'] / unit
+        results[name] = report
+    return results
+
+def load_baseline(filename=BASELINE):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(results, filename=BASELINE):
+    with open(filename, 'w') as f:
+        json.dump({name: round(report['score'], 3) for (name, report) in results.items()},
+                f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def print_report(results, baseline={}):
+    for (name, report) in sorted(results.items()):
+        ref = baseline.get(name)
+        print('{}: {} sentences in {:.3f}s, score {:.2f}{}'.format(name,
+            report['sentences'], report['time'], report['score'],
+            '' if ref is None else ' (baseline {:.2f})'.format(ref)))
+        for (typ, stats) in sorted(report['types'].items()):
+            print('    {:8} {:8} sentences {:12.0f} sentences/s {:14.0f} chars/s'.format(
+                typ, stats['sentences'], stats['sentences_per_s'], stats['chars_per_s']))
+        print('    memory: {:.0f} bytes/sentence while parsing, {:.0f} bytes/sentence in the index'.format(
+            report['peak_bytes_per_sentence'], report['index_bytes_per_sentence']))
+
+if __name__ == '__main__':
+    results = run()
+    print_report(results, load_baseline())
+    if '--save' in sys.argv[1:]:
+        save_baseline(results)
@@ -0,0 +1,128 @@
+"""
+Benchmark of the handling of a recorded session, see record.py.
+
+Run "python3 -m pycoqtop.bench_replay FILE [SPEED]" from rplugin/python3 to
+replay a recording as fast as possible, or SPEED times faster than it was
+recorded, and print a report.  The answers go through the callbacks of an
+Actionner, its Printer and its redraws, on a fake nvim whose buffer gets the
+recorded sentences, so replaying as fast as possible measures the time
+coquille itself spends on the answers of coqtop, until they are shown.
+"""
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from . import Actionner
+from .bench_session import FakeSession
+from .fake_nvim import FakeVim
+from .record import ReplayState, Replayer
+
+class CountingPrinter:
+    """ Printer that counts what it is given, and passes it on to the
+        Actionner. """
+    def __init__(self, actionner):
+        self.actionner = actionner
+        self.answers = 0
+        self.info = 0
+        self.goals = 0
+
+    def debug(self, msg, *args):
+        self.actionner.debug(msg, *args)
+
+    def error(self, msg, *args):
+        self.actionner.error(msg, *args)
+
+    def parseMessage(self, msg, msgtype):
+        self.answers += 1
+        self.actionner.parseMessage(msg, msgtype)
+
+    def addInfo(self, info):
+        self.info += 1
+        self.actionner.addInfo(info)
+
+    def flushInfo(self):
+        self.actionner.flushInfo()
+
+    def addGoal(self, goal):
+        self.goals += 1
+        self.actionner.addGoal(goal)
+
+class SessionState(ReplayState):
+    """ State manager of a replay that is the CoqTop of actionner: the
+        sentences of the recorded Add calls are appended to its buffer and
+        run, like its next action does. """
+    def __init__(self, printer, actionner):
+        ReplayState.__init__(self, printer)
+        self.actionner = actionner
+
+    def expect(self, calltype, data):
+        ReplayState.expect(self, calltype, data)
+        if calltype != 'add':
+            return
+        sentence = ET.fromstring(data).find('.//string').text or ''
+        lines = sentence.split('\n')
+        a = self.actionner
+        with a.running_lock:
+            if a.buf[:] == ['']:
+                a.buf[:] = lines
+            else:
+                a.buf.append(lines)
+            a.running_dots.append((len(a.buf) - 1, len(lines[-1]), sentence))
+
+def drain(actionner):
+    """ Wait until the answers given to actionner are shown. """
+    printer = actionner.printer
+    while True:
+        with printer.lock:
+            if not (printer.goal_modified or printer.info_modified):
+                break
+        time.sleep(0.001)
+    actionner.vim.sync()
+
+def replay(filename, speed=None):
+    # The session only provides a project, for the Actionner to find the
+    # version of coqtop.  Nothing is sent to coqtop.
+    session = FakeSession()
+    try:
+        vim = FakeVim([''], os.path.join(session.directory, 'a.v'))
+        actionner = Actionner(vim)
+        actionner.goal_buf = 2
+        actionner.info_buf = 3
+        printer = CountingPrinter(actionner)
+        replayer = Replayer(filename, printer, speed, SessionState(printer, actionner))
+        actionner.ct = replayer.state
+        try:
+            start = time.perf_counter()
+            replayer.run()
+            drain(actionner)
+            elapsed = time.perf_counter() - start
+        finally:
+            actionner.printer.stop()
+            actionner.printer.join()
+        return {
+            'recorded': replayer.duration,
+            'replayed': elapsed,
+            'calls': replayer.calls,
+            'answers': printer.answers,
+            'messages': replayer.handler.messages,
+            'bytes': replayer.bytes,
+            'valid': len(actionner.valid_dots),
+            'errors': vim.errors,
+        }
+    finally:
+        session.close()
+
+def print_report(results):
+    print('{} calls, {} answers, {} messages, {} bytes, {} sentences checked'.format(
+        results['calls'], results['answers'], results['messages'], results['bytes'],
+        results['valid']))
+    print('recorded in {:.3f}s, replayed in {:.3f}s'.format(results['recorded'],
+        results['replayed']))
+    if results['answers'] > 0:
+        print('{:.3f}ms per answer'.format(results['replayed'] * 1000 / results['answers']))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python3 -m pycoqtop.bench_replay FILE [SPEED]')
+    print_report(replay(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else None))
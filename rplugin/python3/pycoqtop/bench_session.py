@@ -0,0 +1,279 @@
+"""
+Benchmarks for a whole session with coqtop, run against fake_coqtop.py so that
+Coq does not need to be installed.
+
+Run "python3 -m pycoqtop.bench_session" from rplugin/python3 to print a
+report of the latency of a single step, the throughput of queued steps (with
+a Goal call after each one, or a single one after all of them), the latency
+of an interrupt, the memory kept by a session for each step and the time to
+launch a session whose file starts with imports, with and without the pool,
+and the time to wake a hibernated session up, or to recover from a crash.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from threading import Condition, Event
+
+from .coqtop import new_coqtop
+from .events import Died
+from .journal import replay
+from .pool import SessionPool, adopt, key
+from .projectparser import ProjectParser
+
+FAKE_COQTOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_coqtop.py')
+
+class RecordingPrinter:
+    """ Printer that records the answers of coqtop, and lets the benchmark wait
+        for them. """
+    def __init__(self):
+        self.cond = Condition()
+        self.answers = []
+        self.info = []
+        self.goals = []
+
+    def debug(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
+        pass
+
+    def parseMessage(self, msg, msgtype):
+        with self.cond:
+            self.answers.append((msg, msgtype))
+            self.cond.notify_all()
+
+    def addInfo(self, info):
+        self.info.append(info)
+
+    def flushInfo(self):
+        pass
+
+    def addGoal(self, goal):
+        self.goals.append(goal)
+
+    def wait(self, count, msgtype=None, timeout=30):
+        """ Wait until count answers of type msgtype (or of any type) were
+            received in total, and return them. """
+        def matching():
+            return [a for a in self.answers if msgtype is None or a[1] == msgtype]
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(matching()) >= count, timeout):
+                raise TimeoutError('{} answers of type {} expected, got {}'.format(
+                    count, msgtype, len(matching())))
+            return matching()
+
+class FakeSession:
+    """
+    A CoqTop session with fake_coqtop.py as coqtop.  The fake is found through
+    COQBIN in a _CoqProject written to a temporary directory, and configured
+    with the keys of fake_coqtop.DEFAULTS.
+    """
+    def __init__(self, **config):
+        self.directory = tempfile.mkdtemp(prefix='coquille-fake-')
+        for name in ['coqtop', 'coqidetop']:
+            path = os.path.join(self.directory, name)
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_COQTOP))
+            os.chmod(path, 0o755)
+        project = os.path.join(self.directory, '_CoqProject')
+        with open(project, 'w') as f:
+            f.write('COQBIN = {}\n'.format(self.directory))
+        self.environ = os.environ.get('FAKE_COQTOP')
+        os.environ['FAKE_COQTOP'] = json.dumps(config)
+        self.printer = RecordingPrinter()
+        self.parser = ProjectParser(project)
+        self.ct = new_coqtop(self.printer, self.parser)
+
+    def start(self):
+        assert self.ct.restart()
+        self.printer.wait(1, 'init')
+        return self
+
+    def step(self, sentence):
+        """ Send a sentence and the Goal call that follows it, like CoqNext. """
+        self.ct.advance(sentence, 'command')
+        self.ct.goals(True)
+
+    def close(self):
+        self.ct.kill()
+        if self.environ is None:
+            del os.environ['FAKE_COQTOP']
+        else:
+            os.environ['FAKE_COQTOP'] = self.environ
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def script(steps):
+    """ A development of the given number of sentences. """
+    sentences = []
+    while len(sentences) < steps:
+        i = len(sentences)
+        sentences += ['Lemma l{} : True.'.format(i), 'Proof.', 'auto.', 'Qed.']
+    return sentences[:steps]
+
+def step_latency(steps=200, **config):
+    """ Return the mean and worst time between sending a sentence and
+        receiving the answer to its Goal call. """
+    session = FakeSession(**config).start()
+    try:
+        times = []
+        for (i, sentence) in enumerate(script(steps)):
+            start = time.perf_counter()
+            session.step(sentence)
+            session.printer.wait(i + 1, 'addgoal')
+            times.append(time.perf_counter() - start)
+        return (sum(times) / len(times), max(times))
+    finally:
+        session.close()
+
+def queued_throughput(steps=2000, **config):
+    """ Queue many sentences at once, and return the number of steps per second
+        and the memory kept by the session for each step. """
+    session = FakeSession(**config).start()
+    try:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for sentence in script(steps):
+            session.step(sentence)
+        session.printer.wait(steps, 'addgoal', timeout=600)
+        elapsed = time.perf_counter() - start
+        del session.printer.answers[:]
+        del session.printer.goals[:]
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return (steps / elapsed, retained / steps)
+    finally:
+        session.close()
+
+def bulk_throughput(steps=2000, observe=False, **config):
+    """ Queue many sentences at once with a single Goal call after them, like
+        CoqToCursor, or a single Observe, like CoqFastForward, and return the
+        number of steps per second. """
+    session = FakeSession(**config).start()
+    try:
+        start = time.perf_counter()
+        for sentence in script(steps):
+            session.ct.advance(sentence, 'command')
+        if observe:
+            session.ct.observe(True)
+            session.printer.wait(1, 'observe', timeout=600)
+        else:
+            session.ct.goals(True, True)
+            session.printer.wait(1, 'addgoal', timeout=600)
+        return steps / (time.perf_counter() - start)
+    finally:
+        session.close()
+
+def launch_latency(warm=False, imports=20, **config):
+    """ Return the time it takes to start a session and execute the imports at
+        the start of a file, or to take a session that already did from a
+        pool. """
+    session = FakeSession(**config)
+    prelude = ['Require Import M{}.'.format(i) for i in range(imports)]
+    pool = SessionPool()
+    try:
+        if warm:
+            pool.fill(session.parser, prelude)
+            pool.sessions[key(session.parser)][0].printer.ready.wait(600)
+        start = time.perf_counter()
+        if warm:
+            (session.ct, _) = pool.take(session.parser, session.printer)
+            adopt(session.ct, prelude, [((i, 0, s), 'command') for (i, s) in enumerate(prelude)])
+            session.ct.goals()
+            session.printer.wait(1, 'goal', timeout=600)
+        else:
+            session.start()
+            for sentence in prelude:
+                session.ct.advance(sentence, 'command')
+            session.ct.goals(True, True)
+            session.printer.wait(1, 'addgoal', timeout=600)
+        return time.perf_counter() - start
+    finally:
+        pool.close()
+        session.close()
+
+def wake_latency(steps=200, crash=False, **config):
+    """ Return the time it takes to start coqtop again and replay the
+        sentences that a session had executed before it hibernated, or from
+        the moment coqtop crashed. """
+    session = FakeSession(crash_on=['crash'], **config).start()
+    died = Event()
+    session.ct.events.subscribe(Died, lambda event: died.set())
+    try:
+        sentences = script(steps)
+        for sentence in sentences:
+            session.ct.advance(sentence, 'command')
+        session.ct.goals(True, True)
+        session.printer.wait(1, 'addgoal', timeout=600)
+        if crash:
+            session.ct.advance('crash.', 'command')
+            died.wait(600)
+        else:
+            session.ct.kill()
+        start = time.perf_counter()
+        session.ct.restart()
+        replay(session.ct, sentences)
+        session.printer.wait(1, 'goal', timeout=600)
+        return time.perf_counter() - start
+    finally:
+        session.close()
+
+def interrupt_latency(**config):
+    """ Return the time between asking for an interrupt while a sentence is
+        being executed, and receiving the answer of coqtop. """
+    session = FakeSession(slow_on=['slow'], slow_latency=30, **config).start()
+    try:
+        session.step('Lemma slow : True.')
+        session.printer.wait(1, 'add')
+        while not session.ct.messenger.waiting or session.ct.calltype != 'addgoal':
+            time.sleep(0.001)
+        # Leave time for the Goal call to reach the fake coqtop
+        time.sleep(0.05)
+        start = time.perf_counter()
+        session.ct.interupt()
+        session.printer.wait(1, 'addgoal')
+        return time.perf_counter() - start
+    finally:
+        session.close()
+
+def run():
+    (mean, worst) = step_latency()
+    (rate, memory) = queued_throughput()
+    return {
+        'step_latency': mean,
+        'worst_step_latency': worst,
+        'queued_steps_per_s': rate,
+        'bytes_per_step': memory,
+        'bulk_steps_per_s': bulk_throughput(),
+        # Sentences that take time to execute, three quarters of them in
+        # proofs that Observe lets coqtop delegate.
+        'slow_bulk_steps_per_s': bulk_throughput(400, exec_latency=0.002),
+        'slow_observe_steps_per_s': bulk_throughput(400, True, exec_latency=0.002),
+        'interrupt_latency': interrupt_latency(),
+        # Imports that take 20ms each to load.
+        'launch_latency': launch_latency(exec_latency=0.02),
+        'warm_launch_latency': launch_latency(True, exec_latency=0.02),
+        'wake_latency': wake_latency(exec_latency=0.002),
+        'recovery_latency': wake_latency(crash=True, exec_latency=0.002),
+    }
+
+def print_report(results):
+    print('step latency: {:.2f}ms (worst {:.2f}ms)'.format(
+        results['step_latency'] * 1000, results['worst_step_latency'] * 1000))
+    print('queued steps: {:.0f} steps/s, {:.0f} bytes kept per step'.format(
+        results['queued_steps_per_s'], results['bytes_per_step']))
+    print('bulk steps: {:.0f} steps/s'.format(results['bulk_steps_per_s']))
+    print('bulk steps taking 2ms each: {:.0f} steps/s with Goal, {:.0f} steps/s with Observe'.format(
+        results['slow_bulk_steps_per_s'], results['slow_observe_steps_per_s']))
+    print('interrupt latency: {:.2f}ms'.format(results['interrupt_latency'] * 1000))
+    print('launch with 20 imports taking 20ms each: {:.2f}ms, {:.2f}ms from the pool'.format(
+        results['launch_latency'] * 1000, results['warm_launch_latency'] * 1000))
+    print('wake with 200 sentences taking 2ms each: {:.2f}ms, {:.2f}ms after a crash'.format(
+        results['wake_latency'] * 1000, results['recovery_latency'] * 1000))
+
+if __name__ == '__main__':
+    print_report(run())
@@ -0,0 +1,92 @@
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from threading import Lock
+
+class ColumnIndex:
+    """
+    Conversions between the character columns used by python strings and the
+    byte columns used by neovim and coqtop.  Lines are fetched from the buffer
+    once, and the byte offset of each character is only computed for lines that
+    are not pure ASCII.  The index also keeps the byte offset of the beginning
+    of each line, so that an offset from any position can be turned into a
+    position with a bisection.  Lines are forgotten from the first modified one.
+    """
+    # Number of lines fetched at once from the buffer.
+    chunk = 256
+
+    def __init__(self, buf, encoding='utf-8'):
+        self.buf = buf
+        self.encoding = encoding
+        self.lock = Lock()
+        # For each line, None if it is pure ASCII, or the byte offset of each
+        # of its characters, and of its end.
+        self.offsets = []
+        # Byte offset of the beginning of each line, counting one byte for each
+        # end of line, and of the end of the last fetched line.
+        self.starts = array('q', [0])
+
+    def invalidate(self, line):
+        """ Forget every line after line, included. """
+        with self.lock:
+            if line < len(self.offsets):
+                del self.offsets[line:]
+                del self.starts[line + 1:]
+
+    def fetch(self, line):
+        """ Make sure the index covers line. """
+        n = len(self.offsets)
+        if line < n:
+            return
+        lines = self.buf[n:line + self.chunk]
+        if line >= n + len(lines):
+            raise IndexError('line {} is not in the buffer'.format(line))
+        for text in lines:
+            if text.isascii():
+                self.offsets.append(None)
+                size = len(text)
+            else:
+                offsets = array('q', [0])
+                offsets.extend(accumulate(len(c.encode(self.encoding)) for c in text))
+                self.offsets.append(offsets)
+                size = offsets[-1]
+            self.starts.append(self.starts[-1] + size + 1)
+
+    def byteLen(self, line):
+        """ Return the number of bytes of line. """
+        with self.lock:
+            self.fetch(line)
+            return self.starts[line + 1] - self.starts[line] - 1
+
+    def byteCol(self, line, col):
+        """ Return the byte column of the character at col in line. """
+        with self.lock:
+            self.fetch(line)
+            offsets = self.offsets[line]
+            if offsets is None:
+                return min(col, self.starts[line + 1] - self.starts[line] - 1)
+            return offsets[min(col, len(offsets) - 1)]
+
+    def charCol(self, line, bcol):
+        """ Return the column of the character at byte column bcol in line. """
+        with self.lock:
+            self.fetch(line)
+            offsets = self.offsets[line]
+            if offsets is None:
+                return min(bcol, self.starts[line + 1] - self.starts[line] - 1)
+            return bisect_right(offsets, bcol) - 1
+
+    def locate(self, line, col, offset):
+        """ Return the line and byte column that are offset bytes after the
+            character at col in line.  An offset that falls on an end of line
+            stays at the end of that line. """
+        bcol = self.byteCol(line, col)
+        with self.lock:
+            pos = self.starts[line] + bcol + offset
+            while self.starts[-1] <= pos:
+                try:
+                    self.fetch(len(self.offsets))
+                except IndexError:
+                    break
+            line = min(bisect_right(self.starts, pos) - 1, len(self.offsets) - 1)
+            return (line, min(pos - self.starts[line], self.starts[line + 1] - self.starts[line] - 1))
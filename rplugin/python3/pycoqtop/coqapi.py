@@ -1,5 +1,6 @@
 import xml.etree.ElementTree as ET
 from .xmltype import *
+from . import richpp
 
 def build(tag, val=None, children=[]):
     attribs = {'val': val} if val is not None else {}
@@ -98,45 +99,74 @@ def parse_value(xml):
     elif xml.tag == 'evar':
         return Evar(*map(parse_value, xml))
     elif xml.tag == 'xml' or xml.tag == 'richpp':
-        parts = []
-        child = 0
-        try:
-            c = list(xml)[child]
-        except:
-            c = None
-        for p in xml.itertext():
-            if c is None:
-                parts.append(p)
-                continue
-            if c.text == p:
-                parts.append(parse_value(c))
-                child = child + 1
-                try:
-                    c = list(xml)[child]
-                except:
-                    c = None
-            parts.append(p)
-        return RichPP(parts)
+        return richpp.decode(xml)
     elif xml.tag == 'message':
         for c in list(xml):
             if c.tag == 'richpp':
                 return [parse_value(c)]
 
-class Ok:
-    def __init__(self, state_id):
-        if not state_id is None:
-            if isinstance(state_id, StateId):
-                self.state_id = state_id
+def text(s):
+    """ Encode s as the text of an element, like ElementTree does. """
+    s = s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return s.encode('utf-8', 'xmlcharrefreplace')
+
+def state_id(s):
+    """ Encode a state id, or an int, as the value of an attribute. """
+    return str(s.id if isinstance(s, StateId) else s).encode('utf-8')
+
+class Template:
+    """
+    The bytes of a call to coqtop, computed once by encoding a sample call
+    whose arguments are markers, and split around them.  A call is then
+    rendered by joining the parts with its encoded arguments, without building
+    an ElementTree.  shape builds the argument of the call from the markers, and
+    kinds are the functions that encode each argument.
+    """
+    def __init__(self, name, shape, kinds=[]):
+        markers = ['coquillehole{}x'.format(i) for i in range(len(kinds))]
+        data = API().get_call_msg(name, shape(*markers))
+        self.parts = []
+        for marker in markers:
+            (before, data) = data.split(marker.encode('utf-8'), 1)
+            self.parts.append(before)
+        self.parts.append(data)
+        self.kinds = kinds
+
+    def render(self, *args):
+        out = [self.parts[0]]
+        for (arg, kind, part) in zip(args, self.kinds, self.parts[1:]):
+            if arg == '':
+                # An element without text is written as <tag />
+                out[-1] = out[-1][:-1] + b' />'
+                part = part[part.index(b'>') + 1:]
             else:
-                self.state_id = StateId(int(state_id))
-        else:
-            self.state_id = None
+                out.append(kind(arg))
+            out.append(part)
+        return b''.join(out)
+
+def to_state_id(s):
+    if s is None or isinstance(s, StateId):
+        return s
+    return StateId(int(s))
+
+class Ok:
+    """ A success.  The answer to an Add that ends the proof focused by
+        Edit_at has the state where the document goes on as tip.  The answer
+        to an Edit_at inside a closed proof has focus, the (start, stop, tip)
+        states of the proof and of the end of the document. """
+    def __init__(self, state_id, tip=None, focus=None):
+        self.state_id = to_state_id(state_id)
+        self.tip = to_state_id(tip)
+        self.focus = None if focus is None else tuple(to_state_id(s) for s in focus)
 
 class Err:
-    def __init__(self, error, loc_s, loc_e):
+    """ A failure.  state_id is the last valid state given by coqtop, if
+        any. """
+    def __init__(self, error, loc_s, loc_e, state_id=None):
         self.err = error
         self.loc_s = loc_s
         self.loc_e = loc_e
+        self.state_id = to_state_id(state_id)
 
 class API:
     def __init__(self):
@@ -185,9 +215,24 @@ class API:
         assert (valueNode != None), "Unexpected answer from coqtop: {}".format(ET.tostring(xml))
         if valueNode.get('val') == 'good':
             p = parse_value(valueNode[0])
-            if isinstance(p[0], StateId):
+            if isinstance(p, Inr) and isinstance(p.val, tuple):
+                # Edit_at: Inr (start, (stop, tip))
+                (start, (stop, tip)) = p.val
+                return Ok(None, focus=(start, stop, tip))
+            if isinstance(p, tuple) and len(p) > 0 and isinstance(p[0], StateId):
+                # Add: (state_id, (Inl () or Inr tip, message))
+                if isinstance(p[1], tuple) and isinstance(p[1][0], Inr):
+                    return Ok(p[0], tip=p[1][0].val)
                 return Ok(p[0])
             return Ok(None)
         if valueNode.get('val') == 'fail':
             return Err(messageNodes, valueNode.get('loc_s'), valueNode.get('loc_e'))
         assert False, "Unexpected answer from coqtop: {}".format(ET.tostring(xml))
+
+INIT = Template('Init', lambda: Option(None))
+GOAL = Template('Goal', lambda: ())
+ADD = Template('Add', lambda instr, sid: ((instr, -1), (StateId(sid), True)), [text, state_id])
+QUERY = Template('Query', lambda instr, sid: (RouteId(0), (instr, StateId(sid))), [text, state_id])
+QUERY86 = Template('Query', lambda instr, sid: (instr, StateId(sid)), [text, state_id])
+EDIT_AT = Template('Edit_at', lambda sid: StateId(sid), [state_id])
+OBSERVE = Template('Observe', lambda sid: StateId(sid), [state_id])
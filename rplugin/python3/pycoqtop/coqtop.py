@@ -1,156 +1,424 @@
 import os
 import subprocess
-import xml.etree.ElementTree as ET
 import signal
-import time
+from collections import deque
 from threading import Thread, Lock, Event
 
-from .coqapi import API, Ok, Err
+from .coqapi import Ok, Err, INIT, GOAL, ADD, QUERY, QUERY86, EDIT_AT, OBSERVE
 from .coqxml import CoqParser
+from .events import Died, EventBus, ProcessingIn
+from .record import Recorder
+from .trace import TRACER, TracedLock
+from .workers import Workers, async_options, worker_count
 from .xmltype import *
 
 
 class Messenger(Thread):
+    """
+    Sender of the calls to coqtop.  Calls are queued, and sent in order while
+    fewer than depth of them wait for their answer, so that coqtop finds the
+    next call as soon as it is done with one.  coqtop answers calls in the
+    order it reads them, so answers are matched with the calls in flight in
+    that order.
+
+    An Add is sent on top of the state that the Add before it will create.
+    coqtop gives each new state the next fresh id, so that state is predicted
+    from the last id seen.  Until an answer confirms the prediction (after a
+    restart or a cut-off), only one Add is in flight.  When a call fails or an
+    Add does not get the predicted id, the calls in flight after it are cut
+    off: their answers are dropped, and so is the queue after a failure.
+    After a misprediction, the dropped calls are sent again.
+    """
+    # Maximum number of calls waiting for their answer.
+    depth = 32
+
     def __init__(self, coqtop):
-        Thread.__init__(self)
+        Thread.__init__(self, name='Messenger')
+        # Sessions of the pool must not keep the plugin from exiting.
+        self.daemon = True
         self.coqtop = coqtop
         self.printer = self.coqtop.printer
-        self.messages = []
-        self.lock = Lock()
+        self.messages = deque()
+        self.inflight = deque()
+        # Number of Add calls in flight.
+        self.adds = 0
+        self.lock = TracedLock('messenger')
+        # Answers are delivered one at a time, in order.
+        self.deliver_lock = Lock()
+        self.wakeup = Event()
         self.cont = True
-        self.waiting = False
         self.interupted = False
         self.silent_interupted = False
-        self.canInteruptHere = True
+        # Set while the answers of the calls in flight are dropped.
+        self.cutoff = False
+        self.replay = False
+        self.dropped = []
+        # Set when a dropped Add created a state on top of a wrong one.
+        self.misplaced = False
+        # Set when the states from a failed Add must be removed, back to
+        # rewind_to, or only the last one if coqtop did not give the state.
+        self.rewinding = False
+        self.rewind_to = None
+        # Set from an interrupt until the calls in flight are answered.
+        self.interrupting = False
         self.exception = Exception('No information')
+        self.coqtop.events.subscribe(ProcessingIn, self.processing)
+
+    @property
+    def waiting(self):
+        return len(self.inflight) > 0
 
     def stop(self):
         self.cont = False
+        self.coqtop.events.unsubscribe(ProcessingIn, self.processing)
+        self.wakeup.set()
 
     def add_message(self, msg):
-        if not (self.isAlive()):
+        if not (self.is_alive()):
             raise self.exception
-        self.printer.debug(">< ADDING MESSAGE " +str(msg)+ " ><\n")
+        self.printer.debug(">< ADDING MESSAGE %s ><\n", msg)
         with self.lock:
-            self.messages.insert(0, msg)
+            self.messages.append(msg)
+        self.wakeup.set()
 
     def silent_interupt(self):
         with self.lock:
             self.silent_interupted = True
+        self.wakeup.set()
 
     def interupt(self):
         with self.lock:
             self.interupted = True
-    
+        self.wakeup.set()
+
     def is_empty(self):
         with self.lock:
-            return self.messages == []
+            return len(self.messages) == 0 and len(self.inflight) == 0
+
+    def executing(self):
+        """ Whether a call that executes sentences is in flight. """
+        return any(m.call == 'Goal' or m.call == 'Observe' for m in self.inflight)
 
-    def guarded_interupt(self, mtype):
+    def drop(self, failure=False):
+        """ Forget the queued calls, except the ones that keep the state of
+            coqtop in sync with ours, and after a failure, the ones that are
+            sent again. """
+        self.messages = deque(m for m in self.messages if m.keep or (failure and m.resend))
+
+    def guarded_interupt(self):
         with self.lock:
-            if self.canInteruptHere and self.interupted and self.waiting:
-                self.coqtop.printer.debug("\nINTERRUPTED!!\n")
+            if self.interupted and self.executing():
+                self.printer.debug("\nINTERRUPTED!!\n")
                 self.coqtop.coqtop.send_signal(signal.SIGINT)
-                self.messages = []
-                self.messages.insert(0, CoqGoal(self.coqtop))
+                self.interrupting = True
+                self.drop()
+                self.messages.append(CoqCancel(self.coqtop))
                 self.interupted = False
-            elif self.canInteruptHere and self.interupted:
-                self.coqtop.printer.debug("\nINTERRUPTED 2!!\n")
-                self.messages = []
+            elif self.interupted:
+                self.printer.debug("\nINTERRUPTED 2!!\n")
+                adding = self.adds > 0 or any(m.type == 'add' for m in self.messages)
+                self.drop()
+                if adding:
+                    # Execute the sentences that were added, so that they are
+                    # validated, and the other ones are known to be dropped.
+                    self.messages.append(CoqCancel(self.coqtop))
                 self.interupted = False
-            elif self.canInteruptHere and self.silent_interupted:
-                self.coqtop.printer.debug("\nINTERRUPTED 3!!\n")
-                self.messages = []
+            elif self.silent_interupted:
+                self.printer.debug("\nINTERRUPTED 3!!\n")
+                self.drop()
                 self.silent_interupted = False
 
+    def processing(self, event):
+        # coqtop started executing a sentence.  While calls are cut off or
+        # interrupted, their execution is wasted, so interrupt it.
+        with self.lock:
+            if self.coqtop.coqtop is None:
+                return
+            if (self.cutoff or self.interrupting) and self.executing():
+                self.printer.debug("\nINTERRUPTED IN FLIGHT!!\n")
+                self.coqtop.coqtop.send_signal(signal.SIGINT)
+
+    def can_send(self, message):
+        if self.cutoff or len(self.inflight) >= self.depth:
+            return False
+        if self.inflight and (message.barrier or self.inflight[-1].barrier):
+            return False
+        if message.type == 'add' and self.coqtop.focus is not None:
+            # The Add that ends the focused proof moves the tip of coqtop.
+            return not any(m.type == 'add' for m in self.inflight)
+        if message.type == 'add' and not message.fake and not self.coqtop.synced:
+            return self.adds == 0
+        return True
+
+    def send_next(self):
+        """ Send the next queued call if possible, and return whether it was
+            sent. """
+        with self.lock:
+            if not self.messages or not self.can_send(self.messages[0]):
+                return False
+            message = self.messages.popleft()
+            self.inflight.append(message)
+            if message.fake:
+                data = None
+            else:
+                if message.type == 'add':
+                    self.adds += 1
+                data = message.get_string()
+                if TRACER.enabled:
+                    message.sent = TRACER.now()
+        if data is None:
+            # Fake answer from coqtop when we parse a comment
+            self.deliver_fakes()
+        else:
+            self.coqtop.send_cmd(data, message.type)
+        return True
+
+    def answered(self, event):
+        """ Match event, the answer of coqtop, with the first call in flight
+            and deliver it, unless it is cut off. """
+        with self.deliver_lock:
+            with self.lock:
+                if not self.inflight:
+                    self.printer.error("Unexpected answer: %s\n", event)
+                    return
+                message = self.inflight.popleft()
+                if message.type == 'add' and not message.fake:
+                    self.adds -= 1
+                dropped = self.cutoff
+                if dropped:
+                    self.dropped.append(message)
+                    if message.type == 'add' and isinstance(event, Ok) and event.state_id is not None:
+                        self.misplaced = True
+            if message.sent is not None:
+                TRACER.interval(message.call, 'coqtop', message.sent, TRACER.now(),
+                        {'type': message.type, 'ok': isinstance(event, Ok), 'dropped': dropped})
+            if dropped:
+                self.printer.debug("Dropped answer to %s: %s\n", message.type, event)
+            else:
+                with TRACER.span('answer', 'coqtop', {'type': message.type}):
+                    self.deliver(message, event)
+            self.deliver_fakes_locked()
+            self.check_drained()
+        self.wakeup.set()
+
+    def deliver(self, message, event):
+        ct = self.coqtop
+        rewind = ct.remove_answer(event, message.type)
+        if isinstance(event, Err):
+            with self.lock:
+                self.start_cutoff(False)
+        elif message.type == 'add' and event.tip is not None:
+            with self.lock:
+                # The focused proof is closed, and coqtop went on to the
+                # states after it.  The Adds queued after it are not sent, the
+                # sentences that follow already have their state.
+                ct.last_id = max(ct.last_id, event.state_id.id)
+                ct.tip = ct.state_id
+                self.messages = deque(m for m in self.messages if m.type != 'add')
+                if ct.state_id != event.tip:
+                    self.messages.appendleft(EditAt(ct, 0))
+        elif message.type == 'add' and event.state_id is not None:
+            with self.lock:
+                if not ct.synced:
+                    # This was the only Add in flight.
+                    ct.synced = True
+                    ct.last_id = event.state_id.id
+                    ct.tip = event.state_id
+                elif event.state_id != message.predicted:
+                    self.printer.debug("Predicted %s, got %s\n", message.predicted, event.state_id)
+                    ct.last_id = max(ct.last_id, event.state_id.id)
+                    self.start_cutoff(True)
+        if rewind:
+            with self.lock:
+                self.rewinding = True
+                self.rewind_to = event.state_id
+
+    def start_cutoff(self, replay):
+        self.cutoff = True
+        self.replay = replay
+        self.coqtop.synced = False
+        if not replay:
+            self.drop(True)
+            # Every queued call was dropped, the Actionner does not need to.
+            self.silent_interupted = False
+
+    def deliver_fakes(self):
+        with self.deliver_lock:
+            self.deliver_fakes_locked()
+            self.check_drained()
+
+    def deliver_fakes_locked(self):
+        while True:
+            with self.lock:
+                if not self.inflight or not self.inflight[0].fake:
+                    return
+                message = self.inflight.popleft()
+                if self.cutoff:
+                    self.dropped.append(message)
+                    continue
+            self.coqtop.remove_answer(Ok(self.coqtop.state_id), message.type)
+
+    def check_drained(self):
+        """ Once every call in flight is answered, end the cut-off. """
+        with self.lock:
+            if self.inflight:
+                return
+            self.interrupting = False
+            if not self.cutoff:
+                return
+            self.coqtop.tip = self.coqtop.state_id
+            if self.replay:
+                self.messages.extendleft(reversed(self.dropped))
+            else:
+                self.messages.extendleft(reversed([m for m in self.dropped if m.resend]))
+            # Going back also removes the states that were misplaced.
+            if self.rewinding:
+                self.messages.appendleft(EditAt(self.coqtop, 1, self.rewind_to))
+            elif self.misplaced:
+                self.messages.appendleft(EditAt(self.coqtop, 0))
+            self.cutoff = False
+            self.replay = False
+            self.misplaced = False
+            self.rewinding = False
+            self.rewind_to = None
+            self.dropped = []
+
     def run(self):
         try:
-            i = 0
             while self.cont:
-                mtype = None
-                sleep = True
-
-                with self.lock:
-                    sleep = self.messages == []
-                    if not sleep:
-                        self.printer.debug(">< SENDING NEXT MESSAGE ><\n")
-                        message = self.messages.pop()
-                        mtype = message.type
-                        addtype = None
-                        if mtype == 'add':
-                            addtype = message.addtype
-
-                        with self.coqtop.waiting_lock:
-                            if mtype == 'goal' or mtype == 'addgoal':
-                                self.canInteruptHere = True
-                                self.coqtop.parser.nextFlush = False
-                            else:
-                                self.canInteruptHere = False
-                            if addtype is None or addtype is not 'comment':
-                                self.coqtop.set_next_answer_type(mtype)
-                                self.coqtop.send_cmd(message.get_string())
-                                self.coqtop.answer_event.clear()
-                            else:
-                                # Fake answer from coqtop when we parse a comment
-                                self.coqtop.remove_answer(Ok(self.coqtop.state_id), mtype)
-                                continue
-                        self.printer.debug(">< NEXT MESSAGE SENT ><\n")
-
-                if sleep:
-                    time.sleep(0.2)
-                    continue
-
-                if self.cont:
-                    self.waiting = True
-                    self.coqtop.wait_answer()
-                    self.waiting = False
-                    self.guarded_interupt(mtype)
+                # Woken up by new calls, answers, interrupts and stop.
+                self.wakeup.wait()
+                self.wakeup.clear()
+                self.guarded_interupt()
+                while self.cont and self.send_next():
+                    pass
 
             with self.lock:
-                self.messages = []
+                self.messages.clear()
         except BaseException as e:
             self.exception = e
 
-class Add:
+class Message:
+    """ A call to coqtop.  get_string is called when it is sent. """
+    # Answered by coquille itself, without sending anything.
+    fake = False
+    # Sent only when no other call is in flight, and nothing is sent before
+    # its answer.
+    barrier = False
+    # Kept in the queue when it is dropped.
+    keep = False
+    # Sent again when it is dropped because a call before it failed.
+    resend = False
+    # Name of the call in traces, and when it was sent, if it is traced.
+    call = None
+    sent = None
+
+class Init(Message):
+    call = 'Init'
+
+    def __init__(self):
+        self.type = "init"
+
+class Add(Message):
+    call = 'Add'
+
     def __init__(self, coqtop, instr, typ):
         self.coqtop = coqtop
         self.instr = instr
         self.type = "add"
         self.addtype = typ
+        self.fake = typ == 'comment'
+        self.parent = None
+        self.predicted = None
 
     def get_string(self):
-        a = API()
-        return a.get_call_msg('Add', ((self.instr, -1), (self.coqtop.state_id, True)))
+        self.parent = self.coqtop.tip
+        self.predicted = self.coqtop.predict()
+        return ADD.render(self.instr, self.parent)
+
+class CoqQuery(Message):
+    call = 'Query'
 
-class CoqQuery:
     def __init__(self, coqtop, instr):
         self.coqtop = coqtop
         self.instr = instr
         self.type = "query"
 
     def get_string(self):
-        a = API()
-        return a.get_call_msg('Query', (RouteId(0), (self.instr, self.coqtop.state_id)))
+        return QUERY.render(self.instr, self.coqtop.tip)
 
 class CoqQuery86(CoqQuery):
     def __init__(self, coqtop, instr):
         CoqQuery.__init__(self, coqtop, instr)
 
     def get_string(self):
-        a = API()
-        return a.get_call_msg('Query', (self.instr, self.coqtop.state_id))
+        return QUERY86.render(self.instr, self.coqtop.tip)
+
+class CoqGoal(Message):
+    call = 'Goal'
 
-class CoqGoal:
-    def __init__(self, coqtop, advance = False):
+    def __init__(self, coqtop, advance = False, resend = False):
         self.coqtop = coqtop
+        self.resend = resend
         if advance:
             self.type = "addgoal"
         else:
             self.type = "goal"
 
     def get_string(self):
-        a = API()
-        return a.get_call_msg('Goal', ())
+        return GOAL.render()
+
+class CoqCancel(CoqGoal):
+    """ Goal asked after an interrupt, whose answer tells which sentences
+        were executed, and that the others were dropped. """
+    def __init__(self, coqtop):
+        CoqGoal.__init__(self, coqtop)
+        self.type = "cancel"
+
+class CoqObserve(Message):
+    """ Execute every sentence added before, up to the state of the last
+        one, letting coqtop delegate proofs to workers. """
+    call = 'Observe'
+
+    def __init__(self, coqtop, resend = False):
+        self.coqtop = coqtop
+        self.resend = resend
+        self.type = "observe"
+
+    def get_string(self):
+        return OBSERVE.render(self.coqtop.tip)
+
+class EditAt(Message):
+    """ Go back to the state target if it is known, or else go back step
+        states, or only make coqtop go back to our current state if step is 0.
+        The state is only chosen when the call is sent, once every answer
+        before it was received. """
+    barrier = True
+    keep = True
+    call = 'Edit_at'
+
+    def __init__(self, coqtop, step, target = None):
+        self.coqtop = coqtop
+        self.step = step
+        self.target = target
+        self.type = "undo"
+
+    def get_string(self):
+        ct = self.coqtop
+        step = min(self.step, len(ct.states))
+        if self.target == ct.state_id:
+            step = 0
+        elif self.target in ct.states:
+            # Comments repeat the state before them, go back to the last one.
+            step = ct.states[::-1].index(self.target) + 1
+        ct.edited = []
+        if step > 0:
+            idx = len(ct.states) - step
+            ct.edited = ct.states[idx + 1:] + [ct.state_id]
+            ct.state_id = ct.states[idx]
+            ct.states = ct.states[0:idx]
+        ct.tip = ct.state_id
+        return EDIT_AT.render(ct.state_id)
 
 def ignore_sigint():
     signal.signal(signal.SIGINT, signal.SIG_IGN)
@@ -165,26 +433,72 @@ def new_coqtop(printer, parser):
 class CoqTop:
     def __init__(self, printer, parser):
         self.write_lock = Lock()
-        self.waiting_lock = Lock()
-        self.answer_event = Event()
-        self.answer_event.clear()
         self.printer = printer
         self.coqtop = None
         self.states = []
         self.state_id = None
+        # State on top of which the next Add is sent, and the last state id
+        # given by coqtop, or predicted.  They are only known to be right when
+        # synced is set.
+        self.tip = None
+        self.last_id = 0
+        self.synced = False
         self.root_state = None
+        # The first and last state of the proof that coqtop focuses on after
+        # an Edit_at inside it, and the states after each of the sentences
+        # that follow the proof, which are kept until it is closed again.
+        self.focus = None
+        self.tail = None
+        # States that the last Edit_at went back from.
+        self.edited = []
         self.messenger = None
-        self.calltype = "init"
-        self.shouldRewind = False
+        self.parser = None
+        # File to record sessions to, see record.py.
+        self.record_file = None
+        self.recorder = None
         self.coqtopbin = parser.getCoqtop()
         self.args = parser.getArgs()
-        self.worker = 'master'
-
-    def setWorker(self, worker):
-        self.worker = worker
+        self.events = EventBus()
+        self.workers = Workers(self.events)
+        self.async_options = async_options()
+
+    @property
+    def calltype(self):
+        """ The type of the call whose answer is expected next. """
+        messenger = self.messenger
+        if messenger is None or not messenger.inflight:
+            return None
+        return messenger.inflight[0].type
+
+    def predict(self):
+        """ Return the state id that the next Add will get, and make it the
+            tip. """
+        self.last_id += 1
+        self.tip = StateId(self.last_id)
+        return self.tip
+
+    def feedback(self, event):
+        self.events.publish(event)
+
+    def setRecordFile(self, filename):
+        """ Record the sessions started from now on to filename, or stop
+            recording if it is empty. """
+        self.record_file = filename or None
+
+    def setAsyncOptions(self, options):
+        """ Start the sessions from now on with options for the workers, see
+            workers.async_options.  Options of the project come after them. """
+        self.async_options = options
 
     def setPrinter(self, printer):
+        """ Pass what coqtop says to printer from now on, also in the threads
+            of a running session. """
         self.printer = printer
+        if self.messenger is not None:
+            self.messenger.printer = printer
+        if self.parser is not None:
+            self.parser.printer = printer
+            self.parser.target.printer = printer
 
     def running(self):
         return self.coqtop is None
@@ -203,9 +517,19 @@ class CoqTop:
     def restart(self, *args):
         if self.coqtop:
             self.kill()
+        # A new process knows nothing of the states of the previous one.
+        self.states = []
+        self.last_id = 0
+        self.edited = []
         self.messenger = Messenger(self)
+        if self.record_file is not None:
+            try:
+                self.recorder = Recorder(self.record_file)
+            except OSError as e:
+                self.printer.error("Cannot record to %s: %s\n", self.record_file, e)
         options = self.getDefaultOptions()
-        options += self.args
+        options += self.async_options + self.args
+        self.workers.reset(worker_count(options))
         try:
             if os.name == 'nt':
                 self.coqtop = subprocess.Popen(options + list(args),
@@ -222,6 +546,10 @@ class CoqTop:
             self.root_state = r.state_id
             # Probably wrong:
             self.state_id = r.state_id
+            self.tip = r.state_id
+            self.synced = False
+            self.focus = None
+            self.tail = None
         except OSError:
             return False
         return True
@@ -238,40 +566,52 @@ class CoqTop:
             except OSError:
                 pass
             self.coqtop = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def died(self, process):
+        """ Called by the reader of process when it closed its output without
+            being stopped.  The calls in flight are never answered, and the
+            session must be restarted. """
+        try:
+            code = process.wait(1)
+        except subprocess.TimeoutExpired:
+            code = None
+        self.printer.error("coqtop died with code %s\n", code)
+        if process is self.coqtop:
+            self.events.publish(Died(None, code))
 
     def init(self):
-        a = API()
-        message = a.get_init_msg()
-        self.send_cmd(message)
-        self.parser = CoqParser(self.coqtop, self, self.printer)
+        message = Init()
+        if TRACER.enabled:
+            message.sent = TRACER.now()
+        self.messenger.inflight.append(message)
+        self.send_cmd(INIT.render(), 'init')
+        self.parser = CoqParser(self.coqtop, self, self.printer, self.recorder)
         self.parser.start()
         return Ok(1)
 
-    def set_next_answer_type(self, calltype):
-        self.calltype = calltype
-
-    def wait_answer(self):
-        while not self.answer_event.isSet() and self.messenger.cont:
-            self.answer_event.wait(0.1)
-            self.messenger.guarded_interupt(self.calltype)
-        if self.shouldRewind and self.messenger.cont:
-            self.rewind()
-
-    def wait_answer_uninterrupted(self):
-        while not self.answer_event.isSet() and self.messenger.cont:
-            self.answer_event.wait(0.1)
-        if self.shouldRewind:
-            self.rewind()
+    def stats(self):
+        if self.parser is None:
+            return {'bytes': 0, 'reads': 0, 'messages': 0, 'bytes_per_s': 0}
+        return self.parser.stats()
 
     def pull_event(self, event):
-        self.shouldRewind = self.remove_answer(event, self.calltype)
+        self.messenger.answered(event)
         self.printer.debug("\nEnd of remove_answer\n")
-        self.calltype = None
-        with self.waiting_lock:
-            self.answer_event.set()
 
-    def goals(self, advance = False):
-        self.messenger.add_message(CoqGoal(self, advance))
+    def goals(self, advance = False, resend = False):
+        """ Ask for the goals.  With resend, the call is sent again after a
+            failure of an Add before it, to execute the sentences before that
+            Add. """
+        self.messenger.add_message(CoqGoal(self, advance, resend))
+
+    def observe(self, resend = False):
+        """ Execute the sentences added so far, like goals(True), except that
+            coqtop does not wait for the proofs that it delegates to workers.
+            Their errors come later, as ErrorMessage events. """
+        self.messenger.add_message(CoqObserve(self, resend))
 
     def advance(self, instr, typ, encoding = 'utf8'):
         self.messenger.add_message(Add(self, instr, typ))
@@ -301,23 +641,10 @@ class CoqTop:
         self.messenger.add_message(CoqQuery(self, terms))
 
     def rewind(self, step = 1):
-        assert self.messenger.is_empty()
-        assert step <= len(self.states)
-        with self.messenger.lock:
-            idx = len(self.states) - step
-            self.state_id = self.states[idx]
-            self.states = self.states[0:idx]
-            a = API()
-            message = a.get_call_msg('Edit_at', self.state_id)
-            with self.waiting_lock:
-                self.set_next_answer_type("undo")
-                self.send_cmd(message)
-                self.answer_event.clear()
-            self.wait_answer_uninterrupted()
+        self.messenger.add_message(EditAt(self, step))
 
     def interupt(self):
         self.messenger.interupt()
-        a = API()
 
     def silent_interupt(self):
         self.messenger.silent_interupt()
@@ -327,23 +654,60 @@ class CoqTop:
             return
         self.message.append(Message (msg=msg) (getter=getter(self)))
 
-    def send_cmd(self, msg):
+    def send_cmd(self, msg, calltype=None):
         if self.coqtop is None:
             return
         with self.write_lock:
-            self.printer.debug(">>>" + str(msg) + "\n")
-            self.coqtop.stdin.write(msg)
-            self.coqtop.stdin.flush()
+            self.printer.debug(">>>%s\n", msg)
+            if self.recorder is not None:
+                self.recorder.call(calltype, msg)
+            try:
+                self.coqtop.stdin.write(msg)
+                self.coqtop.stdin.flush()
+            except OSError:
+                # coqtop died, its reader tells when it notices.
+                pass
 
     def remove_answer(self, r, msgtype):
+        if isinstance(r, Ok) and msgtype == 'undo':
+            self.refocus(r.focus)
         self.printer.parseMessage(r, msgtype)
-        if isinstance(r, Err) and msgtype == 'addgoal':
+        if isinstance(r, Err) and msgtype in ('addgoal', 'observe', 'cancel'):
             return True
         if isinstance(r, Ok) and not r.state_id is None:
             self.states.append(self.state_id)
             self.state_id = r.state_id
+            if r.tip is not None:
+                self.unfocus()
         return False
 
+    def refocus(self, focus):
+        """ Follow the focus of coqtop after an Edit_at: it starts when it
+            goes back inside a closed proof, and ends when it goes back before
+            the focused proof. """
+        if focus is not None and self.focus is None:
+            (start, stop, tip) = focus
+            self.focus = (start, stop)
+            if stop in self.edited:
+                self.tail = self.edited[self.edited.index(stop) + 1:]
+            else:
+                self.tail = []
+        elif self.focus is not None and self.focus[0] not in self.states + [self.state_id]:
+            self.focus = None
+            self.tail = None
+
+    def unfocus(self):
+        """ The focused proof was closed by the last state: the states after it
+            follow it again. """
+        if self.focus is not None:
+            (start, stop) = self.focus
+            end = self.state_id
+            for s in self.tail:
+                self.states.append(self.state_id)
+                self.state_id = end if s == stop else s
+        self.focus = None
+        self.tail = None
+
 class CoqTop86(CoqTop):
     def __init__(self, printer, parser):
         CoqTop.__init__(self, printer, parser)
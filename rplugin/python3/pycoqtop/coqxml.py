@@ -1,159 +1,362 @@
 import xml.etree.ElementTree as ET
+import os
 import time
 import select
+import traceback
 
-from io import StringIO
-from threading import Thread, Event, Lock
-from os import read
+from threading import Thread, Lock
 from .coqapi import Ok, Err
 from .xmltype import *
+from .richpp import GROUPS
+from . import events
+from .trace import TRACER
+
+# States of the handler in which text is kept.
+TEXT = {'value', 'goal_id', 'hyp', 'ccl', 'message', 'feedback_arg'}
+
+# Lists of goals, in the order of their lists in <goals>.  Background goals
+# are a list of pairs of lists of goals.
+GOAL_LISTS = ['fg', 'bg', 'shelved', 'given_up']
 
 class CoqHandler:
+    """
+    Target of the XML parser for the output of coqtop.  The handler is a state
+    machine with a stack that has one state per open element.  For each state,
+    a table gives the method that handles the start of each interesting tag.
+    That method returns the state of the new element and a method to call at
+    its end, or None to skip the element.  Other elements are transparent in
+    states that keep their text, and skipped with all their children in other
+    states.  Text is accumulated in a list, and joined once per node.  Its
+    length is counted as it comes, so that transparent elements with a
+    highlight group in richpp.GROUPS are recorded as spans of that text.
+    """
     def __init__(self, state_manager, printer):
         self.printer = printer
         self.state_manager = state_manager
-        self.currentContent = ""
-        self.oldProcess = None
-        self.currentProcess = None
+        self.state = None
+        self.stack = []
+        # Depth of the element being skipped, or 0.
+        self.skip = 0
+        self.text = []
+        self.length = 0
+        self.spans = []
+        # Number of complete messages (answers, feedback and old style
+        # messages) read from coqtop.
+        self.messages = 0
+
         self.messageLevel = None
+        self.messageLoc = None
         self.val = None
+        self.loc_s = None
+        self.loc_e = None
         self.state_id = None
+        # State ids of a value after the first one, and the constructor of
+        # its union, if any.
+        self.state_ids = []
+        self.union = None
         self.nextFlush = True
 
+        self.goal_list = 0
         self.goals = None
-        self.goals_fg = []
-        self.goals_bg = 0
-        self.goals_shelved = 0
-        self.goals_given_up = 0
+        self.goal_target = None
 
         self.goal_id = None
-        self.goal_hyps = []
-        self.goal_ccl = None
+        self.goal_parts = []
+        self.goal_ends = []
+        self.goal_offsets = []
+        self.goal_spans = []
+
+        self.feedback_state = None
+        self.feedback_kind = None
+        self.feedback_args = []
+
+        self.tables = {
+            None: {'Root': self.startRoot},
+            'root': {
+                'value': self.startValue,
+                'feedback': self.startFeedback,
+                # older coq (8.6) use a message tag at top-level, newer ones use
+                # a message tag inside a feedback_content one.
+                'message': self.startMessage,
+            },
+            'value': {
+                'option': self.startOption,
+                'goals': self.startGoals,
+                'state_id': self.startStateId,
+                'union': self.startUnion,
+            },
+            'goals': {'list': self.startGoalList},
+            'goal_list': {'goal': self.startGoal},
+            'bg': {'pair': self.startBgPair},
+            'bg_pair': {'list': self.startBgList},
+            'goal': {
+                'string': self.startGoalId,
+                'list': self.startHyps,
+                'richpp': self.startCcl,
+            },
+            'hyps': {'richpp': self.startHyp, 'string': self.startHyp},
+            'feedback': {
+                'state_id': self.startFeedbackStateId,
+                'feedback_content': self.startFeedbackContent,
+            },
+            'feedback_content': {
+                'string': self.startFeedbackArg,
+                'pair': self.startFeedbackContainer,
+                'option': self.startFeedbackContainer,
+                'list': self.startFeedbackContainer,
+                'union': self.startFeedbackContainer,
+            },
+            'waitmessage': {'message': self.startMessage},
+            'message': {'message_level': self.startMessageLevel, 'loc': self.startMessageLoc},
+        }
 
     # Call when an element starts
     def start(self, tag, attributes):
-        if tag == 'value':
-            self.currentProcess = 'value'
-            self.val = attributes['val']
-            self.loc_s = None if not 'loc_s' in attributes else attributes['loc_s']
-            self.loc_e = None if not 'loc_e' in attributes else attributes['loc_e']
-        if tag == 'option' and attributes['val'] == 'none' and self.currentProcess == 'value':
-            self.printer.addGoal(None)
-        elif tag == 'goals' and self.currentProcess == 'value':
-            self.currentProcess = 'goals_fg'
-        elif tag == 'list' and self.currentProcess == 'goals_fg':
-            self.currentProcess = 'fg'
-        elif tag == 'goal' and self.currentProcess == 'fg':
-            self.currentProcess = 'goal'
-        elif tag == 'pair' and self.currentProcess == 'goals_bg':
-            self.currentProcess = 'goals_bg_in'
-        elif tag == 'goal' and self.currentProcess == 'goals_bg_in':
-            self.goals_bg += 1
-        # TODO
-        elif tag == 'goal' and self.currentProcess == 'goals_shelved':
-            self.goals_shelved += 1
-        # TODO
-        elif tag == 'goal' and self.currentProcess == 'goals_given_up':
-            self.goals_given_up += 1
-        elif tag == 'string' and self.currentProcess == 'goal':
-            self.currentProcess = 'goal_id'
-        elif tag == 'list' and self.currentProcess == 'goal':
-            self.currentProcess = 'goal_hyps'
-        elif tag == 'state_id' and self.currentProcess == 'value':
-            self.state_id = attributes['val']
-        elif tag == 'feedback_content' and attributes['val'] == 'message':
-            self.currentProcess = 'waitmessage'
-        elif tag == 'feedback_content' and attributes['val'] == 'processingin':
-            self.currentProcess = 'waitworker'
-        elif self.currentProcess == 'message' and tag == 'message_level':
-            self.messageLevel = attributes['val']
-        elif tag == 'message':
-            # older coq (8.6) use a message tag at top-level, newer ones use a
-            # message tag inside a feedback_content one.
-            # Since there might be more than one message, we want to track when
-            # we came from a 'waitmessage' (newer coq).
-            self.oldProcess = self.currentProcess
-            self.currentProcess = 'message'
+        if self.skip > 0:
+            self.skip += 1
+            return
+        handler = self.tables.get(self.state, {}).get(tag)
+        if handler is not None:
+            frame = handler(attributes)
+            if frame is not None:
+                self.stack.append((self.state, frame[1]))
+                self.state = frame[0]
+                return
+        elif self.state in TEXT:
+            group = GROUPS.get(tag)
+            if group is None:
+                self.stack.append((self.state, None))
+            else:
+                self.stack.append((self.state, self.spanEnder(len(self.spans))))
+                self.spans.append((self.length, self.length, group))
+            return
+        self.skip = 1
 
     # Call when an element ends
     def end(self, tag):
-        if tag == "value":
-            if self.nextFlush:
-                self.printer.flushInfo()
-            self.nextFlush = True
-            if self.val == 'good':
-                self.state_manager.pull_event(Ok(self.state_id))
-            else:
-                self.state_manager.pull_event(
-                        Err(None, False if not hasattr(self, "loc_s") or self.loc_s is None else int(self.loc_s),
-                            False if not hasattr(self, "loc_e") or self.loc_e is None else int(self.loc_e)))
-                self.printer.addInfo(self.currentContent)
-                self.currentContent = ''
-                self.nextFlush = False
-            self.state_id = None
-            self.val = None
-            self.currentProcess = None
-        elif tag == 'goals':
-            self.printer.debug("Goals: " + str(self.goals_fg) + "\n;; " + str(self.goals_bg) + "\n;; " + str(self.goals_shelved) + "\n;; " + str(self.goals_given_up) + "\n")
-            self.printer.addGoal(Goals(self.goals_fg, self.goals_bg, self.goals_shelved, self.goals_given_up))
-            self.goals_fg = []
-            self.goals_bg = 0
-            self.goals_shelved = 0
-            self.goals_given_up = 0
-            self.currentProcess = 'value'
-        elif tag == 'string' and self.currentProcess == 'goal_id':
-            self.goal_id = self.currentContent
-            self.currentProcess = 'goal'
-            self.currentContent = ''
-        elif tag == 'goal' and self.currentProcess == 'goal':
-            self.goals_fg.append(Goal(self.goal_id, self.goal_hyps, self.currentContent))
-            self.goal_hyps = []
-            self.currentContent = ''
-            self.currentProcess = 'fg'
-        elif tag == 'richpp' and self.currentProcess == 'goal_hyps':
-            self.goal_hyps.append(self.currentContent)
-            self.currentContent = ''
-        elif tag == 'list' and self.currentProcess == 'goal_hyps':
-            self.currentContent = ''
-            self.currentProcess = 'goal'
-        elif tag == 'list' and self.currentProcess == 'fg':
-            self.currentContent = ''
-            self.currentProcess = 'goals_bg'
-        elif tag == 'pair' and self.currentProcess == 'goals_bg_in':
-            self.currentContent = ''
-            self.currentProcess = 'goals_bg'
-        elif tag == 'feedback_content' and self.currentProcess == 'waitmessage':
-            self.currentProcess = None
-            self.oldProcess = None
-            self.messageLevel = None
-            self.currentContent = ''
-        elif tag == 'feedback_content' and self.currentProcess == 'waitworker':
-            self.state_manager.setWorker(self.currentContent)
-            self.currentContent = ''
-        elif tag == 'message' and self.currentProcess == 'message':
-            self.currentProcess = 'waitmessage'
-            self.printer.debug(self.messageLevel + ": " + str(self.currentContent) + "\n\n")
-            self.printer.addInfo(self.currentContent)
-            self.currentProcess = self.oldProcess
-            self.messageLevel = None
-            self.currentContent = ''
-     
+        if self.skip > 0:
+            self.skip -= 1
+            if self.skip == 0 and self.state == 'root':
+                self.messages += 1
+            return
+        (self.state, handler) = self.stack.pop()
+        if handler is not None:
+            handler()
+        if self.state == 'root':
+            self.messages += 1
+
     # Call when a character is read
     def data(self, content):
-        if self.currentProcess == 'message' or self.currentProcess == 'value' or \
-                self.currentProcess == 'goal_id' or self.currentProcess == 'goal' or \
-                self.currentProcess == 'waitworker' or self.currentProcess == 'goal_hyps':
-            self.currentContent += content
+        if self.state in TEXT:
+            self.text.append(content)
+            self.length += len(content)
 
-class CoqParser(Thread):
-    def __init__(self, process, state_manager, printer):
-        Thread.__init__(self)
-        self.cont = True
-        self.process = process
-        self.printer = printer
-        self.target = CoqHandler(state_manager, printer)
-        self.parser = ET.XMLParser(target=self.target)
-        self.parser.feed("""
+    def spanEnder(self, i):
+        def endSpan():
+            (start, end, group) = self.spans[i]
+            self.spans[i] = (start, self.length, group)
+        return endSpan
+
+    def newText(self):
+        self.text = []
+        self.length = 0
+        self.spans = []
+
+    def takeText(self):
+        text = ''.join(self.text)
+        self.newText()
+        return text
+
+    def takeRich(self):
+        spans = self.spans
+        return RichPP(self.takeText(), spans)
+
+    def startRoot(self, attributes):
+        return ('root', None)
+
+    def startValue(self, attributes):
+        self.val = attributes['val']
+        self.loc_s = attributes.get('loc_s')
+        self.loc_e = attributes.get('loc_e')
+        self.state_id = None
+        self.state_ids = []
+        self.union = None
+        self.newText()
+        return ('value', self.endValue)
+
+    def endValue(self):
+        if self.nextFlush:
+            self.printer.flushInfo()
+        self.nextFlush = True
+        if self.val == 'good' and self.union == 'in_r' and len(self.state_ids) == 2:
+            # Edit_at inside a closed proof: Inr (start, (stop, tip))
+            self.state_manager.pull_event(Ok(None, focus=[self.state_id] + self.state_ids))
+        elif self.val == 'good' and self.union == 'in_r' and len(self.state_ids) == 1:
+            # Add of the end of the focused proof: (state_id, (Inr tip, message))
+            self.state_manager.pull_event(Ok(self.state_id, tip=self.state_ids[0]))
+        elif self.val == 'good':
+            self.state_manager.pull_event(Ok(self.state_id))
+        else:
+            self.state_manager.pull_event(
+                    Err(None, False if self.loc_s is None else int(self.loc_s),
+                        False if self.loc_e is None else int(self.loc_e), self.state_id))
+            self.printer.addInfo(self.takeRich())
+            self.nextFlush = False
+        self.newText()
+        self.state_id = None
+        self.state_ids = []
+        self.union = None
+        self.val = None
+
+    def startOption(self, attributes):
+        if attributes.get('val') == 'none':
+            self.printer.addGoal(None)
+        return ('value', None)
+
+    def startStateId(self, attributes):
+        if self.state_id is None:
+            self.state_id = attributes['val']
+        else:
+            self.state_ids.append(attributes['val'])
+        return ('value', None)
+
+    def startUnion(self, attributes):
+        if self.union is None:
+            self.union = attributes.get('val')
+        return ('value', None)
+
+    def startGoals(self, attributes):
+        self.goal_list = 0
+        self.goals = Goals([], [], [], [])
+        return ('goals', self.endGoals)
+
+    def endGoals(self):
+        self.printer.debug("Goals: %s\n;; %d\n;; %d\n;; %d\n", self.goals.fg,
+                len(self.goals.bg), len(self.goals.shelved), len(self.goals.given_up))
+        self.printer.addGoal(self.goals)
+        self.goals = None
+
+    def startGoalList(self, attributes):
+        if self.goal_list >= len(GOAL_LISTS):
+            return None
+        kind = GOAL_LISTS[self.goal_list]
+        self.goal_list += 1
+        if kind == 'bg':
+            return ('bg', None)
+        self.goal_target = getattr(self.goals, kind)
+        return ('goal_list', None)
+
+    def startBgPair(self, attributes):
+        return ('bg_pair', None)
+
+    def startBgList(self, attributes):
+        self.goal_target = self.goals.bg
+        return ('goal_list', None)
+
+    # The text of hypotheses and of the conclusion of a goal is accumulated in
+    # the same list, and only joined when the goal is displayed.  Their spans
+    # are kept in the same list too, with offsets in the whole text.
+    def startGoal(self, attributes):
+        self.goal_id = None
+        self.goal_parts = []
+        self.goal_ends = []
+        self.goal_offsets = []
+        self.goal_spans = []
+        self.useGoalText()
+        return ('goal', self.endGoal)
+
+    def useGoalText(self):
+        self.text = self.goal_parts
+        self.spans = self.goal_spans
+        self.length = self.goal_offsets[-1] if self.goal_offsets != [] else 0
+
+    def endGoal(self):
+        self.endHyp()
+        self.goal_target.append(LazyGoal(self.goal_id, self.goal_parts, self.goal_ends,
+            self.goal_offsets, self.goal_spans))
+        self.newText()
+
+    def startGoalId(self, attributes):
+        self.newText()
+        return ('goal_id', self.endGoalId)
+
+    def endGoalId(self):
+        self.goal_id = self.takeText()
+        self.useGoalText()
+
+    def startHyps(self, attributes):
+        return ('hyps', None)
+
+    def startHyp(self, attributes):
+        return ('hyp', self.endHyp)
+
+    def endHyp(self):
+        self.goal_ends.append(len(self.goal_parts))
+        self.goal_offsets.append(self.length)
+
+    def startCcl(self, attributes):
+        return ('ccl', None)
+
+    # Feedback other than messages is decoded into an event, from the kind of
+    # its feedback_content and the strings it contains.
+    def startFeedback(self, attributes):
+        self.feedback_state = None
+        self.feedback_kind = None
+        self.feedback_args = []
+        return ('feedback', self.endFeedback)
+
+    def endFeedback(self):
+        if self.feedback_kind == 'message':
+            if self.messageLevel == 'error' and self.feedback_state is not None:
+                (loc_s, loc_e) = self.messageLoc or (False, False)
+                self.state_manager.feedback(events.ErrorMessage(int(self.feedback_state),
+                    loc_s, loc_e))
+        elif self.feedback_kind is not None:
+            self.state_manager.feedback(events.decode(self.feedback_kind,
+                self.feedback_state, self.feedback_args))
+
+    def startFeedbackStateId(self, attributes):
+        self.feedback_state = attributes.get('val')
+        return ('feedback', None)
+
+    def startFeedbackContent(self, attributes):
+        self.feedback_kind = attributes.get('val')
+        if self.feedback_kind == 'message':
+            return ('waitmessage', None)
+        return ('feedback_content', None)
+
+    def startFeedbackContainer(self, attributes):
+        return ('feedback_content', None)
+
+    def startFeedbackArg(self, attributes):
+        self.newText()
+        return ('feedback_arg', self.endFeedbackArg)
+
+    def endFeedbackArg(self):
+        self.feedback_args.append(self.takeText())
+
+    def startMessage(self, attributes):
+        self.messageLevel = None
+        self.messageLoc = None
+        self.newText()
+        return ('message', self.endMessage)
+
+    def startMessageLevel(self, attributes):
+        self.messageLevel = attributes.get('val')
+        return ('message', None)
+
+    def startMessageLoc(self, attributes):
+        if 'start' in attributes and 'stop' in attributes:
+            self.messageLoc = (int(attributes['start']), int(attributes['stop']))
+        return None
+
+    def endMessage(self):
+        content = self.takeRich()
+        self.printer.debug("%s: %s\n\n", self.messageLevel, content.text)
+        self.printer.addInfo(content)
+
+# Start of the document that the output of coqtop is fed into.
+PREAMBLE = """
 <!DOCTYPE coq [
   <!-- we replace non-breakable spaces with normal spaces, because it would
         make copy-pasting harder -->
@@ -163,27 +366,95 @@ class CoqParser(Thread):
   <!ENTITY apos \"'\">
 ]>
 <Root>
-        """)
+        """
+
+def new_parser(target):
+    """ Return an XML parser for the output of coqtop, that calls target. """
+    parser = ET.XMLParser(target=target)
+    parser.feed(PREAMBLE)
+    return parser
+
+class CoqParser(Thread):
+    """
+    Reader of the output of coqtop.  It sleeps until coqtop writes something or
+    it is stopped, so it never polls, and feeds everything that is available,
+    up to chunk bytes, to the XML parser at once.
+    """
+    # Maximum number of bytes read at once from coqtop.
+    chunk = 0x10000
+
+    def __init__(self, process, state_manager, printer, recorder=None):
+        Thread.__init__(self, name='CoqParser')
+        self.daemon = True
+        self.process = process
+        self.state_manager = state_manager
+        self.printer = printer
+        self.target = CoqHandler(state_manager, printer)
+        self.parser = new_parser(self.target)
+        self.recorder = recorder
+        # Writing to this pipe wakes the reader up so that it stops.
+        (self.wakeup_r, self.wakeup_w) = os.pipe()
+        self.wakeup_lock = Lock()
+        self.bytes = 0
+        self.reads = 0
+        self.started = None
+        self.stopped = None
 
     def run(self):
         self.printer.debug("Running parser...\n")
+        self.started = time.monotonic()
+        closed = False
         try:
-            f = self.process.stdout
-            while self.cont:
-                r, w, e = select.select([ f ], [], [], 0.1)
-                if f in r:
-                    content = read(f.fileno(), 0x400)
-                    self.printer.debug("<< " + str(content) + "\n")
+            fd = self.process.stdout.fileno()
+            while True:
+                r, w, e = select.select([fd, self.wakeup_r], [], [])
+                if self.wakeup_r in r:
+                    break
+                content = os.read(fd, self.chunk)
+                if content == b'':
+                    self.printer.debug("coqtop closed its output\n")
+                    closed = True
+                    break
+                self.bytes += len(content)
+                self.reads += 1
+                if self.recorder is not None:
+                    self.recorder.read(content)
+                self.printer.debug("<< %s\n", content)
+                with TRACER.span('parse', 'xml', {'bytes': len(content)}):
                     self.parser.feed(content)
         except Exception as e:
-            self.printer.debug("WHOOPS!\n")
-            self.printer.debug("WHOOPS! " + str(e) + "\n")
-            self.printer.debug("WHOOPS! " + str(traceback.format_exc()) + "\n")
+            self.printer.error("WHOOPS! %s\n%s\n", e, traceback.format_exc())
+        self.stopped = time.monotonic()
+        with self.wakeup_lock:
+            os.close(self.wakeup_r)
+            self.wakeup_r = None
         try:
             self.parser.feed("</Root>")
         except:
             pass
         self.printer.debug("END OF PARSING\n")
+        if closed:
+            self.state_manager.died(self.process)
 
     def stop(self):
-        self.cont = False
+        with self.wakeup_lock:
+            if self.wakeup_w is None:
+                return
+            if self.wakeup_r is not None:
+                os.write(self.wakeup_w, b'x')
+            os.close(self.wakeup_w)
+            self.wakeup_w = None
+
+    def stats(self):
+        """ Return the number of bytes, reads and messages read from coqtop, and
+            the average throughput in bytes per second. """
+        if self.started is None:
+            elapsed = 0
+        else:
+            elapsed = (self.stopped or time.monotonic()) - self.started
+        return {
+            'bytes': self.bytes,
+            'reads': self.reads,
+            'messages': self.target.messages,
+            'bytes_per_s': self.bytes / elapsed if elapsed > 0 else 0,
+        }
@@ -0,0 +1,90 @@
+from collections import namedtuple
+from threading import Lock
+
+# Feedback sent by coqtop about a state.  state_id is the id of that state as
+# an int, or None if the feedback has no state id.
+Processed = namedtuple('Processed', ['state_id'])
+Incomplete = namedtuple('Incomplete', ['state_id'])
+Complete = namedtuple('Complete', ['state_id'])
+AddedAxiom = namedtuple('AddedAxiom', ['state_id'])
+ProcessingIn = namedtuple('ProcessingIn', ['state_id', 'worker'])
+WorkerStatus = namedtuple('WorkerStatus', ['state_id', 'worker', 'status'])
+FileLoaded = namedtuple('FileLoaded', ['state_id', 'dirpath', 'filename'])
+FileDependency = namedtuple('FileDependency', ['state_id', 'source', 'filename'])
+# An error message about a state, with the location of the error in its
+# sentence, or False.  Errors in proofs that coqtop delegated to workers only
+# come this way.
+ErrorMessage = namedtuple('ErrorMessage', ['state_id', 'loc_s', 'loc_e'])
+# Any other kind of feedback, with the text of the strings it contains.
+Feedback = namedtuple('Feedback', ['state_id', 'kind', 'args'])
+# Not feedback: coqtop closed its output without being stopped, so it died,
+# with the given exit code, or None if it is not known.  state_id is None.
+Died = namedtuple('Died', ['state_id', 'code'])
+
+def arg(args, i):
+    return args[i] if i < len(args) else ''
+
+# For each kind of feedback_content, how to build its event from the state id
+# and the strings found in its content.
+DECODERS = {
+    'processed': lambda s, args: Processed(s),
+    'incomplete': lambda s, args: Incomplete(s),
+    'complete': lambda s, args: Complete(s),
+    'addedaxiom': lambda s, args: AddedAxiom(s),
+    'processingin': lambda s, args: ProcessingIn(s, arg(args, 0)),
+    'workerstatus': lambda s, args: WorkerStatus(s, arg(args, 0), arg(args, 1)),
+    'fileloaded': lambda s, args: FileLoaded(s, arg(args, 0), arg(args, 1)),
+    'filedependency': lambda s, args: FileDependency(s, arg(args, 0) if len(args) > 1 else None,
+        arg(args, len(args) - 1)),
+}
+
+def decode(kind, state_id, args):
+    """ Return the event for a feedback_content of the given kind. """
+    state_id = None if state_id is None else int(state_id)
+    decoder = DECODERS.get(kind)
+    if decoder is None:
+        return Feedback(state_id, kind, args)
+    return decoder(state_id, args)
+
+class EventBus:
+    """
+    Dispatcher of feedback events.  Callbacks are registered for a type of
+    event, either for every state or for a single state id, and are called in
+    the thread that publishes the event.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.everywhere = {}
+        # Callbacks for a single state: {state_id: {typ: [callback]}}.
+        self.routes = {}
+
+    def subscribe(self, typ, callback, state_id=None):
+        with self.lock:
+            if state_id is None:
+                self.everywhere.setdefault(typ, []).append(callback)
+            else:
+                self.routes.setdefault(state_id, {}).setdefault(typ, []).append(callback)
+
+    def unsubscribe(self, typ, callback, state_id=None):
+        with self.lock:
+            table = self.everywhere if state_id is None else self.routes.get(state_id, {})
+            callbacks = table.get(typ, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callbacks == [] and typ in table:
+                del table[typ]
+            if state_id is not None and table == {}:
+                self.routes.pop(state_id, None)
+
+    def forget(self, state_id):
+        """ Remove every callback registered for state_id. """
+        with self.lock:
+            self.routes.pop(state_id, None)
+
+    def publish(self, event):
+        typ = type(event)
+        with self.lock:
+            callbacks = list(self.everywhere.get(typ, []))
+            callbacks += self.routes.get(event.state_id, {}).get(typ, [])
+        for callback in callbacks:
+            callback(event)
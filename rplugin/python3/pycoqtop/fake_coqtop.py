@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+A stand-in for coqidetop, that speaks enough of the XML protocol to drive
+coquille without Coq: Init, Add, Goal, Observe, Edit_at and Query, with
+feedback, failures and the focus on a closed proof that Edit_at inside it
+gives.  It does not understand Coq at all: a proof is opened by sentences that
+start with Lemma, Theorem, Goal, etc. and closed by Qed, Defined or Admitted,
+and a sentence fails if it contains one of the configured strings.
+
+It is configured with a JSON object in the FAKE_COQTOP environment variable,
+whose keys are those of DEFAULTS.  Latencies are in seconds.  A sentence is
+only "executed" when the Goal that follows it is asked, like with async
+proofs, so that is when execution latency and interrupts happen.  Observe
+delegates the sentences of proofs to imaginary workers, as many as
+-async-proofs-j asks for: they take no time, their status is reported by
+feedback, and their failures by error messages after the answer.
+
+This file is run as a script, so it must not import anything from the package.
+"""
+import json
+import os
+import re
+import signal
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+DEFAULTS = {
+    # Time to answer any call, and to execute a sentence.
+    'latency': 0.0,
+    'exec_latency': 0.0,
+    # Sentences containing one of these strings take slow_latency to execute.
+    'slow_on': [],
+    'slow_latency': 10.0,
+    # Sentences containing one of these strings fail.
+    'fail_on': ['fail'],
+    # Sentences containing one of these strings fail when they are executed.
+    'exec_fail_on': [],
+    # State ids that are never given to a sentence, as if coqtop used them
+    # for something else.
+    'skip_ids': [],
+    # Whether Edit_at inside a closed proof only focuses on the proof, and
+    # keeps the states after it until the end of the proof is added again.
+    'focus': True,
+    # The process exits when it receives a sentence containing one of these.
+    'crash_on': [],
+    # Size of the answer to Goal: number of goals, of hypotheses per goal, of
+    # background goals, and number of characters of each term.
+    'goals': 1,
+    'hyps': 3,
+    'bg': 0,
+    'term_size': 40,
+    # Number of messages sent in answer to a Query, and their size.
+    'query_results': 1,
+    'query_size': 80,
+    'version': '8.9.1',
+}
+
+OPENERS = re.compile(r'\s*(Lemma|Theorem|Goal|Fact|Remark|Corollary|Proposition|Example|Definition|Instance)\b')
+CLOSERS = re.compile(r'\s*(Qed|Defined|Admitted|Abort)\b')
+
+class Interrupted(Exception):
+    pass
+
+class Failed(Exception):
+    pass
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+MARKUP = [
+    (re.compile(r'\b(forall|exists|fun)\b'), r'<constr.keyword>\1</constr.keyword>'),
+    (re.compile(r'\bnat\b'), r'<constr.reference>nat</constr.reference>'),
+]
+
+def richpp(text):
+    """ text with the markup coqtop adds to its keywords and references. """
+    text = escape(text)
+    for (regex, markup) in MARKUP:
+        text = regex.sub(markup, text)
+    return '<richpp><_>{}</_></richpp>'.format(text)
+
+def term(name, size):
+    return (name + ' : ' + 'forall n : nat, n + 0 = n /\\ ' * (size // 28 + 1))[:max(size, len(name))]
+
+class FakeCoqtop:
+    def __init__(self, config, out, workers=1):
+        self.config = config
+        self.out = out
+        self.workers = ['proofworker:{}'.format(i) for i in range(workers)]
+        self.next_id = 2
+        self.tip = 1
+        # State ids of the sentences added, in order, with their text and
+        # whether a proof is open after them.
+        self.states = [1]
+        self.sentences = {1: ''}
+        self.opened = {1: False}
+        self.parents = {}
+        # The proof focused by Edit_at: its first and last state, the tip of
+        # the document and the states after the proof.
+        self.focus = None
+        # States added since the last Goal.
+        self.pending = []
+        self.executing = False
+        # Set by an interrupt that came during a call, but outside of an
+        # execution, so that the execution that follows stops at once.
+        self.interrupted = False
+
+    def write(self, text):
+        self.out.write(text.encode('utf-8'))
+        self.out.flush()
+
+    def good(self, value):
+        self.write('<value val="good">{}</value>'.format(value))
+
+    def fail(self, message, loc=None, state_id=None):
+        """ Answer with a failure, whose state is the last valid state. """
+        loc = '' if loc is None else ' loc_s="{}" loc_e="{}"'.format(*loc)
+        self.write('<value val="fail"{}><state_id val="{}"/>{}</value>'.format(
+            loc, self.tip if state_id is None else state_id, richpp(message)))
+
+    def feedback(self, state_id, content):
+        self.write('<feedback object="state" route="0"><state_id val="{}"/>{}</feedback>'.format(
+            state_id, content))
+
+    def message(self, state_id, level, text, loc=None):
+        loc = '<option val="none"/>' if loc is None else \
+                '<option val="some"><loc start="{}" stop="{}"/></option>'.format(*loc)
+        self.feedback(state_id, '<feedback_content val="message"><message>' +
+                '<message_level val="{}"/>{}{}</message></feedback_content>'.format(
+                    level, loc, richpp(text)))
+
+    def matches(self, key, text):
+        return any(s in text for s in self.config[key])
+
+    def wait(self, delay):
+        """ Sleep for delay seconds, unless interrupted. """
+        if self.interrupted:
+            self.interrupted = False
+            raise Interrupted()
+        if delay <= 0:
+            return
+        self.executing = True
+        try:
+            time.sleep(delay)
+        finally:
+            self.executing = False
+
+    def interrupt(self, signum, frame):
+        if self.executing:
+            self.executing = False
+            raise Interrupted()
+        self.interrupted = True
+
+    def call(self, name, arg):
+        self.interrupted = False
+        if self.config['latency'] > 0:
+            time.sleep(self.config['latency'])
+        method = getattr(self, 'call' + name, None)
+        if method is None:
+            self.good('<unit/>')
+        else:
+            method(arg)
+
+    def workerStatus(self, worker, status):
+        self.feedback(1, '<feedback_content val="workerstatus"><pair><string>{}</string>'
+                '<string>{}</string></pair></feedback_content>'.format(worker, escape(status)))
+
+    def callInit(self, arg):
+        for worker in self.workers:
+            self.workerStatus(worker, 'Idle')
+        self.good('<state_id val="1"/>')
+
+    def callAdd(self, arg):
+        # <pair><pair><string>text</string><int/></pair><pair><state_id/><bool/></pair></pair>
+        text = arg[0][0].text or ''
+        parent = int(arg[1][0].get('val'))
+        if self.matches('crash_on', text):
+            os._exit(1)
+        if parent != self.tip:
+            self.fail('Invalid state {}.'.format(parent))
+            return
+        if self.matches('fail_on', text):
+            self.fail('Error: The reference fail was not found.', (0, len(text.encode('utf-8'))))
+            return
+        while self.next_id in self.config['skip_ids']:
+            self.next_id += 1
+        state_id = self.next_id
+        self.next_id += 1
+        opened = self.opened[self.tip]
+        if OPENERS.match(text):
+            opened = True
+        elif CLOSERS.match(text):
+            opened = False
+        self.states.append(state_id)
+        self.sentences[state_id] = text
+        self.opened[state_id] = opened
+        self.parents[state_id] = self.tip
+        self.pending.append(state_id)
+        self.tip = state_id
+        if self.focus is not None and not opened:
+            # The focused proof is closed again, go on after it.
+            (start, stop, tip, tail) = self.focus
+            self.focus = None
+            if tail != []:
+                self.parents[tail[0]] = state_id
+            self.states += tail
+            self.tip = tip
+            self.good('<pair><state_id val="{}"/><pair><union val="in_r"><state_id val="{}"/></union>'
+                    '<string></string></pair></pair>'.format(state_id, tip))
+            return
+        self.good('<pair><state_id val="{}"/><pair><union val="in_l"><unit/></union>'
+                '<string></string></pair></pair>'.format(state_id))
+
+    def execute(self, delegated=None):
+        """ Execute the sentences that were added since the last Goal.  If
+            delegated is a list, the sentences of proofs are not executed, but
+            added to it. """
+        while self.pending != []:
+            state_id = self.pending[0]
+            text = self.sentences[state_id]
+            if delegated is not None and self.opened[self.parents[state_id]]:
+                delegated.append(state_id)
+                self.pending.pop(0)
+                continue
+            self.feedback(state_id, '<feedback_content val="processingin"><string>master</string></feedback_content>')
+            if self.matches('slow_on', text):
+                self.wait(self.config['slow_latency'])
+            else:
+                self.wait(self.config['exec_latency'])
+            if self.matches('exec_fail_on', text):
+                raise Failed()
+            self.pending.pop(0)
+            self.feedback(state_id, '<feedback_content val="processed"/>')
+
+    def goal(self, i):
+        size = self.config['term_size']
+        hyps = ''.join(richpp(term('H{}'.format(j), size)) for j in range(self.config['hyps']))
+        return '<goal><string>{}</string><list>{}</list>{}</goal>'.format(i, hyps, richpp(term('', size)))
+
+    def safe(self):
+        """ The state before the first sentence that is not executed. """
+        if self.pending == []:
+            return self.tip
+        return self.states[self.states.index(self.pending[0]) - 1]
+
+    def callGoal(self, arg):
+        try:
+            self.execute()
+        except Interrupted:
+            self.fail('User interrupt.', state_id=self.safe())
+            return
+        except Failed:
+            self.fail('Error: Execution failed.', state_id=self.safe())
+            return
+        if not self.opened[self.tip]:
+            self.good('<option val="none"/>')
+            return
+        fg = ''.join(self.goal(i) for i in range(self.config['goals']))
+        bg = ''.join(self.goal(i) for i in range(self.config['bg']))
+        self.good('<option val="some"><goals><list>{}</list><list><pair><list>{}</list><list/></pair></list>'
+                '<list/><list/></goals></option>'.format(fg, bg))
+
+    def callObserve(self, arg):
+        delegated = []
+        try:
+            self.execute(delegated)
+        except Interrupted:
+            self.fail('User interrupt.', state_id=self.safe())
+            return
+        except Failed:
+            self.fail('Error: Execution failed.', state_id=self.safe())
+            return
+        self.good('<unit/>')
+        for (i, state_id) in enumerate(delegated):
+            text = self.sentences[state_id]
+            worker = self.workers[i % len(self.workers)]
+            self.workerStatus(worker, 'proof: {}'.format(text))
+            self.feedback(state_id, '<feedback_content val="processingin"><string>{}</string>'
+                    '</feedback_content>'.format(worker))
+            if self.matches('exec_fail_on', text):
+                self.message(state_id, 'error', 'Error: Execution failed.',
+                        (0, len(text.encode('utf-8'))))
+            else:
+                self.feedback(state_id, '<feedback_content val="processed"/>')
+            self.workerStatus(worker, 'Idle')
+
+    def forget(self, states):
+        for s in states:
+            del self.sentences[s]
+            del self.opened[s]
+            del self.parents[s]
+        self.pending = [s for s in self.pending if s in self.sentences]
+
+    def closing(self, i):
+        """ The index of the end of the proof that is open after the i-th
+            state, if it is closed, and the index of its start. """
+        if not self.opened[self.states[i]]:
+            return None
+        start = i
+        while start > 0 and self.opened[self.states[start - 1]]:
+            start -= 1
+        for j in range(i + 1, len(self.states)):
+            if not self.opened[self.states[j]]:
+                return (start, j)
+        return None
+
+    def callEdit_at(self, arg):
+        state_id = int(arg.get('val'))
+        if state_id not in self.states:
+            self.fail('Invalid state {}.'.format(state_id))
+            return
+        i = self.states.index(state_id)
+        if self.focus is not None and i < self.states.index(self.focus[0]):
+            # Going back before the focused proof forgets the states after it.
+            self.forget(self.focus[3])
+            self.focus = None
+        closing = self.closing(i) if self.focus is None and self.config['focus'] else None
+        if closing is not None:
+            (start, stop) = closing
+            tail = self.states[stop + 1:]
+            self.focus = (self.states[start], self.states[stop], self.states[-1], tail)
+            self.forget(self.states[i + 1:stop + 1])
+            del self.states[i + 1:]
+            # The states after the proof are kept as they are.
+            self.pending = [s for s in self.pending if s in self.states]
+            self.tip = state_id
+            self.good('<union val="in_r"><pair><state_id val="{}"/><pair><state_id val="{}"/>'
+                    '<state_id val="{}"/></pair></pair></union>'.format(*self.focus[:3]))
+            return
+        self.forget(self.states[i + 1:])
+        del self.states[i + 1:]
+        self.tip = state_id
+        self.good('<union val="in_l"><unit/></union>')
+
+    def callQuery(self, arg):
+        # 8.7 and later: <pair><route_id/><pair><string/><state_id/></pair></pair>
+        if arg[0].tag == 'route_id':
+            arg = arg[1]
+        text = arg[0].text or ''
+        if self.matches('fail_on', text):
+            self.fail('Error: The reference fail was not found.')
+            return
+        size = self.config['query_size']
+        for i in range(self.config['query_results']):
+            self.message(self.tip, 'notice', term('result{}'.format(i), size))
+        self.good('<unit/>')
+
+class Reader:
+    """ Target of the XML parser that calls the fake coqtop for each call. """
+    def __init__(self, coqtop):
+        self.coqtop = coqtop
+        self.builder = ET.TreeBuilder()
+        self.depth = 0
+
+    def start(self, tag, attributes):
+        self.depth += 1
+        if self.depth > 1:
+            self.builder.start(tag, attributes)
+
+    def end(self, tag):
+        self.depth -= 1
+        if self.depth == 0:
+            return
+        element = self.builder.end(tag)
+        if self.depth == 1:
+            self.builder = ET.TreeBuilder()
+            arg = element[0] if len(element) > 0 else None
+            self.coqtop.call(element.get('val'), arg)
+
+    def data(self, content):
+        if self.depth > 1:
+            self.builder.data(content)
+
+    def close(self):
+        pass
+
+def main(args):
+    config = dict(DEFAULTS)
+    config.update(json.loads(os.environ.get('FAKE_COQTOP', '{}')))
+    if '--print-version' in args:
+        print('{} compiled with OCaml 4.07.1'.format(config['version']))
+        return
+    workers = 1
+    for (option, value) in zip(args, args[1:]):
+        if option == '-async-proofs-j':
+            workers = max(int(value), 1)
+    coqtop = FakeCoqtop(config, sys.stdout.buffer, workers)
+    signal.signal(signal.SIGINT, coqtop.interrupt)
+    parser = ET.XMLParser(target=Reader(coqtop))
+    parser.feed('<Root>')
+    fd = sys.stdin.fileno()
+    while True:
+        try:
+            data = os.read(fd, 0x10000)
+        except InterruptedError:
+            continue
+        if data == b'':
+            break
+        parser.feed(data)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
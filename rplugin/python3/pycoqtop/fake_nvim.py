@@ -0,0 +1,94 @@
+"""
+A stand-in for the parts of the neovim API that the Actionner uses, so that
+it can be driven without neovim by the tests and the benchmarks.  Buffers are
+lists of lines that record their highlights, and calls made with async_call
+run in order in their own thread, like in the thread of nvim.  The changes of
+the buffer are followed like lua/coquille.lua does, see FakeVim.edit.
+"""
+import ast
+import queue
+import re
+import traceback
+from threading import Thread
+from types import SimpleNamespace
+
+class FakeBuffer(list):
+    def __init__(self, lines, name, number):
+        list.__init__(self, lines)
+        self.name = name
+        self.number = number
+        self.highlights = {}
+
+    def append(self, lines):
+        self.extend(lines)
+
+    def add_highlight(self, group, line, start, end, src_id=-1):
+        self.highlights.setdefault(src_id, []).append((group, line, start, end))
+        return src_id
+
+    def clear_highlight(self, src_id):
+        self.highlights.pop(src_id, None)
+
+    def update_highlights(self, src_id, hls, clear=False):
+        if clear:
+            self.highlights.pop(src_id, None)
+        self.highlights.setdefault(src_id, []).extend(hls)
+
+class FakeVim:
+    """
+    A neovim with a buffer of lines named name, and the Goals and Infos
+    panels as buffers 2 and 3.  variables are the g: variables.
+    """
+    def __init__(self, lines, name, variables={}):
+        self.buf = FakeBuffer(lines, name, 1)
+        self.buffers = [self.buf, FakeBuffer([], 'Goals', 2), FakeBuffer([], 'Infos', 3)]
+        self.current = SimpleNamespace(buffer=self.buf, window=SimpleNamespace(cursor=(1, 0)))
+        self.variables = dict(coquille_auto_move='false', **variables)
+        self.sources = 0
+        self.commands = []
+        self.changed = -1
+        # Exceptions raised by the calls, that nvim would show.
+        self.errors = []
+        self.calls = queue.Queue()
+        thread = Thread(target=self.run, name='nvim', daemon=True)
+        thread.start()
+
+    def run(self):
+        while True:
+            (fn, args) = self.calls.get()
+            try:
+                fn(*args)
+            except Exception:
+                self.errors.append(traceback.format_exc())
+            finally:
+                self.calls.task_done()
+
+    def async_call(self, fn, *args):
+        self.calls.put((fn, args))
+
+    def sync(self):
+        """ Wait until the calls made so far are done. """
+        self.calls.join()
+
+    def eval(self, expr):
+        m = re.match(r"get\(g:, '(\w+)', (.*)\)$", expr)
+        if m is not None:
+            return self.variables.get(m.group(1), ast.literal_eval(m.group(2)))
+        return self.variables[expr[2:]]
+
+    def command(self, cmd):
+        self.commands.append(cmd)
+
+    def new_highlight_source(self):
+        self.sources += 1
+        return self.sources
+
+    def exec_lua(self, code, *args):
+        if 'take' in code:
+            (line, self.changed) = (self.changed, -1)
+            return line
+
+    def edit(self, line, lines):
+        """ Replace the lines of the buffer from line with lines. """
+        self.buf[line:] = lines
+        self.changed = line if self.changed < 0 else min(self.changed, line)
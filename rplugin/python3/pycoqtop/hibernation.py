@@ -0,0 +1,35 @@
+"""
+Limit on the number of sessions whose coqtop process is alive.  Each session
+keeps a coqtop process and its threads until it is stopped, so once more than
+size sessions are live, the least recently used ones that are idle hibernate:
+their process is stopped, and their valid dots kept as a journal, which is
+replayed in a new process when the session is used again (see journal.py).
+"""
+
+class LiveSessions:
+    def __init__(self, size=0):
+        # Maximum number of live sessions, or 0 for no limit.
+        self.size = size
+        # Names of the live sessions, the least recently used first.
+        self.live = []
+
+    def use(self, name, idle):
+        """ Record that the session name is used, which makes it live, and
+            return the names of the sessions that must hibernate.  idle(name)
+            tells whether a session can hibernate now. """
+        self.forget(name)
+        self.live.append(name)
+        sleeping = []
+        for other in self.live[:-1]:
+            if self.size <= 0 or len(self.live) - len(sleeping) <= self.size:
+                break
+            if idle(other):
+                sleeping.append(other)
+        for other in sleeping:
+            self.live.remove(other)
+        return sleeping
+
+    def forget(self, name):
+        """ Record that the session name hibernated or was stopped. """
+        if name in self.live:
+            self.live.remove(name)
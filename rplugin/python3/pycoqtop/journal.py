@@ -0,0 +1,26 @@
+"""
+Replay of the sentences that a session executed, its journal, in a new coqtop
+process.  The journal is the list of valid dots of the session, whose content
+is sent again in a single pass: the goals are not asked after each sentence,
+and the sentences are executed by a single Observe, which does not wait for
+the proofs that coqtop delegates to its workers.
+"""
+from .parser import Parser
+
+def unit_type(content):
+    """ Return the type of the unit whose text is content, as Parser finds it
+        in a buffer. """
+    return Parser(content.split('\n')).getUnit(0, 0)[3]
+
+def replay(ct, contents):
+    """ Send the sentences of contents to ct, and execute them.  Return whether
+        a call executes them: comments need none. """
+    comments = True
+    for content in contents:
+        typ = unit_type(content)
+        ct.advance(content, typ)
+        comments = comments and typ == 'comment'
+    if not comments:
+        ct.observe(True)
+        ct.goals()
+    return not comments
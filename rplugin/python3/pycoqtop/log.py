@@ -0,0 +1,88 @@
+import logging
+import logging.handlers
+from collections import deque
+from threading import Lock
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+# Above every other level, so that nothing is logged.
+OFF = logging.CRITICAL + 10
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR, 'off': OFF}
+
+class Log:
+    """
+    Leveled log of a session.  Messages below the current level are discarded
+    before they are formatted, so their arguments are only turned into strings
+    when the message is kept.  Kept messages go to a ring buffer of fixed size,
+    that CoqDebug flushes, and optionally to a rotating file.
+    """
+    def __init__(self, level=OFF, size=2000):
+        self.level = level
+        self.lock = Lock()
+        self.ring = deque(maxlen=size)
+        self.dropped = 0
+        self.sink = None
+
+    def setLevel(self, level):
+        if isinstance(level, str):
+            level = LEVELS[level.lower()]
+        self.level = level
+
+    def setFile(self, filename, max_bytes=1 << 20, backups=3):
+        """ Also write messages to filename, which is rotated when it reaches
+            max_bytes.  An empty filename removes the file sink. """
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+        if filename:
+            self.sink = logging.handlers.RotatingFileHandler(filename,
+                    maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+            self.sink.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, msg, *args):
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        with self.lock:
+            if len(self.ring) == self.ring.maxlen:
+                self.dropped += 1
+            self.ring.append(msg)
+        if self.sink is not None:
+            self.sink.handle(logging.LogRecord('coquille', level, '', 0,
+                msg.rstrip('\n'), None, None))
+
+    def debug(self, msg, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        if INFO >= self.level:
+            self.log(INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        if WARNING >= self.level:
+            self.log(WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        if ERROR >= self.level:
+            self.log(ERROR, msg, *args)
+
+    def flush(self):
+        """ Return and forget the messages of the ring buffer. """
+        with self.lock:
+            m = ''.join(self.ring)
+            if self.dropped > 0:
+                m = '[{} older messages dropped]\n'.format(self.dropped) + m
+            self.ring.clear()
+            self.dropped = 0
+        return m
+
+    def close(self):
+        self.setFile(None)
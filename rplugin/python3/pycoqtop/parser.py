@@ -1,3 +1,35 @@
+import re
+
+# States of the scanner inside a unit.
+COMMAND = 0
+COMMENT = 1
+STRING = 2
+
+# For each state, the only tokens that can make the scanner change state.
+# Everything else is skipped by the regular expression engine.
+TOKENS = [
+    re.compile(r'\(\*|"|\.(?=[ \t\n]|$)'),
+    re.compile(r'\(\*|\*\)'),
+    re.compile(r'"'),
+]
+
+# Transitions of the scanner: (state, token) -> (next state, comment depth
+# change).  A next state of None means the unit is complete.  When the depth
+# of comments goes back to 0, the scanner returns to the state it was in before
+# the first comment.
+TRANSITIONS = {
+    (COMMAND, '(*'): (COMMENT, 1),
+    (COMMAND, '"'):  (STRING, 0),
+    (COMMAND, '.'):  (None, 0),
+    (COMMENT, '(*'): (COMMENT, 1),
+    (COMMENT, '*)'): (COMMENT, -1),
+    (STRING, '"'):   (COMMAND, 0),
+}
+
+WS = re.compile(r'[ \t\n]*')
+DIGITS = re.compile(r'[0-9]+')
+IDENT = re.compile("[a-zA-Z_\u0080-\U0010ffff][a-zA-Z0-9_'\u0080-\U0010ffff]*")
+
 class Parser:
     """
     Parser for coq sentences.
@@ -8,227 +40,181 @@ class Parser:
     bullet-selector: ([0-9]+ | "[" WS ident WS "]") WS ":"
     command: (comment | string | [^\\.] | "." not followed by WS)* "."
     string: "\\"" [^\\"]* "\\""
+
+    The scanner never backtracks over characters: positions are only compared
+    and the content of a unit is sliced from the buffer once it is complete.
+    Lines are fetched from the buffer a few at a time, so that a neovim buffer
+    is not queried for every character.
     """
+    # Number of lines fetched at once from the buffer.
+    chunk = 64
+
     def __init__(self, buf):
         self.buf = buf
         self.line = 0
         self.col = 0
         self.content = ""
         self.type = None
+        self.first = 0
+        self.lines = []
 
     def getUnit(self, line, col, encoding='utf-8'):
         """ Return a list of the line, column, content and type of unit that was
             matched, starting a line and col. """
-        self.line = line
-        self.col = col
-        self.content = ""
-        self.parseUnit()
+        self.first = line
+        self.lines = []
+        (self.line, self.col, self.type) = self.scanUnit(line, col)
+        self.content = self.between(line, col, self.line, self.col)
         return [self.line, self.col, self.content, self.type]
 
-    def peekNext(self):
-        """ Return the next character, but do not advance """
-        line = self.buf[self.line]
-        if len(line) > self.col:
-            return line[self.col]
-        elif len(self.buf) > self.line:
-            return '\n'
-        else:
-            raise Exception('No more data')
-    
-    def getNext(self):
-        """ Return the next character, and advance """
-        line = self.buf[self.line]
-        if len(line) > self.col:
-            char = line[self.col]
-            self.col += 1
-        elif len(self.buf) > self.line:
-            self.col = 0
-            self.line += 1
-            char = '\n'
-        else:
-            raise Exception('No more data')
-
-        self.content += char
-        return char
-
-    def withBacktrack(self, fun, args=None):
-        """ Run fun, a function with args (or no argument by default).  Save the
-            current state (line, col and content) and restore it if the function
-            fails with an exception. """
-        state = [self.line, self.col, self.content]
-        try:
-            if args is None:
-                fun()
-            else:
-                fun(*args)
-            return True
-        except:
-            self.line = state[0]
-            self.col = state[1]
-            self.content = state[2]
-        return False
-    
-    def parseUnit(self):
-        """ unit: WS (comment | bullet | command) """
-        self.parseWS()
-        if self.peekNext() == '(' and self.withBacktrack(self.parseComment):
-            return
-        if self.withBacktrack(self.parseBullet):
-            return
-        return self.parseCommand()
-
-    def parseWS(self):
-        """ WS: (" " | "\\n" | "\\t")* """
-        char = self.peekNext()
-        if char in [' ', '\n', '\t']:
-            self.getNext()
-            self.parseWS()
-
-    def parseComment(self, gotParenthesis = 0):
-        """ comment: "(*" (comment | [^*] | "*" not followed by ")")* "*)" """
-        if ((gotParenthesis > 0) or self.getNext() == '(') and \
-                ((gotParenthesis > 1) or self.getNext() == '*'):
-            while self.parseCommentInside():
-                continue
-        else:
-            raise Exception('Not a comment')
-        self.type = 'comment'
-
-    def parseCommentInside(self):
-        nextchr = self.getborring(['(', '*'])
-        if nextchr == '(' and self.withBacktrack(self.parseComment, [1]):
-            return True
-        if nextchr != '*':
-            return True
-        if self.peekNext() == ')':
-            self.getNext()
-            return False
-        return True
-    
-    def parseBullet(self):
-        """ bullet: (bullet-selector? WS "{") | "-"+ | "+"+ | "*"+ | "}" """
-        if self.withBacktrack(self.parseBrace):
-            self.type = 'bullet'
-            return
-        num = 0
-        while self.peekNext() == '-':
-            num += 1
-            self.getNext()
-        if num > 0:
-            self.type = 'bullet'
-            return
-        while self.peekNext() == '+':
-            num += 1
-            self.getNext()
-        if num > 0:
-            self.type = 'bullet'
-            return
-        while self.peekNext() == '*':
-            num += 1
-            self.getNext()
-        if num > 0:
-            self.type = 'bullet'
-            return
-        if self.getNext() == '}':
-            self.type = 'bullet'
-            return
-        raise Exception('Not a bullet')
-    
-    def parseBrace(self):
-        self.withBacktrack(self.parseBulletSelector)
-        self.parseWS()
-        if self.getNext() == '{':
-            return
-        raise Exception('No opening curly brace')
-
-    def parseBulletSelector(self):
-        """ bullet-selector: ([0-9]+ | "[" WS ident WS "]") WS ":" """
-        if self.withBacktrack(self.parseBulletSelectorNum):
-            self.parseWS()
-            if self.getNext() == ':':
+    def units(self, line=0, col=0, end=None):
+        """ Yield a tuple of the start, stop, content and type of each unit from
+            line and col to the end of the buffer, in a single pass.  start and
+            stop are (line, col) pairs.  If end is a (line, col) pair, stop
+            before the first unit that ends after it. """
+        self.first = line
+        self.lines = []
+        while True:
+            try:
+                (eline, ecol, typ) = self.scanUnit(line, col)
+            except:
                 return
-            else:
-                raise Exception('not a numeric goal selector')
-        if self.getNext() == '[':
-            self.parseWS()
-            self.parseIdent()
-            self.parseWS()
-            if self.getNext() == ']':
-                self.parseWS()
-                if self.getNext() == ':':
-                    return
-            raise Exception('not a named goal selector')
-        raise Exception('not a goal selector at all')
-
-    def parseBulletSelectorNum(self):
-        n = False
-        while self.peekNext() in ['0','1','2','3','4','5','6','7','8','9']:
-            self.getNext()
-            n = True
-        if not n:
-            raise Exception('not a numeric goal selector')
-
-    def parseIdent(self):
-        """
-        first_letter      ::=  a..z ∣ A..Z ∣ _ ∣ unicode-letter
-        subsequent_letter ::=  a..z ∣ A..Z ∣ 0..9 ∣ _ ∣ ' ∣ unicode-letter ∣ unicode-id-part
-        ident             ::=  first_letter[subsequent_letter…subsequent_letter]
-        """
-        nextchr = self.getNext()
-        if nextchr == '_' or ord(nextchr) > 127 or \
-                (ord(nextchr) >= ord('a') and ord(nextchr) <= ord('z')) or \
-                (ord(nextchr) >= ord('A') and ord(nextchr) <= ord('Z')):
-            while True:
-                nextchr = self.peekNext()
-                if nextchr == '_' or nextchr == "'" or ord(nextchr) > 127 or \
-                        (ord(nextchr) >= ord('0') and ord(nextchr) <= ord('9')) or \
-                        (ord(nextchr) >= ord('a') and ord(nextchr) <= ord('z')) or \
-                        (ord(nextchr) >= ord('A') and ord(nextchr) <= ord('Z')):
-                    self.getNext()
-                    continue
+            if end is not None and (eline, ecol) > end:
                 return
-        raise Exception('not an ident')
+            content = self.between(line, col, eline, ecol)
+            yield ((line, col), (eline, ecol), content, typ)
+            (line, col) = (eline, ecol)
+            if line - self.first >= self.chunk:
+                # Forget the lines that were completely read
+                del self.lines[:line - self.first]
+                self.first = line
+
+    def getLine(self, line):
+        """ Return the text of a line, without its end of line character. """
+        i = line - self.first
+        if i >= len(self.lines):
+            self.lines.extend(self.buf[self.first + len(self.lines):line + self.chunk])
+            if i >= len(self.lines):
+                raise Exception('No more data')
+        return self.lines[i]
+
+    def between(self, line, col, eline, ecol):
+        """ Return the text between two positions that were already scanned. """
+        if line == eline:
+            return self.getLine(line)[col:ecol]
+        lines = self.lines[line - self.first + 1:eline - self.first]
+        return '\n'.join([self.getLine(line)[col:]] + lines +
+                [self.getLine(eline)[:ecol]])
 
-    def parseCommand(self):
-        """ command: (comment | string | [^\\.] | "." not followed by WS)* "." """
+    def skipWS(self, line, col):
+        """ WS: (" " | "\\n" | "\\t")*
+            Return the position of the first character that is not a space. """
         while True:
-            nextchr = self.getborring(['(*', '.', '"'])
-            if nextchr == '*':
-                self.parseComment(2)
-                continue
-            if nextchr == '"':
-                while self.getborring(['"']) != '"':
-                    continue
-                continue
-            if nextchr != '.':
+            text = self.getLine(line)
+            col = WS.match(text, col).end()
+            if col < len(text):
+                return (line, col)
+            line += 1
+            col = 0
+
+    def scanUnit(self, line, col):
+        """ unit: WS (comment | bullet | command)
+            Return the line and column of the end of the unit, and its type. """
+        (line, col) = self.skipWS(line, col)
+        text = self.getLine(line)
+        char = text[col]
+        if char == '(' and text.startswith('(*', col):
+            (line, col) = self.scan(line, col + 2, COMMENT, None)
+            return (line, col, 'comment')
+        end = self.scanBullet(line, col, text, char)
+        if end is not None:
+            return (end[0], end[1], 'bullet')
+        (line, col) = self.scan(line, col, COMMAND, COMMAND)
+        return (line, col, 'command')
+
+    def scan(self, line, col, state, outer):
+        """ Run the scanner from a position and a state until the end of the
+            current unit.  outer is the state to go back to after a comment. """
+        depth = 1 if state == COMMENT else 0
+        # Positions just after the opening parenthesis of the nested comments
+        # that are still open.  If the buffer ends inside one of them, it was
+        # not a comment after all, and we read it again as plain text.
+        nested = []
+        text = self.getLine(line)
+        while True:
+            m = TOKENS[state].search(text, col)
+            if m is None:
+                line += 1
+                col = 0
+                try:
+                    text = self.getLine(line)
+                except:
+                    if nested == []:
+                        raise
+                    (line, col) = nested.pop()
+                    depth -= 1
+                    text = self.getLine(line)
                 continue
-            if self.peekNext() in [' ', '\t', '\n']:
-                break
-        self.type = 'command'
-
-    def parseStringRest(self):
-        while self.getborring(['"']) != '"':
-            continue
-        return True
-
-    def getborring(self, interestings):
-        """ Traverse a line until the first interesting character, from interestings,
-            a list of characters. When the firt interesting character is found,
-            return it and advance to it, as if it were read with getNext. """
-        line = self.buf[self.line][self.col:]
-        col = len(line)
-
-        for i in map((lambda x: (line.find(x), len(x))), interestings):
-            (pos, sz) = i
-            if pos < col and pos >= 0:
-                col = pos + sz - 1
-
-        if col >= len(line):
-            self.col = 0
-            self.line += 1
-            self.content += line + '\n'
-            return '\n'
+            (state, delta) = TRANSITIONS[(state, m.group())]
+            if delta > 0 and depth > 0:
+                nested.append((line, m.start() + 1))
+            elif delta < 0 and nested != []:
+                nested.pop()
+            col = m.end()
+            depth += delta
+            if state == COMMENT and depth == 0:
+                state = outer
+            if state is None:
+                return (line, col)
+
+    def scanBullet(self, line, col, text, char):
+        """ bullet: (bullet-selector? WS "{") | "-"+ | "+"+ | "*"+ | "}"
+            Return the end of the bullet, or None if this is not a bullet. """
+        if char == '{' or char == '}':
+            return (line, col + 1)
+        if char in '-+*':
+            end = col + 1
+            while end < len(text) and text[end] == char:
+                end += 1
+            return (line, end)
+        if not (char == '[' or char.isdigit()):
+            return None
+        try:
+            pos = self.scanSelector(line, col, text)
+            if pos is None:
+                return None
+            (line, col) = self.skipWS(pos[0], pos[1])
+        except:
+            # The buffer ends in what could be a bullet, but a command might
+            # still be complete there.
+            return None
+        if self.getLine(line)[col] == '{':
+            return (line, col + 1)
+        return None
+
+    def scanSelector(self, line, col, text):
+        """ bullet-selector: ([0-9]+ | "[" WS ident WS "]") WS ":"
+            Return the end of the goal selector, or None if there is none. """
+        m = DIGITS.match(text, col)
+        if m is not None:
+            (line, col) = self.skipWS(line, m.end())
+        elif text[col] == '[':
+            (line, col) = self.skipWS(line, col + 1)
+            m = IDENT.match(self.getLine(line), col)
+            if m is None:
+                return None
+            (line, col) = self.skipWS(line, m.end())
+            if self.getLine(line)[col] != ']':
+                return None
+            (line, col) = self.skipWS(line, col + 1)
         else:
-            self.col += col+1
-            self.content += line[:col+1]
-            return line[col]
+            return None
+        if self.getLine(line)[col] == ':':
+            return (line, col + 1)
+        return None
+
+def file_units(filename, encoding='utf-8'):
+    """ Yield the units of a file on disk, like Parser.units. """
+    with open(filename, encoding=encoding) as f:
+        lines = f.read().split('\n')
+    return Parser(lines).units()
@@ -0,0 +1,179 @@
+"""
+Pool of coqtop sessions started in advance, so that launching coquille in a
+new window takes over a session that is already initialized, and that
+already ran the imports at the start of the file.
+
+Sessions are kept for each coqtop binary and arguments, including the options
+of its workers.  When a session is
+launched, the pool starts a new one with the same binary and arguments, which
+runs the prelude of the file that was launched: the imports and options at
+its start.  Files of a project tend to start with the same prelude, and a
+session is adopted as long as the file starts like its prelude: the part of
+the prelude that the file does not start with is undone.
+"""
+import re
+from threading import Event, Lock
+
+from .coqapi import Err
+from .coqtop import new_coqtop
+
+# Sentences that belong to the prelude of a file.
+PRELUDE = re.compile(r'\s*((From\s+\S+\s+)?(Require|Import|Export)|Set|Unset|((Local|Global)\s+)?Open\s+Scope|'
+        r'Declare\s+ML\s+Module|Add\s+(Rec\s+)?LoadPath)\b')
+
+class WarmPrinter:
+    """ Printer of a session of the pool, until it is taken.  The session is
+        ready when the answer to its last call is received. """
+    def __init__(self, last):
+        self.last = last
+        self.ready = Event()
+        self.failed = False
+
+    def debug(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
+        pass
+
+    def parseMessage(self, msg, msgtype):
+        if isinstance(msg, Err):
+            self.failed = True
+            self.ready.set()
+        elif msgtype == self.last:
+            self.ready.set()
+
+    def addInfo(self, info):
+        pass
+
+    def flushInfo(self):
+        pass
+
+    def addGoal(self, goal):
+        pass
+
+class WarmSession:
+    """ A session of the pool, and the sentences it ran. """
+    def __init__(self, ct, printer, prelude):
+        self.ct = ct
+        self.printer = printer
+        self.prelude = prelude
+
+    def ready(self):
+        return self.printer.ready.is_set()
+
+    def failed(self):
+        return self.printer.failed
+
+def key(parser, options=None):
+    return (parser.getCoqtop(), tuple(options or []), tuple(parser.getArgs()))
+
+def adopt(ct, prelude, header):
+    """
+    Make ct, a session that ran the sentences of prelude, go back to the
+    longest start of header that it ran, and return the dots of that part of
+    header.  header is a list of (dot, type) pairs, where dots are (line, col,
+    content) triples.  Comments of header are skipped, and spaces around
+    sentences ignored, when comparing it with prelude.
+    """
+    after = (ct.states + [ct.state_id])[-len(prelude):] if prelude != [] else []
+    states = ct.states[:1]
+    state = ct.root_state
+    dots = []
+    used = 0
+    for (dot, typ) in header:
+        if typ != 'comment':
+            if used >= len(prelude) or prelude[used].strip() != dot[2].strip():
+                break
+        states.append(state)
+        if typ != 'comment':
+            state = after[used]
+            used += 1
+        dots.append(dot)
+    ct.states = states
+    ct.state_id = state
+    ct.tip = state
+    if used < len(prelude):
+        ct.rewind(0)
+    return dots
+
+class SessionPool:
+    """
+    Sessions started in advance, size of them at most for each coqtop binary
+    and arguments.  Sessions are started by fill, and handed over by take.
+    """
+    def __init__(self, size=1):
+        self.size = size
+        self.lock = Lock()
+        self.sessions = {}
+        # Preludes that failed, which are not run again.
+        self.failed = set()
+
+    def take(self, parser, printer, options=None):
+        """ Return a ready session for the binary and arguments of parser, and
+            the options of async_options, and the sentences it ran, or None if
+            there is none.  printer becomes the printer of the session. """
+        dead = []
+        taken = None
+        with self.lock:
+            sessions = self.sessions.get(key(parser, options), [])
+            for session in list(sessions):
+                if session.failed():
+                    self.failed.add(tuple(session.prelude))
+                    sessions.remove(session)
+                    dead.append(session)
+                elif session.ready() and taken is None:
+                    sessions.remove(session)
+                    taken = session
+        for session in dead:
+            session.ct.kill()
+        if taken is None:
+            return None
+        taken.ct.setPrinter(printer)
+        return (taken.ct, taken.prelude)
+
+    def fill(self, parser, prelude, options=None):
+        """ Start sessions for the binary and arguments of parser, and the
+            options of async_options, until there are size of them, that run
+            the sentences of prelude. """
+        if tuple(prelude) in self.failed:
+            prelude = []
+        while True:
+            with self.lock:
+                sessions = self.sessions.setdefault(key(parser, options), [])
+                if len(sessions) >= self.size:
+                    return
+            printer = WarmPrinter('addgoal' if prelude != [] else 'init')
+            ct = new_coqtop(printer, parser)
+            if options is not None:
+                ct.setAsyncOptions(options)
+            if not ct.restart():
+                return
+            for sentence in prelude:
+                ct.advance(sentence, 'command')
+            if prelude != []:
+                ct.goals(True, True)
+            with self.lock:
+                self.sessions.setdefault(key(parser, options), []).append(WarmSession(ct, printer, list(prelude)))
+
+    def count(self):
+        """ Return the number of sessions of the pool. """
+        with self.lock:
+            return sum(len(l) for l in self.sessions.values())
+
+    def shrink(self, count):
+        """ Stop sessions until at most count are left. """
+        with self.lock:
+            sessions = [s for l in self.sessions.values() for s in l]
+            stopped = sessions[:max(len(sessions) - max(count, 0), 0)]
+            for l in self.sessions.values():
+                l[:] = [s for s in l if s not in stopped]
+        for session in stopped:
+            session.ct.kill()
+
+    def close(self):
+        """ Stop every session of the pool. """
+        with self.lock:
+            sessions = [s for l in self.sessions.values() for s in l]
+            self.sessions = {}
+        for session in sessions:
+            session.ct.kill()
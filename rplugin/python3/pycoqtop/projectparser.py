@@ -22,10 +22,17 @@ class Version:
         return '.'.join(self.currentVersion)
 
 class ProjectParser():
+    # Versions of the binaries that were already asked for it, so that
+    # starting a session does not run them again.
+    versions = {}
+
     def __init__(self, filename):
         self.R = []
         self.Q = []
         self.I = []
+        # Options given to coqtop with -arg.
+        self.args = []
+        self.files = []
         self.coqc   = 'coqc'
         self.coqdep = 'coqdep'
         self.coqtop = 'coqtop'
@@ -59,14 +66,23 @@ class ProjectParser():
             pass
 
     def parseLine(self, sline):
+        if len(sline) > 0 and sline[0].endswith('.v'):
+            self.files.append(self.absolute(sline[0]))
+            self.parseLine(sline[1:])
+            return
+
         if len(sline) < 2:
             return
 
+        if sline[0] == '-arg':
+            (value, rest) = self.quoted(sline[1:])
+            self.args += value.split()
+            self.parseLine(rest)
+            return
+
         # Try to run coq with absolute paths as configuration, if filenames are
         # relative to _CoqProject.
-        directory = sline[1].strip("\"'")
-        if directory[0] != "/":
-            directory = self.dirname + "/" + directory
+        directory = self.absolute(sline[1])
 
         if sline[0] == '-R':
             self.R.append((directory, sline[2].strip("\"'")))
@@ -80,6 +96,26 @@ class ProjectParser():
         if sline[1] == "=":
             self.variables[sline[0]] = ' '.join(sline[2:]).strip('"\'')
 
+    def quoted(self, words):
+        """ Return the value that starts words, which may be quoted and contain
+            spaces, and the words that follow it. """
+        quote = words[0][0]
+        if quote not in "\"'":
+            return (words[0], words[1:])
+        for i in range(len(words)):
+            if (i > 0 or len(words[0]) > 1) and words[i].endswith(quote):
+                return (' '.join(words[:i + 1])[1:-1], words[i + 1:])
+        return (' '.join(words)[1:], [])
+
+    def absolute(self, filename):
+        filename = filename.strip("\"'")
+        if filename[0] != "/":
+            filename = self.dirname + "/" + filename
+        return filename
+
+    def getFiles(self):
+        return self.files
+
     def getI(self):
         return self.I
 
@@ -99,6 +135,18 @@ class ProjectParser():
         return self.coqtop
 
     def version(self):
+        version = ProjectParser.versions.get(self.coqtop)
+        if version is None:
+            version = self.askVersion()
+        ProjectParser.versions[self.coqtop] = version
+        if version.isatleast89():
+            self.coqtop = 'coqidetop'
+            if 'COQBIN' in self.variables:
+                self.coqtop = self.variables['COQBIN'] + '/coqidetop'
+            ProjectParser.versions[self.coqtop] = version
+        return version
+
+    def askVersion(self):
         options = [self.coqtop, '--print-version']
         try:
             if os.name == 'nt':
@@ -112,10 +160,7 @@ class ProjectParser():
             data = os.read(fd, 0x4000).decode("utf-8")
             version = data.split(' ')[0]
             version = Version(version.split('.'))
-            if version.isatleast89():
-                self.coqtop = 'coqidetop'
-                if 'COQBIN' in self.variables:
-                    self.coqtop = self.variables['COQBIN'] + '/coqidetop'
+            coqtop.wait()
         except:
             raise CoqtopNotFoundException(self.coqtop)
         return version
@@ -133,4 +178,4 @@ class ProjectParser():
             options.append('-R')
             options.append(r[0])
             options.append(r[1])
-        return options
+        return options + self.args
@@ -0,0 +1,159 @@
+"""
+Recording of the exchanges with coqtop, and their replay.
+
+A recording is a file that starts with MAGIC, followed by records: a kind
+byte, the time in seconds since the start of the session as a double, the
+length of the data as an unsigned int, and the data.  Records of kind CALL
+hold the type of a call (add, goal, ...), a NUL byte and the bytes sent to
+coqtop.  Records of kind READ hold the bytes read from coqtop at once.  Files
+whose name ends with .gz are compressed.
+
+Set g:coquille_record_file to record every session started afterwards, and
+see bench_replay.py to replay a recording.
+"""
+import gzip
+import struct
+import time
+from collections import deque
+from threading import Lock
+
+from .coqapi import Ok
+from .coqxml import CoqHandler, new_parser
+from .events import EventBus
+
+MAGIC = b'coquille-record 1\n'
+HEADER = struct.Struct('<cdI')
+CALL = b'c'
+READ = b'r'
+
+def open_file(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+class Recorder:
+    """ Writer of the exchanges of a session with coqtop.  It is called from
+        the threads that send and read, so records are written under a lock. """
+    # Seconds between two flushes of the file, so that it stays usable when
+    # the session is stuck and killed, without a flush for every record.
+    flush_interval = 1.0
+
+    def __init__(self, filename):
+        self.lock = Lock()
+        self.file = open_file(filename, 'wb')
+        self.file.write(MAGIC)
+        self.start = time.monotonic()
+        self.flushed = self.start
+
+    def write(self, kind, data):
+        with self.lock:
+            if self.file is None:
+                return
+            now = time.monotonic()
+            self.file.write(HEADER.pack(kind, now - self.start, len(data)))
+            self.file.write(data)
+            if now - self.flushed >= self.flush_interval:
+                self.file.flush()
+                self.flushed = now
+
+    def call(self, calltype, data):
+        self.write(CALL, (calltype or '').encode('utf-8') + b'\0' + data)
+
+    def read(self, data):
+        self.write(READ, data)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def records(filename):
+    """ Yield the (kind, time, data) records of a recording.  The data of a
+        call is a (calltype, bytes) pair. """
+    with open_file(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a coquille recording'.format(filename))
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            (kind, t, size) = HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                # The session was killed while writing this record.
+                return
+            if kind == CALL:
+                (calltype, data) = data.split(b'\0', 1)
+                data = (calltype.decode('utf-8'), data)
+            yield (kind, t, data)
+
+class ReplayState:
+    """
+    State manager of a replay, in place of CoqTop.  Answers are matched with
+    the recorded calls in order, and passed to the printer with the type of
+    their call, like CoqTop does for the Actionner.  Answers that the session
+    dropped after a failure are passed on too.
+    """
+    def __init__(self, printer):
+        self.printer = printer
+        self.calls = deque()
+        self.states = []
+        self.state_id = None
+        self.events = EventBus()
+
+    def expect(self, calltype, data):
+        """ Record that a call of type calltype was sent, as the bytes data. """
+        self.calls.append(calltype)
+
+    def pull_event(self, event):
+        calltype = self.calls.popleft() if self.calls else None
+        self.printer.parseMessage(event, calltype)
+        if isinstance(event, Ok) and event.state_id is not None:
+            self.states.append(self.state_id)
+            self.state_id = event.state_id
+
+    def feedback(self, event):
+        self.events.publish(event)
+
+    def interupt(self):
+        pass
+
+    def silent_interupt(self):
+        pass
+
+class Replayer:
+    """
+    Replay of a recording: the bytes read from coqtop are fed to a CoqHandler
+    whose printer is printer, which has the callbacks of the Actionner
+    (parseMessage, addInfo, flushInfo, addGoal, debug and error).  With a
+    speed, records are replayed at their recorded time divided by speed,
+    otherwise as fast as possible.  state replaces the ReplayState of printer.
+    """
+    def __init__(self, filename, printer, speed=None, state=None):
+        self.filename = filename
+        self.printer = printer
+        self.speed = speed
+        self.state = state or ReplayState(printer)
+        self.handler = CoqHandler(self.state, printer)
+        self.calls = 0
+        self.bytes = 0
+        self.duration = 0
+
+    def run(self):
+        """ Replay the whole recording, and return the time it took. """
+        parser = new_parser(self.handler)
+        start = time.perf_counter()
+        for (kind, t, data) in records(self.filename):
+            if self.speed:
+                delay = start + t / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.duration = t
+            if kind == CALL:
+                self.calls += 1
+                self.state.expect(*data)
+            elif kind == READ:
+                self.bytes += len(data)
+                parser.feed(data)
+        return time.perf_counter() - start
@@ -0,0 +1,87 @@
+from .xmltype import RichPP
+
+# Highlight group of the text of each richpp tag.  Other tags only give the
+# layout of the text and are ignored.
+GROUPS = {
+    'constr.keyword': 'CoqKeyword',
+    'tactic.keyword': 'CoqKeyword',
+    'module.keyword': 'CoqKeyword',
+    'constr.variable': 'CoqVariable',
+    'constr.reference': 'CoqConstant',
+    'constr.path': 'CoqConstant',
+    'module.definition': 'CoqConstant',
+    'constr.notation': 'CoqNotation',
+    'constr.type': 'CoqType',
+    'message.warning': 'CoqMessageWarning',
+    'message.error': 'CoqMessageError',
+}
+
+def decode(xml):
+    """
+    Return the text of a richpp element and the spans of its markup, as a
+    RichPP.  Spans are (start, end, group) triples of offsets in the text,
+    sorted by start, with enclosing spans before the spans they contain.  The
+    tree is walked once, without recursion, so that deep terms do not hit the
+    recursion limit.
+    """
+    parts = []
+    spans = []
+    length = 0
+    # Elements to enter, and (element, index of its span) pairs to leave.
+    todo = [xml]
+    while todo != []:
+        item = todo.pop()
+        if isinstance(item, tuple):
+            (element, i) = item
+            if i is not None:
+                (start, group) = spans[i]
+                spans[i] = (start, length, group)
+            if element.tail and element is not xml:
+                parts.append(element.tail)
+                length += len(element.tail)
+            continue
+        group = GROUPS.get(item.tag)
+        i = None
+        if group is not None:
+            i = len(spans)
+            spans.append((length, group))
+        if item.text:
+            parts.append(item.text)
+            length += len(item.text)
+        todo.append((item, i))
+        todo.extend(reversed(item))
+    return RichPP(''.join(parts), spans)
+
+def byte_col(line, col):
+    if line.isascii():
+        return col
+    return len(line[:col].encode('utf-8'))
+
+def highlights(rich, first):
+    """
+    Return the highlights of the spans of rich, whose text is shown from line
+    first of a buffer, as (group, line, start, end) items for
+    Buffer.update_highlights, with byte columns.  Spans that cover several
+    lines are cut at the end of each line.
+    """
+    lines = rich.text.split('\n')
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line) + 1)
+    hls = []
+    i = 0
+    for (start, end, group) in rich.spans:
+        if end <= start:
+            continue
+        # Spans are sorted by start, so lines only go forward.
+        while starts[i + 1] <= start:
+            i += 1
+        j = i
+        while j < len(lines) and starts[j] < end:
+            line = lines[j]
+            s = max(start, starts[j]) - starts[j]
+            e = min(end, starts[j] + len(line)) - starts[j]
+            if e > s:
+                hls.append((group, first + j, byte_col(line, s), byte_col(line, e)))
+            j += 1
+    return hls
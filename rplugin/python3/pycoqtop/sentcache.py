@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from threading import Thread
+
+from .parser import Parser
+
+# One letter per sentence type in cache files.
+TYPES = {'command': 'c', 'comment': 'k', 'bullet': 'b'}
+NAMES = {letter: name for (name, letter) in TYPES.items()}
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'coquille', 'sentences')
+
+def digest(lines):
+    """ Return the hash of the content of a list of lines. """
+    return hashlib.sha1('\n'.join(lines).encode('utf-8', 'surrogatepass')).hexdigest()
+
+def read_lines(filename):
+    """ Return the lines of a file, as neovim shows them in a buffer. """
+    with open(filename, encoding='utf-8', errors='surrogateescape') as f:
+        text = f.read()
+    if text.endswith('\n'):
+        text = text[:-1]
+    return text.split('\n')
+
+def entry_path(directory, filename):
+    name = hashlib.sha1(os.path.abspath(filename).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(directory, name + '.json')
+
+def load_entry(directory, filename):
+    try:
+        with open(entry_path(directory, filename)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def index_file(directory, filename):
+    """ Parse a file and write the stops and types of its sentences to the cache,
+        unless the cache is already up to date.  This runs in a background
+        process, see SentenceCache.fill. """
+    try:
+        lines = read_lines(filename)
+    except OSError:
+        return False
+    h = digest(lines)
+    entry = load_entry(directory, filename)
+    if entry is not None and entry.get('hash') == h:
+        return False
+    stops = []
+    types = []
+    for (_, stop, _, typ) in Parser(lines).units():
+        stops.extend(stop)
+        types.append(TYPES[typ])
+    entry = {'file': os.path.abspath(filename), 'hash': h, 'stops': stops, 'types': ''.join(types)}
+    path = entry_path(directory, filename)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(entry, f, separators=(',', ':'))
+    os.replace(tmp, path)
+    return True
+
+class SentenceCache:
+    """
+    On-disk cache of the sentence boundaries of the files of a project, keyed by
+    file name and content hash, so that the sentence index of a file that did
+    not change since it was last parsed is available as soon as it is opened.
+    Only the end and type of sentences are stored: their content is sliced from
+    the buffer when the cache is loaded.
+    """
+    # Projects whose files were already submitted in this session.
+    filled = set()
+
+    def __init__(self, directory=None):
+        self.directory = directory or cache_dir()
+
+    def fill(self, filenames, workers=None):
+        """ Parse files that changed since they were cached in workers
+            background processes, and return the processes without waiting
+            for them.  They are new python interpreters rather than forks of
+            the plugin host, whose threads may hold locks when it forks. """
+        if filenames == []:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        workers = min(workers or os.cpu_count() or 1, len(filenames))
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+        return [subprocess.Popen([sys.executable, '-m', 'pycoqtop.sentcache', self.directory]
+                    + filenames[i::workers], env=env, stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                for i in range(workers)]
+
+    def fillProject(self, parser, workers=None):
+        """ Fill the cache with every file of a _CoqProject, once per session,
+            from a background thread that waits for the processes. """
+        files = tuple(parser.getFiles())
+        if files in SentenceCache.filled:
+            return None
+        SentenceCache.filled.add(files)
+        def run():
+            try:
+                for process in self.fill(list(files), workers):
+                    process.wait()
+            except OSError:
+                pass
+        thread = Thread(target=run, name='SentenceCache', daemon=True)
+        thread.start()
+        return thread
+
+    def lookup(self, filename, lines):
+        """ Return the stops and types of the sentences of lines if the cache
+            has them for that content, or None. """
+        entry = load_entry(self.directory, filename)
+        if entry is None or entry.get('hash') != digest(lines):
+            return None
+        flat = entry['stops']
+        stops = list(zip(flat[0::2], flat[1::2]))
+        return (stops, [NAMES[t] for t in entry['types']])
+
+    def preload(self, index, filename):
+        """ Fill an empty sentence index from the cache, and return whether the
+            content of the buffer was found in it. """
+        if filename == "":
+            return False
+        lines = index.buf[:]
+        found = self.lookup(filename, lines)
+        if found is None:
+            return False
+        index.preload(lines, *found)
+        return True
+
+if __name__ == '__main__':
+    for filename in sys.argv[2:]:
+        index_file(sys.argv[1], filename)
@@ -0,0 +1,97 @@
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from .parser import Parser
+
+class SentenceIndex:
+    """
+    Sorted index of the sentences of a buffer.  Sentences are discovered
+    lazily, from the beginning of the buffer, only when they are needed, and
+    they are forgotten from the first modified line when the buffer changes.
+    Positions are (line, col) pairs, so lookups are simple bisections.
+    """
+    def __init__(self, buf):
+        self.buf = buf
+        self.lock = Lock()
+        self.starts = []
+        self.stops = []
+        self.contents = []
+        self.types = []
+
+    def __len__(self):
+        return len(self.stops)
+
+    def end(self):
+        """ Return the position up to which the buffer is indexed. """
+        return self.stops[-1] if self.stops != [] else (0, 0)
+
+    def invalidate(self, line):
+        """ Forget every sentence that ends on or after line. """
+        with self.lock:
+            n = bisect_left(self.stops, (line, 0))
+            del self.starts[n:]
+            del self.stops[n:]
+            del self.contents[n:]
+            del self.types[n:]
+
+    def preload(self, lines, stops, types):
+        """ Fill an empty index with sentences found earlier in the same text,
+            given the stop and type of each one. """
+        with self.lock:
+            start = (0, 0)
+            for (stop, typ) in zip(stops, types):
+                (line, col) = start
+                (eline, ecol) = stop
+                if line == eline:
+                    content = lines[line][col:ecol]
+                else:
+                    content = '\n'.join([lines[line][col:]] + lines[line + 1:eline] +
+                            [lines[eline][:ecol]])
+                self.starts.append(start)
+                self.stops.append(stop)
+                self.contents.append(content)
+                self.types.append(typ)
+                start = stop
+
+    def extend(self, pos=None):
+        """ Index the sentences that follow the indexed part of the buffer, up to
+            the first one that ends after pos, or only the next one if pos is
+            None.  Return False if there is no complete sentence left. """
+        found = False
+        for (start, stop, content, typ) in Parser(self.buf).units(*self.end()):
+            self.starts.append(start)
+            self.stops.append(stop)
+            self.contents.append(content)
+            self.types.append(typ)
+            found = True
+            if pos is None or stop > pos:
+                break
+        return found
+
+    def find(self, line, col):
+        """ Return the number of sentences that end before (line, col).  This is
+            also the index of the sentence containing that position, if any. """
+        with self.lock:
+            if self.end() <= (line, col):
+                self.extend((line, col))
+            return bisect_right(self.stops, (line, col))
+
+    def get(self, i):
+        """ Return the start, stop, content and type of the i-th sentence. """
+        with self.lock:
+            return (self.starts[i], self.stops[i], self.contents[i], self.types[i])
+
+    def unit(self, line, col):
+        """ Return a list of the line, column, content and type of the sentence
+            starting at line and col, like Parser.getUnit.  Raise an exception
+            if there is no complete sentence there. """
+        with self.lock:
+            if self.end() < (line, col):
+                self.extend((line, col))
+            i = bisect_left(self.starts, (line, col))
+            if i < len(self.starts) and self.starts[i] == (line, col):
+                return [self.stops[i][0], self.stops[i][1], self.contents[i], self.types[i]]
+            if (line, col) == self.end() and self.extend():
+                return [self.stops[-1][0], self.stops[-1][1], self.contents[-1], self.types[-1]]
+        # Not a sentence boundary we know about, parse it without remembering it.
+        return Parser(self.buf).getUnit(line, col)
@@ -0,0 +1,272 @@
+import json
+import os
+import tempfile
+import time
+
+from . import Actionner
+from .bench_session import FakeSession
+from .fake_nvim import FakeVim
+from .record import CALL, records
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+class FakeActionner:
+    """ An Actionner for a buffer of the given lines, with the fake coqtop
+        configured by config, and the settings of coquille in variables. """
+    def __init__(self, lines, variables={}, **config):
+        self.session = FakeSession(**config)
+        self.vim = FakeVim(lines, os.path.join(self.session.directory, 'a.v'), variables)
+        self.a = Actionner(self.vim)
+        self.a.goal_buf = 2
+        self.a.info_buf = 3
+        assert self.a.restart()
+        self.a.start()
+
+    def act(self, typ, args=[]):
+        self.a.add_action(typ, args)
+
+    def to_end(self):
+        """ Check the whole buffer, and wait until it is checked. """
+        self.vim.current.window.cursor = (len(self.vim.buf), len(self.vim.buf[-1]))
+        self.act('cursor')
+        self.idle()
+
+    def idle(self):
+        """ Wait until nothing runs, and the calls to nvim are done. """
+        wait_for(lambda: self.a.idle() and self.a.ct.messenger.is_empty())
+        self.vim.sync()
+        assert self.vim.errors == []
+
+    def valid(self):
+        return [msg.strip() for (line, col, msg) in self.a.valid_dots]
+
+    def close(self):
+        self.a.stop()
+        self.a.join()
+        self.session.close()
+
+PROOFS = ['Lemma a : True.', 'Proof.', 'auto.', 'Qed.', 'Lemma b : True.', 'Proof.', 'auto.', 'Qed.']
+
+def test_modified_far_from_cursor():
+    # A substitution leaves the cursor on its last line, far below the
+    # first line it changed.
+    f = FakeActionner(PROOFS)
+    try:
+        f.to_end()
+        assert f.valid() == PROOFS
+        f.vim.edit(4, ['Lemma b : False.', 'Proof.', 'auto.', 'Qed.'])
+        f.act('modified')
+        f.idle()
+        assert f.valid() == PROOFS[:4]
+        f.vim.edit(0, ['Lemma c : True.'] + PROOFS[1:])
+        f.vim.current.window.cursor = (8, 0)
+        f.act('modified')
+        f.idle()
+        assert f.valid() == []
+    finally:
+        f.close()
+
+def test_modified_nothing():
+    f = FakeActionner(PROOFS)
+    try:
+        f.to_end()
+        f.act('modified')
+        f.idle()
+        assert f.valid() == PROOFS
+    finally:
+        f.close()
+
+def test_markup():
+    # Terms with markup are no longer highlighted by the syntax of the
+    # panels, once for each panel.
+    f = FakeActionner(PROOFS[:3], goals=2)
+    try:
+        f.to_end()
+        f.act('query', ['Search nat.'])
+        f.idle()
+        f.act('query', ['Search bool.'])
+        f.idle()
+        assert any(f.vim.buffers[1].highlights.values())
+        assert any(f.vim.buffers[2].highlights.values())
+        reloads = [c for c in f.vim.commands if 'coquille_richpp' in c]
+        assert len(reloads) == 2
+        assert 'setbufvar(2,' in reloads[0] and 'setbufvar(3,' in reloads[1]
+    finally:
+        f.close()
+
+def test_hibernate():
+    f = FakeActionner(PROOFS)
+    try:
+        f.to_end()
+        f.act('hibernate')
+        f.idle()
+        assert f.a.hibernated
+        assert f.a.ct.coqtop is None
+        assert f.valid() == PROOFS
+        # Changes only forget the dots after them, without waking it up.
+        f.a.recoveries = 2
+        f.vim.edit(6, ['trivial.', 'Qed.'])
+        f.act('modified')
+        f.idle()
+        assert f.a.hibernated
+        assert f.a.ct.coqtop is None
+        assert f.valid() == PROOFS[:6]
+        assert f.a.recoveries == 2
+        # The kept dots are replayed when it is used again.
+        f.to_end()
+        assert not f.a.hibernated
+        assert f.valid() == PROOFS[:6] + ['trivial.', 'Qed.']
+        assert f.a.recoveries == 0
+    finally:
+        f.close()
+
+def test_hibernate_busy():
+    # A session that is still checking does not hibernate.
+    f = FakeActionner(PROOFS, exec_latency=0.2)
+    try:
+        f.vim.current.window.cursor = (len(PROOFS), len(PROOFS[-1]))
+        f.act('cursor')
+        f.act('hibernate')
+        f.idle()
+        assert not f.a.hibernated
+        assert f.valid() == PROOFS
+    finally:
+        f.close()
+
+def infos(f):
+    return [line.decode('utf-8') for line in f.vim.buffers[2]]
+
+def test_recover():
+    f = FakeActionner(PROOFS, exec_latency=0.02)
+    try:
+        f.to_end()
+        f.a.progress_interval = 0
+        process = f.a.ct.coqtop
+        process.kill()
+        # The valid dots are checked again, and the progress is shown.
+        wait_for(lambda: any('/8 valid sentences checked again' in l for l in infos(f)))
+        wait_for(lambda: f.a.recoveries == 1)
+        f.idle()
+        assert f.a.ct.coqtop is not process
+        assert f.valid() == PROOFS
+        assert infos(f) == ['coqtop died (exit code -9), 8/8 valid sentences checked again']
+        assert f.a.recovering is None
+        # The session works as before.
+        f.vim.edit(8, ['Lemma c : True.', 'Proof.', 'auto.', 'Qed.'])
+        f.act('modified')
+        f.to_end()
+        assert f.valid() == PROOFS + ['Lemma c : True.', 'Proof.', 'auto.', 'Qed.']
+        assert f.a.recoveries == 0
+    finally:
+        f.close()
+
+def test_recover_limit():
+    f = FakeActionner(PROOFS)
+    try:
+        f.to_end()
+        # The new processes die on a valid sentence, while it is replayed.
+        os.environ['FAKE_COQTOP'] = json.dumps({'crash_on': ['Lemma b']})
+        f.a.ct.coqtop.kill()
+        wait_for(lambda: not f.a.is_alive())
+        assert f.a.recoveries == f.a.max_recoveries + 1
+        assert 'coqtop died 4 times in a row' in str(f.a.exception)
+        # Each time, every valid dot was replayed.
+        assert infos(f) == ['coqtop died (exit code 1), checking the 8 valid sentences again']
+    finally:
+        f.close()
+
+LEMMA_C = ['Lemma c : True.', 'Proof.', 'auto.', 'Qed.']
+
+def sent(filename, sentence):
+    """ The number of times sentence was added in the session recorded to
+        filename. """
+    return sum(1 for (kind, t, data) in records(filename)
+               if kind == CALL and data[0] == 'add' and sentence.encode('utf-8') in data[1])
+
+def test_closed_proof():
+    # Editing inside a closed proof only checks that proof again.
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'session.rec')
+        f = FakeActionner(PROOFS + LEMMA_C, {'coquille_record_file': filename})
+        try:
+            f.to_end()
+            kept = f.a.valid_dots[4:]
+            f.vim.edit(2, ['trivial.'] + PROOFS[3:] + LEMMA_C)
+            f.act('modified')
+            f.idle()
+            assert f.valid() == PROOFS[:2]
+            assert f.a.tail_dots == kept
+            f.to_end()
+            assert f.valid() == PROOFS[:2] + ['trivial.'] + PROOFS[3:] + LEMMA_C
+            assert f.a.valid_dots[4:] == kept
+            assert f.a.tail_dots is None and f.a.joining is None
+        finally:
+            f.close()
+        assert sent(filename, 'trivial.') == 1
+        assert sent(filename, 'Lemma b') == 1
+        assert sent(filename, 'Lemma c') == 1
+
+def test_closed_proof_tail_changed():
+    # The dots after the proof that changed meanwhile are checked again
+    # once it is closed, and the ones before them are kept.
+    f = FakeActionner(PROOFS + LEMMA_C)
+    try:
+        f.to_end()
+        f.vim.edit(2, ['trivial.'] + PROOFS[3:] + LEMMA_C)
+        f.act('modified')
+        f.idle()
+        f.vim.edit(8, ['Lemma d : True.', 'Proof.', 'auto.', 'Qed.'])
+        f.act('modified')
+        f.idle()
+        assert [msg.strip() for (line, col, msg) in f.a.tail_dots] == PROOFS[4:]
+        f.to_end()
+        assert f.valid() == PROOFS[:2] + ['trivial.'] + PROOFS[3:] + [
+                'Lemma d : True.', 'Proof.', 'auto.', 'Qed.']
+        assert f.a.tail_dots is None and f.a.joining is None
+    finally:
+        f.close()
+
+def test_closed_proof_beyond():
+    # The dots queued after the end of the proof are sent once the dots
+    # after it are put back.
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'session.rec')
+        f = FakeActionner(PROOFS + LEMMA_C, {'coquille_record_file': filename})
+        try:
+            f.vim.current.window.cursor = (len(PROOFS), len(PROOFS[-1]))
+            f.act('cursor')
+            f.idle()
+            assert f.valid() == PROOFS
+            f.vim.edit(2, ['trivial.'] + PROOFS[3:] + LEMMA_C)
+            f.act('modified')
+            f.to_end()
+            assert f.valid() == PROOFS[:2] + ['trivial.'] + PROOFS[3:] + LEMMA_C
+            assert f.a.tail_dots is None and f.a.joining is None
+        finally:
+            f.close()
+        assert sent(filename, 'Lemma b') == 1
+        assert sent(filename, 'Lemma c') == 1
+
+def test_closed_proof_failure():
+    # When the end of the proof fails, the dots after it stay kept until it
+    # is closed.
+    f = FakeActionner(PROOFS)
+    try:
+        f.to_end()
+        kept = f.a.valid_dots[4:]
+        f.vim.edit(3, ['Qed fail.'] + PROOFS[4:])
+        f.act('modified')
+        f.to_end()
+        assert f.valid() == PROOFS[:3]
+        assert f.a.tail_dots == kept and f.a.joining is None
+        f.vim.edit(3, PROOFS[3:])
+        f.act('modified')
+        f.to_end()
+        assert f.valid() == PROOFS
+        assert f.a.valid_dots[4:] == kept
+    finally:
+        f.close()
@@ -0,0 +1,51 @@
+import os
+import pytest
+from .bench_parser import run, load_baseline
+
+# A benchmark fails when its score is this many times its baseline.  Set
+# COQUILLE_BENCH_TOLERANCE to a larger value on a busy machine.
+TOLERANCE = float(os.environ.get('COQUILLE_BENCH_TOLERANCE', '2'))
+
+# Scores of the recursive descent parser that the scanner replaced, on the
+# same corpora.  The scanner is accepted when it is SPEEDUP times faster: the
+# per-character work is done by regular expressions, and what is left is the
+# python cost of each sentence and each line.
+OLD_SCORES = {
+    'nested_comments': 5.16,
+    'long_strings': 1.56,
+    'bullets': 12.99,
+    'large_file': 13.44,
+}
+SPEEDUP = 1.4
+
+# The best score of a few runs is compared, as a single run can be slowed down
+# by the rest of the machine.
+RUNS = 3
+
+SENTENCES = {
+    'nested_comments': 4000,
+    'long_strings': 5000,
+    'bullets': 60003,
+    'large_file': 77774,
+}
+
+# Timings depend on the load of the machine, so they are only checked when
+# asked for.
+@pytest.mark.skipif(os.environ.get('COQUILLE_BENCH', '') == '',
+        reason='set COQUILLE_BENCH=1 to compare the parser with its baseline')
+def test_parser_benchmarks():
+    baseline = load_baseline()
+    results = run()
+    for _ in range(RUNS - 1):
+        for (name, report) in run().items():
+            if report['score'] < results[name]['score']:
+                results[name] = report
+    for (name, report) in results.items():
+        assert report['sentences'] == SENTENCES[name]
+        assert report['score'] * SPEEDUP <= OLD_SCORES[name], \
+            '{} is not {}x faster than the old parser: {:.2f} > {:.2f}'.format(
+                name, SPEEDUP, report['score'], OLD_SCORES[name] / SPEEDUP)
+        if name in baseline:
+            assert report['score'] <= baseline[name] * TOLERANCE, \
+                '{} is slower than its baseline: {:.2f} > {:.2f}'.format(
+                    name, report['score'], baseline[name])
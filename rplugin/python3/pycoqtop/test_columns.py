@@ -0,0 +1,43 @@
+from .columns import ColumnIndex
+
+fakebuffer = [
+"Lemma a: forall x, x ∈ ∅ -> False.",
+"Proof.",
+"  intros x H. (* ⊥ *) destruct H.",
+"Qed."
+        ]
+
+def test_byte_col():
+    idx = ColumnIndex(fakebuffer)
+    assert idx.byteCol(1, 3) == 3
+    assert idx.byteCol(0, 21) == 21
+    assert idx.byteCol(0, 22) == 24
+    assert idx.byteCol(0, 24) == 28
+    assert idx.byteCol(0, len(fakebuffer[0])) == len(fakebuffer[0].encode('utf-8'))
+    assert idx.byteLen(2) == len(fakebuffer[2].encode('utf-8'))
+
+def test_char_col():
+    idx = ColumnIndex(fakebuffer)
+    for line in range(len(fakebuffer)):
+        for col in range(len(fakebuffer[line]) + 1):
+            assert idx.charCol(line, idx.byteCol(line, col)) == col
+
+def test_locate():
+    idx = ColumnIndex(fakebuffer)
+    text = "\n".join(fakebuffer).encode('utf-8')
+    # Offsets from the end of "Proof."
+    start = len("\n".join(fakebuffer[:2]).encode('utf-8'))
+    for offset in range(len(text) - start):
+        (line, bcol) = idx.locate(1, 6, offset)
+        prefix = text[:start + offset].split(b"\n")
+        assert (line, bcol) == (len(prefix) - 1, len(prefix[-1]))
+
+def test_invalidate():
+    buf = list(fakebuffer)
+    idx = ColumnIndex(buf)
+    assert idx.byteCol(3, 4) == 4
+    buf[2] = "  ⊥⊥⊥"
+    idx.invalidate(2)
+    assert idx.byteCol(2, 3) == 5
+    assert idx.locate(2, 0, 11) == (2, 11)
+    assert idx.locate(2, 0, 14) == (3, 2)
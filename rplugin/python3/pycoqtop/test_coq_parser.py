@@ -1,4 +1,4 @@
-from .parser import Parser
+from .parser import Parser, file_units
 
 fakebuffer = [
 "Ltac name_goal name :=  (* test. *) refine ?[name].",
@@ -49,3 +49,34 @@ def test_command():
 
 def test_str():
     assert_command("Definition a := \"abc. def. \".")
+
+def test_long_whitespace():
+    buf = [""] * 5000 + ["   " * 1000 + "Qed."]
+    p = Parser(buf)
+    assert p.getUnit(0,0) == [5000, 3004, "\n" * 5000 + "   " * 1000 + "Qed.", 'command']
+
+def test_unclosed_nested_comment():
+    # A nested comment that is never closed is read as plain text
+    assert Parser(["(* a (*) b."]).getUnit(0,0) == [0, 8, "(* a (*)", 'comment']
+    assert Parser(["(* a (* b *) *) c."]).getUnit(0,0) == [0, 15, "(* a (* b *) *)", 'comment']
+
+def test_units():
+    units = list(Parser(fakebuffer).units())
+    assert len(units) == 10
+    assert units[0] == ((0, 0), (0, len(fakebuffer[0])), fakebuffer[0], 'command')
+    assert units[1] == ((0, len(fakebuffer[0])), (1, len(fakebuffer[1])), "\n" + fakebuffer[1], 'comment')
+    assert units[5][1:] == ((8, 2), "\n" + "\n".join(fakebuffer[5:8]) + "\n {", 'bullet')
+    for (unit, next) in zip(units, units[1:]):
+        assert unit[1] == next[0]
+
+def test_units_range():
+    units = list(Parser(fakebuffer).units(2, 0, (4, 0)))
+    assert [u[2] for u in units] == [fakebuffer[2], "\n" + fakebuffer[3]]
+    # An unfinished unit is never returned
+    assert list(Parser(["Lemma a: True.", "Proof"]).units()) == \
+            [((0, 0), (0, 14), "Lemma a: True.", 'command')]
+
+def test_file_units(tmpdir):
+    f = tmpdir.join("a.v")
+    f.write("\n".join(fakebuffer) + "\n")
+    assert list(file_units(str(f))) == list(Parser(fakebuffer).units())
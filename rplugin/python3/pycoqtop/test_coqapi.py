@@ -0,0 +1,39 @@
+import random
+import xml.etree.ElementTree as ET
+from .coqapi import API, INIT, GOAL, ADD, QUERY, QUERY86, EDIT_AT, OBSERVE
+from .xmltype import *
+
+ALPHABET = 'ab <>&"\'\n\r\t.;()*é⊕∀\U0001d54a\ud800'
+
+def random_string(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 30)))
+
+def test_templates():
+    api = API()
+    assert INIT.render() == api.get_init_msg()
+    assert GOAL.render() == api.get_call_msg('Goal', ())
+    rng = random.Random(42)
+    for _ in range(2000):
+        s = random_string(rng)
+        sid = StateId(rng.randint(0, 100000))
+        assert ADD.render(s, sid) == api.get_call_msg('Add', ((s, -1), (sid, True)))
+        assert QUERY.render(s, sid) == api.get_call_msg('Query', (RouteId(0), (s, sid)))
+        assert QUERY86.render(s, sid) == api.get_call_msg('Query', (s, sid))
+        assert EDIT_AT.render(sid) == api.get_call_msg('Edit_at', sid)
+        assert OBSERVE.render(sid) == api.get_call_msg('Observe', sid)
+
+def test_parse_response():
+    api = API()
+    def parse(value):
+        return api.parse_response(ET.fromstring('<coq>' + value + '</coq>'))
+    edit = parse('<value val="good"><union val="in_r"><pair><state_id val="3"/>'
+            '<pair><state_id val="6"/><state_id val="9"/></pair></pair></union></value>')
+    assert edit.state_id is None and [s.id for s in edit.focus] == [3, 6, 9]
+    join = parse('<value val="good"><pair><state_id val="10"/><pair><union val="in_r">'
+            '<state_id val="9"/></union><string></string></pair></pair></value>')
+    assert (join.state_id.id, join.tip.id) == (10, 9)
+    add = parse('<value val="good"><pair><state_id val="11"/><pair><union val="in_l"><unit/></union>'
+            '<string></string></pair></pair></value>')
+    assert (add.state_id.id, add.tip) == (11, None)
+    undo = parse('<value val="good"><union val="in_l"><unit/></union></value>')
+    assert (undo.state_id, undo.focus) == (None, None)
@@ -0,0 +1,177 @@
+import os
+import xml.etree.ElementTree as ET
+from .coqxml import CoqParser, CoqHandler
+from .events import EventBus, Processed, WorkerStatus, ProcessingIn, Feedback, ErrorMessage
+
+class FakeProcess:
+    def __init__(self):
+        (r, w) = os.pipe()
+        self.stdout = os.fdopen(r, 'rb')
+        self.out = os.fdopen(w, 'wb')
+
+    def write(self, data):
+        self.out.write(data)
+        self.out.flush()
+
+class FakeManager:
+    def __init__(self):
+        self.events = []
+        self.feedback_events = []
+        self.dead = []
+
+    def pull_event(self, event):
+        self.events.append(event)
+
+    def feedback(self, event):
+        self.feedback_events.append(event)
+
+    def died(self, process):
+        self.dead.append(process)
+
+class FakePrinter:
+    def __init__(self):
+        self.info = []
+        self.goals = []
+
+    def debug(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
+        pass
+
+    def addInfo(self, info):
+        self.info.append(info)
+
+    def flushInfo(self):
+        pass
+
+    def addGoal(self, goal):
+        self.goals.append(goal)
+
+def handle(data):
+    manager = FakeManager()
+    printer = FakePrinter()
+    parser = ET.XMLParser(target=CoqHandler(manager, printer))
+    parser.feed('<Root>' + data)
+    return (manager, printer)
+
+def test_read():
+    process = FakeProcess()
+    manager = FakeManager()
+    parser = CoqParser(process, manager, FakePrinter())
+    parser.start()
+    process.write(b'<value val="good"><state_id val="2"/></value>' +
+            b'<feedback object="state" route="0"><state_id val="2"/>' +
+            b'<feedback_content val="processed"/></feedback>')
+    process.write(b'<value val="good"><state_id val="3"/></value>')
+    process.out.close()
+    parser.join(5)
+    assert not parser.is_alive()
+    assert [str(e.state_id.id) for e in manager.events] == ['2', '3']
+    # coqtop closed its output on its own.
+    assert manager.dead == [process]
+    stats = parser.stats()
+    assert stats['messages'] == 3
+    assert stats['bytes'] > 100
+
+def test_stop():
+    process = FakeProcess()
+    manager = FakeManager()
+    parser = CoqParser(process, manager, FakePrinter())
+    parser.start()
+    parser.stop()
+    parser.join(5)
+    assert not parser.is_alive()
+    assert manager.dead == []
+    # Stopping twice is harmless
+    parser.stop()
+    process.out.close()
+
+def test_goals():
+    (manager, printer) = handle('<value val="good"><option val="some"><goals>' +
+            '<list><goal><string>3</string><list>' +
+            '<richpp><_><constr.variable>n</constr.variable> : nat</_></richpp>' +
+            '<richpp><_>H : n = 0</_></richpp></list>' +
+            '<richpp><_>n + 0 = <constr.notation>n</constr.notation></_></richpp></goal></list>' +
+            '<list><pair><list><goal><string>4</string><list/><richpp>True</richpp></goal></list>' +
+            '<list><goal><string>5</string><list/><richpp>False</richpp></goal></list></pair></list>' +
+            '<list><goal><string>6</string><list/><richpp>?x = 1</richpp></goal></list>' +
+            '<list/></goals></option></value>')
+    [goals] = printer.goals
+    assert len(goals.fg) == 1
+    assert goals.fg[0].id == '3'
+    assert goals.fg[0].hyp == ['n : nat', 'H : n = 0']
+    assert goals.fg[0].ccl == 'n + 0 = n'
+    assert goals.fg[0].rich(0) == ('n : nat', [(0, 1, 'CoqVariable')])
+    assert goals.fg[0].rich(1) == ('H : n = 0', [])
+    assert goals.fg[0].rich(2) == ('n + 0 = n', [(8, 9, 'CoqNotation')])
+    assert [g.id for g in goals.bg] == ['4', '5']
+    assert goals.bg[1].ccl == 'False'
+    assert goals.bg[1].hyp == []
+    assert goals.shelved[0].force() == ('6', [], '?x = 1')
+    assert goals.given_up == []
+    assert len(manager.events) == 1
+
+def test_messages():
+    (manager, printer) = handle('<feedback object="state" route="0"><state_id val="5"/>' +
+            '<feedback_content val="message"><message><message_level val="notice"/>' +
+            '<option val="none"/><richpp><_>plus_n_O: <constr.keyword>forall</constr.keyword> <b>n</b></_></richpp></message>' +
+            '</feedback_content></feedback>' +
+            '<message><message_level val="error"/><richpp>old</richpp></message>' +
+            '<value val="fail" loc_s="2" loc_e="5"><state_id val="4"/>' +
+            '<richpp><_>Error: bad</_></richpp></value>')
+    assert [i.text for i in printer.info] == ['plus_n_O: forall n', 'old', 'Error: bad']
+    assert printer.info[0].spans == [(10, 16, 'CoqKeyword')]
+    [err] = manager.events
+    assert (err.loc_s, err.loc_e) == (2, 5)
+
+def test_focus():
+    (manager, printer) = handle('<value val="good"><union val="in_r"><pair><state_id val="3"/>' +
+            '<pair><state_id val="6"/><state_id val="9"/></pair></pair></union></value>' +
+            '<value val="good"><pair><state_id val="10"/><pair><union val="in_r"><state_id val="9"/></union>' +
+            '<string></string></pair></pair></value>' +
+            '<value val="good"><pair><state_id val="11"/><pair><union val="in_l"><unit/></union>' +
+            '<string></string></pair></pair></value>' +
+            '<value val="good"><union val="in_l"><unit/></union></value>')
+    [edit, join, add, undo] = manager.events
+    assert edit.state_id is None and [s.id for s in edit.focus] == [3, 6, 9]
+    assert (join.state_id.id, join.tip.id, join.focus) == (10, 9, None)
+    assert (add.state_id.id, add.tip) == (11, None)
+    assert (undo.state_id, undo.tip, undo.focus) == (None, None, None)
+
+def test_feedback():
+    (manager, printer) = handle('<feedback object="state" route="0"><state_id val="7"/>' +
+            '<feedback_content val="processed"/></feedback>' +
+            '<feedback object="state" route="0"><state_id val="8"/>' +
+            '<feedback_content val="workerstatus"><pair><string>proofworker:0</string>' +
+            '<string>Idle</string></pair></feedback_content></feedback>' +
+            '<feedback object="state" route="0"><state_id val="8"/>' +
+            '<feedback_content val="processingin"><string>master</string></feedback_content></feedback>' +
+            '<feedback object="state" route="0"><state_id val="9"/>' +
+            '<feedback_content val="custom"><option val="none"/><string>x</string>' +
+            '<string>y</string></feedback_content></feedback>' +
+            '<feedback object="state" route="0"><state_id val="10"/>' +
+            '<feedback_content val="message"><message><message_level val="error"/>' +
+            '<option val="some"><loc start="3" stop="8" line_nb="1" bol_pos="0" line_nb_last="1" ' +
+            'bol_pos_last="0"/></option><richpp><_>Error: bad</_></richpp></message>' +
+            '</feedback_content></feedback>' +
+            '<feedback object="state" route="0"><state_id val="11"/>' +
+            '<feedback_content val="message"><message><message_level val="error"/>' +
+            '<option val="none"/><richpp><_>Error: bad</_></richpp></message>' +
+            '</feedback_content></feedback>')
+    assert manager.feedback_events == [Processed(7), WorkerStatus(8, 'proofworker:0', 'Idle'),
+            ProcessingIn(8, 'master'), Feedback(9, 'custom', ['x', 'y']), ErrorMessage(10, 3, 8),
+            ErrorMessage(11, False, False)]
+    assert [i.text for i in printer.info] == ['Error: bad', 'Error: bad']
+
+def test_bus():
+    bus = EventBus()
+    seen = []
+    bus.subscribe(Processed, lambda e: seen.append(('all', e.state_id)))
+    bus.subscribe(Processed, lambda e: seen.append(('three', e.state_id)), 3)
+    bus.publish(Processed(2))
+    bus.publish(Processed(3))
+    bus.publish(WorkerStatus(3, 'w', 'Idle'))
+    bus.forget(3)
+    bus.publish(Processed(3))
+    assert seen == [('all', 2), ('all', 3), ('three', 3), ('all', 3)]
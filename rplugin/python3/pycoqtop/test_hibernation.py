@@ -0,0 +1,28 @@
+from .hibernation import LiveSessions
+
+def test_unlimited():
+    live = LiveSessions()
+    for name in 'abc':
+        assert live.use(name, lambda n: True) == []
+    assert live.live == ['a', 'b', 'c']
+
+def test_least_recently_used():
+    live = LiveSessions(2)
+    assert live.use('a', lambda n: True) == []
+    assert live.use('b', lambda n: True) == []
+    assert live.use('a', lambda n: True) == []
+    assert live.use('c', lambda n: True) == ['b']
+    assert live.live == ['a', 'c']
+    # A hibernated session is live again once used.
+    assert live.use('b', lambda n: True) == ['a']
+    live.forget('c')
+    assert live.live == ['b']
+
+def test_busy():
+    live = LiveSessions(1)
+    live.use('a', lambda n: True)
+    live.use('b', lambda n: True)
+    # Busy sessions stay live, over the limit.
+    assert live.use('c', lambda n: n != 'b') == []
+    assert live.live == ['b', 'c']
+    assert live.use('c', lambda n: True) == ['b']
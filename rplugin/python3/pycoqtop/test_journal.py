@@ -0,0 +1,30 @@
+from .bench_session import FakeSession
+from .coqapi import Ok
+from .journal import replay, unit_type
+
+def test_unit_type():
+    assert unit_type('Lemma a : True.') == 'command'
+    assert unit_type('\n  (* a. b. *)') == 'comment'
+    assert unit_type(' - ') == 'bullet'
+    assert unit_type('(* a *) auto.') == 'comment'
+
+def test_replay():
+    session = FakeSession().start()
+    try:
+        sentences = ['Lemma a : True.', '\n(* c *)', 'Proof.', 'auto.', 'Qed.']
+        for sentence in sentences:
+            session.ct.advance(sentence, unit_type(sentence))
+        session.ct.goals(True, True)
+        session.printer.wait(1, 'addgoal')
+        states = [s.id for s in session.ct.states + [session.ct.state_id]]
+        session.ct.kill()
+        assert session.ct.restart()
+        session.printer.wait(2, 'init')
+        assert replay(session.ct, sentences)
+        [(observe, _)] = session.printer.wait(1, 'observe')
+        assert isinstance(observe, Ok)
+        session.printer.wait(1, 'goal')
+        assert [s.id for s in session.ct.states + [session.ct.state_id]] == states
+        assert not replay(session.ct, ['(* d *)'])
+    finally:
+        session.close()
@@ -0,0 +1,45 @@
+from .log import Log, DEBUG, ERROR
+
+class Loud:
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'loud'
+
+def test_disabled():
+    log = Log()
+    arg = Loud()
+    log.debug("value: %s\n", arg)
+    log.error("value: %s\n", arg)
+    assert arg.count == 0
+    assert log.flush() == ''
+
+def test_levels():
+    log = Log(ERROR)
+    arg = Loud()
+    log.debug("debug %s\n", arg)
+    log.error("error %s\n", arg)
+    assert arg.count == 1
+    log.setLevel('debug')
+    log.debug("100%\n")
+    assert log.flush() == 'error loud\n100%\n'
+    assert log.flush() == ''
+
+def test_ring():
+    log = Log(DEBUG, size=3)
+    for i in range(10):
+        log.debug("%d\n", i)
+    assert log.flush() == '[7 older messages dropped]\n7\n8\n9\n'
+
+def test_file(tmpdir):
+    filename = str(tmpdir.join("coquille.log"))
+    log = Log(DEBUG)
+    log.setFile(filename, max_bytes=200, backups=2)
+    for i in range(50):
+        log.debug("message %d\n", i)
+    log.close()
+    assert tmpdir.join("coquille.log.1").check()
+    assert not tmpdir.join("coquille.log.3").check()
+    assert "message 49" in tmpdir.join("coquille.log").read()
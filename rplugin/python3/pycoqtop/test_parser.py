@@ -21,3 +21,16 @@ def test_some():
     assert len(parser.getI()) == 1
     assert parser.getI()[0] == "/usr/local/lib"
     assert len(parser.getR()) == 11
+
+def test_files():
+    parser = ProjectParser("test_data/filesCoqProject")
+    assert parser.getFiles() == ["test_data/A.v", "test_data/sub/B.v",
+            "test_data/theories/C.v", "/abs/D.v"]
+    assert len(parser.getR()) == 1
+    assert len(parser.getQ()) == 1
+
+def test_args():
+    parser = ProjectParser("test_data/argsCoqProject")
+    assert parser.getArgs()[3:] == ['-async-proofs-j', '4', '-async-proofs-worker-priority', 'low',
+            '-w', '-notation-overridden']
+    assert parser.getFiles() == ["test_data/A.v"]
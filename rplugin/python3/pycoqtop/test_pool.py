@@ -0,0 +1,100 @@
+from .bench_session import FakeSession, RecordingPrinter
+from .coqapi import Ok
+from .pool import PRELUDE, SessionPool, adopt, key
+
+PRELUDE_A_B = ['Require Import A.', 'Require Import B.']
+
+def filled(session, prelude):
+    pool = SessionPool()
+    pool.fill(session.parser, prelude)
+    [warm] = pool.sessions[key(session.parser)]
+    assert warm.printer.ready.wait(10)
+    return pool
+
+def test_prelude():
+    assert PRELUDE.match('From Coq Require Import List.')
+    assert PRELUDE.match('\n  Require Export A.')
+    assert PRELUDE.match('Local Open Scope list_scope.')
+    assert PRELUDE.match('Set Implicit Arguments.')
+    assert not PRELUDE.match('Lemma a : True.')
+    assert not PRELUDE.match('Required.')
+
+def test_adopt():
+    session = FakeSession()
+    pool = filled(session, PRELUDE_A_B)
+    printer = RecordingPrinter()
+    try:
+        (ct, prelude) = pool.take(session.parser, printer)
+        assert prelude == PRELUDE_A_B
+        assert pool.take(session.parser, printer) is None
+        header = [((0, 17, 'Require Import A.'), 'command'), ((1, 7, '(* c *)'), 'comment'),
+                ((2, 17, ' Require Import B.'), 'command')]
+        dots = adopt(ct, prelude, header)
+        assert dots == [dot for (dot, _) in header]
+        assert ct.state_id.id == 3
+        assert [s.id for s in ct.states] == [1, 1, 2, 2]
+        ct.advance('Lemma a : True.', 'command')
+        ct.goals(True)
+        [(add, _)] = printer.wait(1, 'add')
+        assert add.state_id.id == 4
+        # Nothing was undone.
+        assert isinstance(printer.wait(1, 'addgoal')[0][0], Ok)
+        assert [a for a in printer.answers if a[1] == 'undo'] == []
+        ct.kill()
+    finally:
+        pool.close()
+        session.close()
+
+def test_adopt_part():
+    session = FakeSession()
+    pool = filled(session, PRELUDE_A_B)
+    printer = RecordingPrinter()
+    try:
+        (ct, prelude) = pool.take(session.parser, printer)
+        header = [((0, 17, 'Require Import A.'), 'command'), ((1, 17, 'Require Import C.'), 'command')]
+        assert adopt(ct, prelude, header) == [(0, 17, 'Require Import A.')]
+        ct.advance('Require Import C.', 'command')
+        ct.goals(True)
+        [(undo, _)] = printer.wait(1, 'undo')
+        [(add, _)] = printer.wait(1, 'add')
+        assert isinstance(undo, Ok)
+        assert add.state_id.id == 4
+        assert [s.id for s in ct.states] == [1, 1, 2]
+        ct.kill()
+    finally:
+        pool.close()
+        session.close()
+
+def test_failed_prelude():
+    session = FakeSession()
+    pool = filled(session, ['Require fail.'])
+    try:
+        assert pool.take(session.parser, RecordingPrinter()) is None
+        assert pool.sessions[key(session.parser)] == []
+        # The prelude is not run again.
+        pool.fill(session.parser, ['Require fail.'])
+        [warm] = pool.sessions[key(session.parser)]
+        assert warm.prelude == []
+        assert warm.printer.ready.wait(10)
+        (ct, prelude) = pool.take(session.parser, RecordingPrinter())
+        ct.kill()
+    finally:
+        pool.close()
+        session.close()
+
+def test_shrink():
+    session = FakeSession()
+    pool = SessionPool(2)
+    try:
+        pool.fill(session.parser, [])
+        pool.fill(session.parser, [], ['-async-proofs', 'off'])
+        assert pool.count() == 4
+        stopped = pool.sessions[key(session.parser)][:]
+        pool.shrink(2)
+        assert pool.count() == 2
+        assert all(s.ct.coqtop is None for s in stopped)
+        pool.shrink(-1)
+        assert pool.count() == 0
+    finally:
+        pool.close()
+        session.close()
@@ -22,7 +22,10 @@ class FakePrinter:
         self.vim = FakeVim()
         pass
 
-    def debug(self, msg):
+    def debug(self, msg, *args):
+        pass
+
+    def error(self, msg, *args):
         pass
 
     def parseMessage(self, msg):
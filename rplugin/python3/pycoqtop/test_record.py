@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+from .bench_session import FakeSession, RecordingPrinter, script
+from .bench_replay import replay
+from .record import Recorder, Replayer, records, CALL, READ
+
+def record(filename, sentences, **config):
+    session = FakeSession(**config)
+    session.ct.setRecordFile(filename)
+    session.start()
+    try:
+        for sentence in sentences:
+            session.step(sentence)
+        session.printer.wait(len(sentences), 'addgoal')
+        return [(type(a), t) for (a, t) in session.printer.answers]
+    finally:
+        session.close()
+
+def check_replay(name):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, name)
+        sentences = script(8)
+        answers = record(filename, sentences, goals=2)
+        kinds = [kind for (kind, t, data) in records(filename)]
+        assert kinds.count(CALL) == 2 * len(sentences) + 1
+        assert READ in kinds
+        printer = RecordingPrinter()
+        replayer = Replayer(filename, printer)
+        replayer.run()
+        assert [(type(a), t) for (a, t) in printer.answers] == answers
+        assert len(printer.goals) == len(sentences)
+        assert replayer.state.state_id.id == len(sentences) + 1
+
+def test_replay():
+    check_replay('session.rec')
+
+def test_replay_compressed():
+    check_replay('session.rec.gz')
+
+def test_speed():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'session.rec')
+        record(filename, script(2), exec_latency=0.1)
+        report = replay(filename, 1)
+        assert report['replayed'] >= report['recorded'] > 0.2
+        assert report['answers'] == 5
+        assert report['valid'] == 2
+        assert report['errors'] == []
+
+def test_flush():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'session.rec')
+        recorder = Recorder(filename)
+        recorder.flush_interval = 3600
+        recorder.read(b'<value val="good"/>')
+        assert os.path.getsize(filename) == 0
+        recorder.flush_interval = 0
+        recorder.read(b'<value val="good"/>')
+        assert len(list(records(filename))) == 2
+        recorder.close()
@@ -0,0 +1,31 @@
+import xml.etree.ElementTree as ET
+
+from .coqapi import parse_value
+from .richpp import decode, highlights
+from .xmltype import RichPP
+
+def test_decode():
+    xml = ET.fromstring('<richpp><_><constr.keyword>forall</constr.keyword> ' +
+            '<constr.variable>n</constr.variable> : <constr.reference>nat</constr.reference>, ' +
+            '<constr.notation><constr.variable>n</constr.variable> = 0</constr.notation></_></richpp>')
+    assert decode(xml) == ('forall n : nat, n = 0', [(0, 6, 'CoqKeyword'),
+        (7, 8, 'CoqVariable'), (11, 14, 'CoqConstant'), (16, 21, 'CoqNotation'),
+        (16, 17, 'CoqVariable')])
+    assert parse_value(xml) == decode(xml)
+
+def test_decode_deep():
+    # Deeper than the recursion limit, and linear in the size of the text.
+    depth = 5000
+    xml = ET.fromstring('<richpp>' + '<constr.notation>x' * depth +
+            '</constr.notation>' * depth + '</richpp>')
+    rich = decode(xml)
+    assert rich.text == 'x' * depth
+    assert len(rich.spans) == depth
+    assert rich.spans[-1] == (depth - 1, depth, 'CoqNotation')
+
+def test_highlights():
+    rich = RichPP('H : é = x\n  -> y', [(4, 5, 'CoqVariable'), (8, 14, 'CoqNotation'),
+        (15, 16, 'CoqVariable')])
+    assert highlights(rich, 3) == [('CoqVariable', 3, 4, 6),
+            ('CoqNotation', 3, 9, 10), ('CoqNotation', 4, 0, 4),
+            ('CoqVariable', 4, 5, 6)]
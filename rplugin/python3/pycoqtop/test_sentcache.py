@@ -0,0 +1,61 @@
+import os
+
+from .sentcache import SentenceCache, entry_path
+from .sentences import SentenceIndex
+
+text = [
+"Goal forall n, n + 0 = n.",
+"Proof.",
+"(* induction *)",
+"induction n.",
+"- reflexivity.",
+"- simpl. f_equal.",
+"  auto.",
+"Qed."
+        ]
+
+def test_preload(tmpdir):
+    source = tmpdir.join("A.v")
+    source.write('\n'.join(text) + '\n')
+    cache = SentenceCache(str(tmpdir.join("cache")))
+    assert [p.wait() for p in cache.fill([str(source)], 1)] == [0]
+    entry = entry_path(cache.directory, str(source))
+    written = os.stat(entry).st_mtime_ns
+    # Unchanged files are not parsed again
+    assert [p.wait() for p in cache.fill([str(source)], 1)] == [0]
+    assert os.stat(entry).st_mtime_ns == written
+
+    idx = SentenceIndex(text)
+    assert cache.preload(idx, str(source))
+    ref = SentenceIndex(text)
+    ref.find(len(text), 0)
+    assert len(idx) == len(ref) == 11
+    assert [idx.get(i) for i in range(len(idx))] == [ref.get(i) for i in range(len(ref))]
+
+def test_modified(tmpdir):
+    source = tmpdir.join("A.v")
+    source.write('\n'.join(text) + '\n')
+    cache = SentenceCache(str(tmpdir.join("cache")))
+    [p.wait() for p in cache.fill([str(source)], 1)]
+    idx = SentenceIndex(text[:-1])
+    assert not cache.preload(idx, str(source))
+    assert len(idx) == 0
+    assert not cache.preload(idx, str(tmpdir.join("B.v")))
+
+def test_project(tmpdir):
+    sources = []
+    for name in ['A.v', 'B.v', 'C.v']:
+        source = tmpdir.join(name)
+        source.write('\n'.join(text) + '\n')
+        sources.append(str(source))
+    class Project:
+        def getFiles(self):
+            return sources
+    cache = SentenceCache(str(tmpdir.join("cache")))
+    thread = cache.fillProject(Project(), 2)
+    thread.join(30)
+    assert not thread.is_alive()
+    for source in sources:
+        assert cache.lookup(source, text) is not None
+    # Once per session.
+    assert cache.fillProject(Project(), 2) is None
@@ -0,0 +1,56 @@
+from .sentences import SentenceIndex
+
+fakebuffer = [
+"Goal forall n, n + 0 = n.",
+"Proof.",
+"(* induction *)",
+"induction n.",
+"- reflexivity.",
+"- simpl. f_equal.",
+"  auto.",
+"Qed."
+        ]
+
+def test_unit():
+    idx = SentenceIndex(fakebuffer)
+    assert idx.unit(0, 0) == [0, len(fakebuffer[0]), fakebuffer[0], 'command']
+    assert idx.unit(0, len(fakebuffer[0])) == [1, 6, "\nProof.", 'command']
+    assert len(idx) == 2
+    # Cached sentences are returned as they were parsed
+    assert idx.unit(0, 0) == [0, len(fakebuffer[0]), fakebuffer[0], 'command']
+    assert len(idx) == 2
+
+def test_find():
+    idx = SentenceIndex(fakebuffer)
+    assert idx.find(0, 0) == 0
+    assert idx.find(3, 0) == 3
+    (start, stop, content, typ) = idx.get(2)
+    assert start == (1, 6)
+    assert stop == (2, 15)
+    assert typ == 'comment'
+    assert idx.find(5, 8) == 8
+    assert idx.find(100, 0) == 11
+
+def test_far_unit():
+    idx = SentenceIndex(fakebuffer)
+    assert idx.unit(5, 8) == [5, 17, " f_equal.", 'command']
+    assert idx.get(8)[0] == (5, 8)
+
+def test_invalidate():
+    buf = list(fakebuffer)
+    idx = SentenceIndex(buf)
+    idx.find(100, 0)
+    buf[5] = "- simpl; f_equal."
+    idx.invalidate(5)
+    assert len(idx) == 6
+    assert idx.find(100, 0) == 10
+    assert idx.get(7)[2] == " simpl; f_equal."
+
+def test_end_of_buffer():
+    idx = SentenceIndex(["Lemma a: True.", "Proof. exact"])
+    assert idx.find(100, 0) == 2
+    try:
+        idx.unit(1, 6)
+        assert False
+    except:
+        pass
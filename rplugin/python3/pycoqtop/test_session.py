@@ -0,0 +1,310 @@
+import time
+
+from .bench_session import FakeSession, interrupt_latency, script
+from .coqapi import Ok, Err
+from .events import Died, ErrorMessage
+from .journal import replay
+from .workers import IDLE, async_options
+
+def test_step():
+    session = FakeSession(goals=2, bg=3).start()
+    try:
+        session.step('Lemma a : True.')
+        [(add, _)] = session.printer.wait(1, 'add')
+        [(goal, _)] = session.printer.wait(1, 'addgoal')
+        assert isinstance(add, Ok) and add.state_id.id == 2
+        assert isinstance(goal, Ok)
+        goals = session.printer.goals[-1]
+        assert len(goals.fg) == 2
+        assert len(goals.bg) == 3
+        assert session.ct.state_id.id == 2
+    finally:
+        session.close()
+
+def test_failure():
+    session = FakeSession().start()
+    try:
+        session.step('Lemma a : True.')
+        session.step('fail.')
+        [_, (err, _)] = session.printer.wait(2, 'add')
+        assert isinstance(err, Err)
+        assert (err.loc_s, err.loc_e) == (0, 5)
+        assert 'Error: The reference fail was not found.' in [i.text for i in session.printer.info]
+    finally:
+        session.close()
+
+def test_rewind():
+    session = FakeSession().start()
+    try:
+        for (i, sentence) in enumerate(['Lemma a : True.', 'Proof.', 'auto.']):
+            session.step(sentence)
+            session.printer.wait(i + 1, 'addgoal')
+        session.ct.rewind(2)
+        [(undo, _)] = session.printer.wait(1, 'undo')
+        assert isinstance(undo, Ok)
+        assert session.ct.state_id.id == 2
+    finally:
+        session.close()
+
+def test_pipeline():
+    # State ids that coqtop skips make the predictions of the pipeline wrong,
+    # so calls are cut off and sent again.
+    session = FakeSession(skip_ids=[5, 9, 10]).start()
+    try:
+        for sentence in script(12):
+            session.step(sentence)
+        answers = session.printer.wait(12, 'addgoal')
+        assert all(isinstance(a, Ok) for (a, _) in answers)
+        adds = session.printer.wait(12, 'add')
+        assert all(isinstance(a, Ok) for (a, _) in adds)
+        assert session.ct.states[-11:] == [a.state_id for (a, _) in adds[:-1]]
+        assert session.ct.state_id == adds[-1][0].state_id
+    finally:
+        session.close()
+
+def test_cutoff():
+    session = FakeSession(exec_fail_on=['bad']).start()
+    try:
+        sentences = script(12)
+        sentences[5] = 'bad.'
+        for sentence in sentences:
+            session.step(sentence)
+        session.printer.wait(1, 'undo')
+        answers = [(type(a), t) for (a, t) in session.printer.answers]
+        assert answers == [(Ok, 'init')] + [(Ok, 'add'), (Ok, 'addgoal')] * 5 + \
+                [(Ok, 'add'), (Err, 'addgoal'), (Ok, 'undo')]
+        assert session.ct.state_id.id == 6
+        session.step('Qed.')
+        [(add, _)] = session.printer.wait(7, 'add')[-1:]
+        assert session.ct.states[-1].id == 6
+        assert session.ct.state_id == add.state_id
+    finally:
+        session.close()
+
+def test_query():
+    session = FakeSession(query_results=3).start()
+    try:
+        session.ct.query('Search True.')
+        session.printer.wait(1, 'query')
+        assert len(session.printer.info) == 3
+    finally:
+        session.close()
+
+def test_idle():
+    # An idle session sleeps until it is given something to do.
+    session = FakeSession().start()
+    try:
+        session.step('Lemma a : True.')
+        session.printer.wait(1, 'addgoal')
+        # Leave time for the wakeup that follows the last answer.
+        time.sleep(0.05)
+        messenger = session.ct.messenger
+        wakeups = []
+        guarded_interupt = messenger.guarded_interupt
+        messenger.guarded_interupt = lambda: (wakeups.append(1), guarded_interupt())
+        time.sleep(0.3)
+        assert wakeups == []
+        session.step('Qed.')
+        session.printer.wait(2, 'addgoal')
+        assert wakeups != []
+    finally:
+        session.close()
+
+def test_interrupt():
+    assert interrupt_latency() < 0.5
+
+def bulk(session, sentences):
+    """ Send sentences and a single Goal call after them, like CoqToCursor. """
+    for sentence in sentences:
+        session.ct.advance(sentence, 'comment' if sentence.startswith('(*') else 'command')
+    session.ct.goals(True, True)
+
+def test_bulk():
+    session = FakeSession().start()
+    try:
+        bulk(session, ['Lemma a : True.', '(* proof *)', 'Proof.', 'auto.'])
+        session.printer.wait(1, 'addgoal')
+        answers = [(type(a), t) for (a, t) in session.printer.answers]
+        assert answers == [(Ok, 'init')] + [(Ok, 'add')] * 4 + [(Ok, 'addgoal')]
+        assert len(session.printer.goals) == 1
+        assert session.ct.state_id.id == 4
+        assert [s.id for s in session.ct.states[-4:]] == [1, 2, 2, 3]
+    finally:
+        session.close()
+
+def test_bulk_add_failure():
+    # The sentences before the failed one are still executed.
+    session = FakeSession().start()
+    try:
+        bulk(session, ['Lemma a : True.', 'Proof.', 'fail.', 'auto.'])
+        session.printer.wait(1, 'addgoal')
+        # The Add after the failed one may have been sent before the failure,
+        # and then undone.
+        answers = [(type(a), t) for (a, t) in session.printer.answers if t != 'undo']
+        assert answers == [(Ok, 'init'), (Ok, 'add'), (Ok, 'add'), (Err, 'add'), (Ok, 'addgoal')]
+        assert session.ct.state_id.id == 3
+    finally:
+        session.close()
+
+def test_bulk_exec_failure():
+    # coqtop goes back to the state before the sentence that failed.
+    session = FakeSession(exec_fail_on=['bad']).start()
+    try:
+        bulk(session, ['Lemma a : True.', 'Proof.', 'bad.', 'auto.'])
+        session.printer.wait(1, 'undo')
+        [(err, _)] = session.printer.wait(1, 'addgoal')
+        assert isinstance(err, Err)
+        assert err.state_id.id == 3
+        assert session.ct.state_id.id == 3
+        session.step('auto.')
+        [(add, _)] = session.printer.wait(5, 'add')[-1:]
+        assert isinstance(add, Ok)
+        assert session.ct.states[-1].id == 3
+    finally:
+        session.close()
+
+def test_bulk_interrupt():
+    # An interrupt before the Goal call drops the sentences that are not
+    # added yet, and executes the others.
+    session = FakeSession(latency=0.02).start()
+    try:
+        bulk(session, script(60))
+        session.printer.wait(1, 'add')
+        session.ct.interupt()
+        [(cancel, _)] = session.printer.wait(1, 'cancel')
+        assert isinstance(cancel, Ok)
+        adds = session.printer.wait(1, 'add')
+        assert 0 < len(adds) < 60
+        assert session.printer.wait(0, 'addgoal') == []
+        assert session.ct.state_id == adds[-1][0].state_id
+    finally:
+        session.close()
+
+def test_observe():
+    # Errors in proofs are reported after the answer to Observe, which does
+    # not wait for them.
+    session = FakeSession(exec_fail_on=['bad']).start()
+    errors = []
+    session.ct.events.subscribe(ErrorMessage, errors.append)
+    try:
+        for sentence in ['Lemma a : True.', 'Proof.', 'bad.', 'Qed.', 'Lemma b : True.']:
+            session.ct.advance(sentence, 'command')
+        session.ct.observe(True)
+        [(observe, _)] = session.printer.wait(1, 'observe')
+        assert isinstance(observe, Ok)
+        session.ct.goals()
+        session.printer.wait(1, 'goal')
+        assert errors == [ErrorMessage(4, 0, 4)]
+        assert session.ct.state_id.id == 6
+    finally:
+        session.close()
+
+def test_workers():
+    # Proofs that Observe delegates are shared between the workers.
+    session = FakeSession()
+    session.ct.setAsyncOptions(async_options(2))
+    session.start()
+    try:
+        for sentence in script(8):
+            session.ct.advance(sentence, 'command')
+        session.ct.observe(True)
+        session.printer.wait(1, 'observe')
+        session.ct.goals()
+        session.printer.wait(1, 'goal')
+        rows = session.ct.workers.snapshot()
+        assert [row[0] for row in rows] == ['master', 'proofworker:0', 'proofworker:1']
+        assert all(row[1] == IDLE for row in rows)
+        assert rows[1][4] > 0 and rows[2][4] > 0
+        assert session.ct.workers.summary() == '0/2 workers busy'
+    finally:
+        session.close()
+
+def test_observe_failure():
+    # Failures outside of proofs are answered like with Goal.
+    session = FakeSession(exec_fail_on=['bad']).start()
+    try:
+        bulk(session, ['Lemma a : True.', 'Qed.'])
+        session.printer.wait(1, 'addgoal')
+        for sentence in ['Definition bad := 1.', 'Lemma b : True.']:
+            session.ct.advance(sentence, 'command')
+        session.ct.observe(True)
+        [(err, _)] = session.printer.wait(1, 'observe')
+        assert isinstance(err, Err)
+        assert err.state_id.id == 3
+        session.printer.wait(1, 'undo')
+        assert session.ct.state_id.id == 3
+    finally:
+        session.close()
+
+def test_focus():
+    # Going back inside a closed proof keeps the states after it, which
+    # follow the proof again once it is closed.
+    session = FakeSession().start()
+    try:
+        bulk(session, ['Lemma a : True.', 'Proof.', 'auto.', 'Qed.', '(* b *)', 'Lemma b : True.',
+            'Proof.', 'auto.', 'Qed.'])
+        session.printer.wait(1, 'addgoal')
+        session.ct.rewind(7)
+        [(undo, _)] = session.printer.wait(1, 'undo')
+        assert [s.id for s in undo.focus] == [2, 5, 9]
+        assert session.ct.state_id.id == 3
+        assert [s.id for s in session.ct.tail] == [5, 6, 7, 8, 9]
+        bulk(session, ['trivial.', 'Qed.', 'Lemma c : True.'])
+        session.printer.wait(2, 'addgoal')
+        adds = [a for (a, t) in session.printer.answers if t == 'add']
+        assert [(a.state_id.id, a.tip and a.tip.id) for a in adds[-2:]] == [(10, None), (11, 9)]
+        # The Add queued after the end of the proof was not sent.
+        assert len(adds) == 11
+        assert [s.id for s in session.ct.states] == [1, 1, 2, 3, 10, 11, 11, 6, 7, 8]
+        assert session.ct.state_id.id == 9
+        assert session.ct.focus is None
+        session.step('Lemma c : True.')
+        [*_, (add, _)] = session.printer.wait(12, 'add')
+        assert isinstance(add, Ok) and add.state_id.id == 12
+    finally:
+        session.close()
+
+def test_unfocus():
+    # Going back before the focused proof forgets the states after it.
+    session = FakeSession().start()
+    try:
+        bulk(session, ['Lemma a : True.', 'Proof.', 'auto.', 'Qed.', 'Lemma b : True.'])
+        session.printer.wait(1, 'addgoal')
+        session.ct.rewind(3)
+        session.printer.wait(1, 'undo')
+        assert session.ct.focus is not None
+        session.ct.rewind(2)
+        session.printer.wait(2, 'undo')
+        assert session.ct.focus is None and session.ct.tail is None
+        session.step('Lemma a2 : True.')
+        [*_, (add, _)] = session.printer.wait(6, 'add')
+        assert isinstance(add, Ok) and add.state_id.id == 7
+    finally:
+        session.close()
+
+def test_died():
+    # The reader tells when coqtop dies, and the session can be replayed in a
+    # new process.
+    session = FakeSession(crash_on=['boom']).start()
+    died = []
+    session.ct.events.subscribe(Died, died.append)
+    try:
+        sentences = ['Lemma a : True.', 'Proof.']
+        for sentence in sentences:
+            session.step(sentence)
+        session.printer.wait(2, 'addgoal')
+        states = [s.id for s in session.ct.states + [session.ct.state_id]]
+        session.step('boom.')
+        deadline = time.monotonic() + 10
+        while died == [] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert died == [Died(None, 1)]
+        # Calls sent to the dead process are ignored.
+        session.step('auto.')
+        assert session.ct.restart()
+        session.printer.wait(2, 'init')
+        replay(session.ct, sentences)
+        session.printer.wait(1, 'goal')
+        assert [s.id for s in session.ct.states + [session.ct.state_id]] == states
+    finally:
+        session.close()
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from threading import Thread, Event
+
+from .bench_session import FakeSession
+from .trace import Tracer, TracedLock, TRACER
+
+def test_disabled():
+    tracer = Tracer()
+    with tracer.span('nothing', 'test'):
+        pass
+    tracer.complete('nothing', 'test', 0, 1)
+    assert len(tracer.events) == 0
+    assert tracer.export()['traceEvents'] == []
+
+def test_export():
+    tracer = Tracer(size=3)
+    tracer.enable()
+    with tracer.span('outer', 'test', {'n': 1}):
+        with tracer.span('inner', 'test'):
+            pass
+    start = tracer.now()
+    tracer.interval('call', 'test', start, start + 0.5)
+    tracer.complete('last', 'test', start, start + 1)
+    # The ring buffer only keeps the last events.
+    events = tracer.export()['traceEvents']
+    assert [e['ph'] for e in events] == ['M', 'X', 'b', 'e', 'X']
+    [thread, outer, begin, end, last] = events
+    assert thread['args']['name'] == 'MainThread'
+    assert outer['name'] == 'outer' and outer['args'] == {'n': 1}
+    assert begin['id'] == end['id']
+    assert abs(end['ts'] - begin['ts'] - 5e5) < 1
+    assert abs(last['dur'] - 1e6) < 1
+
+def test_lock():
+    tracer = Tracer()
+    tracer.enable()
+    lock = TracedLock('test', tracer)
+    with lock:
+        pass
+    assert len(tracer.events) == 0
+    held = Event()
+    release = Event()
+    def hold():
+        with lock:
+            held.set()
+            release.wait()
+    thread = Thread(target=hold)
+    thread.start()
+    held.wait()
+    assert not lock.acquire(False)
+    release.set()
+    with lock:
+        pass
+    thread.join()
+    [(ph, name, cat, start, end, tid, args)] = tracer.events
+    assert (ph, name, cat) == ('X', 'wait test', 'lock')
+
+def test_session():
+    TRACER.clear()
+    TRACER.enable()
+    session = FakeSession().start()
+    try:
+        session.step('Lemma a : True.')
+        session.printer.wait(1, 'addgoal')
+        session.ct.query('Check a.')
+        session.printer.wait(1, 'query')
+    finally:
+        session.close()
+        TRACER.enable(False)
+    (fd, filename) = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        TRACER.save(filename)
+        with open(filename) as f:
+            events = json.load(f)['traceEvents']
+    finally:
+        os.remove(filename)
+    calls = [e['name'] for e in events if e['ph'] == 'b' and e['cat'] == 'coqtop']
+    assert calls == ['Init', 'Add', 'Goal', 'Query']
+    threads = {e['tid']: e['args']['name'] for e in events if e['ph'] == 'M'}
+    parses = [e for e in events if e['name'] == 'parse']
+    assert parses != []
+    assert all(threads[e['tid']] == 'CoqParser' for e in parses)
+    assert sum(e['args']['bytes'] for e in parses) == session.ct.stats()['bytes']
@@ -0,0 +1,41 @@
+from .events import EventBus, ProcessingIn, WorkerStatus
+from .workers import IDLE, Workers, async_options, worker_count
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_async_options():
+    assert async_options(3) == ['-async-proofs-j', '3']
+    assert async_options(2, 'low', 0.5) == ['-async-proofs-j', '2', '-async-proofs-worker-priority', 'low',
+            '-async-proofs-delegation-threshold', '0.5']
+    assert worker_count(async_options()) >= 1
+    assert worker_count(async_options(3) + ['-R', '.', 'Foo', '-async-proofs-j', '1']) == 1
+    assert worker_count(['-R', '.', 'Foo']) is None
+
+def test_workers():
+    events = EventBus()
+    clock = Clock()
+    workers = Workers(events, clock)
+    workers.reset(2)
+    events.publish(WorkerStatus(1, 'proofworker:0', IDLE))
+    events.publish(WorkerStatus(1, 'proofworker:1', IDLE))
+    events.publish(ProcessingIn(2, 'master'))
+    clock.now = 1.0
+    events.publish(WorkerStatus(1, 'proofworker:1', 'proof: a'))
+    events.publish(ProcessingIn(3, 'proofworker:1'))
+    events.publish(ProcessingIn(4, 'proofworker:1'))
+    clock.now = 3.0
+    assert workers.summary() == '1/2 workers busy'
+    assert workers.snapshot() == [('master', IDLE, 0.0, 0.0, 1), ('proofworker:0', IDLE, 0.0, 0.0, 0),
+            ('proofworker:1', 'proof: a', 2.0, 2.0, 2)]
+    events.publish(WorkerStatus(1, 'proofworker:1', IDLE))
+    clock.now = 4.0
+    assert workers.summary() == '0/2 workers busy'
+    assert workers.snapshot()[2] == ('proofworker:1', IDLE, 0.0, 2.0, 2)
+    assert workers.report()[3] == 'proofworker:1: Idle, busy 2.0s, 2 sentences'
+    workers.reset(1)
+    assert workers.snapshot() == []
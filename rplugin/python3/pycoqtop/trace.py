@@ -0,0 +1,164 @@
+"""
+Timing of what the threads of the plugin do, exported in the Chrome trace
+format that chrome://tracing and https://ui.perfetto.dev read.
+
+Spans are recorded for the calls to coqtop (from the call to its answer), the
+chunks of XML parsed, the requests to nvim and the redraws of the buffers, in
+the thread that runs them, along with the time spent waiting for the locks
+that are shared between threads.  Tracing is off unless
+g:coquille_trace_file is set, and CoqTrace writes the trace to that file.
+"""
+import functools
+import itertools
+import json
+import os
+import time
+from collections import deque
+from threading import Lock, current_thread
+
+class Span:
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.cat, self.start, time.perf_counter(), self.args)
+        return False
+
+class NoSpan:
+    """ Span of a disabled tracer, that records nothing. """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NOSPAN = NoSpan()
+
+class Tracer:
+    """
+    Recorder of timed events, in a ring buffer of fixed size so that a long
+    session does not grow it forever.  Events are tuples, only turned into
+    the JSON of the trace when it is exported.  Appending to a deque is
+    atomic, so threads record without a lock.
+    """
+    def __init__(self, size=200000):
+        self.enabled = False
+        self.events = deque(maxlen=size)
+        self.threads = {}
+        self.ids = itertools.count(1)
+        self.origin = time.perf_counter()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def clear(self):
+        self.events.clear()
+        self.origin = time.perf_counter()
+
+    def now(self):
+        return time.perf_counter()
+
+    def thread(self):
+        thread = current_thread()
+        self.threads[thread.ident] = thread.name
+        return thread.ident
+
+    def complete(self, name, cat, start, end, args=None):
+        """ Record a span of the current thread, from start to end, which are
+            times given by now. """
+        if self.enabled:
+            self.events.append(('X', name, cat, start, end, self.thread(), args))
+
+    def interval(self, name, cat, start, end, args=None):
+        """ Record a span that may overlap with others of the same thread, like
+            the calls to coqtop that are in flight together. """
+        if self.enabled:
+            self.events.append(('b', name, cat, start, end, self.thread(), args))
+
+    def span(self, name, cat, args=None):
+        """ Return a context manager that records a span around its block. """
+        if not self.enabled:
+            return NOSPAN
+        return Span(self, name, cat, args)
+
+    def export(self):
+        """ Return the events recorded so far as a Chrome trace. """
+        pid = os.getpid()
+        events = []
+        for (tid, name) in list(self.threads.items()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': name}})
+        for (ph, name, cat, start, end, tid, args) in list(self.events):
+            ts = (start - self.origin) * 1e6
+            event = {'name': name, 'cat': cat, 'ph': ph, 'ts': ts, 'pid': pid, 'tid': tid}
+            if args is not None:
+                event['args'] = args
+            if ph == 'X':
+                event['dur'] = (end - start) * 1e6
+                events.append(event)
+            else:
+                event['id'] = next(self.ids)
+                events.append(event)
+                events.append({'name': name, 'cat': cat, 'ph': 'e', 'ts': (end - self.origin) * 1e6,
+                    'pid': pid, 'tid': tid, 'id': event['id']})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        """ Write the trace to filename, and return its number of events. """
+        trace = self.export()
+        with open(filename, 'w') as f:
+            json.dump(trace, f)
+        return len(trace['traceEvents'])
+
+# The tracer of the plugin, shared by every session.
+TRACER = Tracer()
+
+def traced(name, cat):
+    """ Decorator that records a span for each call of a function. """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name, cat):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class TracedLock:
+    """ Lock that records the time spent waiting for it, when it is held by
+        another thread. """
+    def __init__(self, name, tracer=TRACER):
+        self.name = name
+        self.tracer = tracer
+        self.lock = Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.tracer.complete('wait ' + self.name, 'lock', start, time.perf_counter())
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
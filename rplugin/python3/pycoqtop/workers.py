@@ -0,0 +1,121 @@
+"""
+What the workers of coqtop do, from its feedback.  With asynchronous proofs,
+coqtop checks proofs in worker processes, whose number, priority and the time
+under which a proof is checked without them are set by the options of
+async_options.  Each worker reports its status (Idle, or the proof it checks)
+in workerstatus feedback, and the sentences executed by each of them, or by
+coqtop itself (the master), are given by processingin feedback.
+"""
+import os
+import time
+from threading import Lock
+
+from .events import ProcessingIn, WorkerStatus
+
+IDLE = 'Idle'
+
+def async_options(workers=None, priority=None, threshold=None):
+    """ Return the options of coqtop for its workers: their number (the number
+        of cores by default), their priority ('low' or 'high') and the time in
+        seconds under which a proof is checked without them. """
+    options = ['-async-proofs-j', str(workers or os.cpu_count() or 1)]
+    if priority:
+        options += ['-async-proofs-worker-priority', priority]
+    if threshold not in (None, ''):
+        options += ['-async-proofs-delegation-threshold', str(threshold)]
+    return options
+
+def worker_count(options):
+    """ Return the number of workers that options ask for, as coqtop reads
+        them: the last one counts. """
+    count = None
+    for (option, value) in zip(options, options[1:]):
+        if option == '-async-proofs-j':
+            count = int(value)
+    return count
+
+class Worker:
+    def __init__(self, name, now):
+        self.name = name
+        self.status = IDLE
+        # When the worker got its status, and the time it was busy before.
+        self.since = now
+        self.busy = 0.0
+        # Number of sentences it executed, and the state of the last one.
+        self.executed = 0
+        self.state_id = None
+
+class Workers:
+    """
+    Status of the workers of a session, and of the master.  The feedback is
+    published in the thread that reads coqtop, and the status is read from
+    nvim, so the workers are kept under a lock.
+    """
+    def __init__(self, events, clock=time.monotonic):
+        self.clock = clock
+        self.lock = Lock()
+        self.workers = {}
+        # Number of workers that coqtop was started with, if known.
+        self.size = None
+        events.subscribe(WorkerStatus, self.status)
+        events.subscribe(ProcessingIn, self.processing)
+
+    def reset(self, size=None):
+        with self.lock:
+            self.workers = {}
+            self.size = size
+
+    def worker(self, name, now):
+        worker = self.workers.get(name)
+        if worker is None:
+            worker = Worker(name, now)
+            self.workers[name] = worker
+        return worker
+
+    def status(self, event):
+        now = self.clock()
+        with self.lock:
+            worker = self.worker(event.worker, now)
+            if worker.status == event.status:
+                return
+            if worker.status != IDLE:
+                worker.busy += now - worker.since
+            worker.status = event.status
+            worker.since = now
+
+    def processing(self, event):
+        now = self.clock()
+        with self.lock:
+            worker = self.worker(event.worker, now)
+            worker.executed += 1
+            worker.state_id = event.state_id
+
+    def snapshot(self):
+        """ Return, for the master and each worker, its name, its status, for
+            how long it has had that status if it is busy, the total time it
+            was busy and the number of sentences it executed. """
+        now = self.clock()
+        rows = []
+        with self.lock:
+            for name in sorted(self.workers, key=lambda n: (n != 'master', n)):
+                worker = self.workers[name]
+                current = now - worker.since if worker.status != IDLE else 0.0
+                rows.append((name, worker.status, current, worker.busy + current, worker.executed))
+        return rows
+
+    def summary(self):
+        """ Return a short description of the load of the workers. """
+        with self.lock:
+            workers = [w for w in self.workers.values() if w.name != 'master']
+            busy = len([w for w in workers if w.status != IDLE])
+            size = self.size if self.size is not None else len(workers)
+        return '{}/{} workers busy'.format(busy, size)
+
+    def report(self):
+        """ Return the lines of a table of the status of the workers. """
+        lines = [self.summary()]
+        for (name, status, current, busy, executed) in self.snapshot():
+            if status != IDLE:
+                status = '{} (for {:.1f}s)'.format(status, current)
+            lines.append('{}: {}, busy {:.1f}s, {} sentences'.format(name, status, busy, executed))
+        return lines
@@ -1,3 +1,4 @@
+from bisect import bisect_left
 from collections import namedtuple
 
 Inl = namedtuple('Inl', ['val'])
@@ -16,4 +17,41 @@ Goals = namedtuple('Goals', ['fg', 'bg', 'shelved', 'given_up'])
 Goal = namedtuple('Goal', ['id', 'hyp', 'ccl'])
 Evar = namedtuple('Evar', ['info'])
 
-RichPP = namedtuple('RichPP', ['parts'])
+# Pretty-printed text, with the spans of its markup as (start, end, group)
+# triples, see richpp.py.
+RichPP = namedtuple('RichPP', ['text', 'spans'])
+
+class LazyGoal(namedtuple('LazyGoal', ['id', 'parts', 'ends', 'offsets', 'spans'])):
+    """
+    A goal as received from coqtop.  parts are the fragments of text of its
+    hypotheses and conclusion, and ends the index in parts of the end of each
+    hypothesis, then of the conclusion.  The text of a hypothesis or of the
+    conclusion is only joined when it is used.  offsets are the same ends as
+    offsets in the whole text, that spans refer to.
+    """
+    __slots__ = ()
+
+    def text(self, i):
+        start = self.ends[i - 1] if i > 0 else 0
+        return ''.join(self.parts[start:self.ends[i]])
+
+    @property
+    def hyp(self):
+        return [self.text(i) for i in range(len(self.ends) - 1)]
+
+    @property
+    def ccl(self):
+        return self.text(len(self.ends) - 1)
+
+    def rich(self, i):
+        """ Return the text of the i-th hypothesis, or of the conclusion if i
+            is the number of hypotheses, with its spans, as a RichPP. """
+        start = self.offsets[i - 1] if i > 0 else 0
+        end = self.offsets[i]
+        # Spans are sorted by start, and never cross the end of a hypothesis.
+        lo = bisect_left(self.spans, (start,))
+        hi = bisect_left(self.spans, (end,))
+        return RichPP(self.text(i), [(s - start, e - start, g) for (s, e, g) in self.spans[lo:hi]])
+
+    def force(self):
+        return Goal(self.id, self.hyp, self.ccl)
@@ -24,6 +24,22 @@ syn match   coqIdent             contained "[_[:alpha:]][_'[:alnum:]]*"
 " Number of goals
 syn match   coqNumberGoals       '\d\+ subgoals\?' nextgroup=coqGoal
 
+if get(b:, 'coquille_richpp', 0)
+" Hypotheses and terms are highlighted by coquille from the markup sent by
+" coqtop, so that big goals do not need a syntax pass over their terms.
+
+" Separator
+syn match   coqGoalLine         '^=\+' nextgroup=coqGoalNumber skipwhite
+syn match   coqGoalNumber       contained "(\s*\d\+\s*\/\s*\d\+\s*)"
+
+" Every item fits on a line
+syn sync minlines=1
+syn sync maxlines=1
+
+else
+" Until coqtop sends markup, which older versions never do, terms are
+" highlighted with these regexes.
+
 " Hypothesis
 syn region  coqHypothesisBlock  contains=coqHypothesis start="^\([_[:alpha:]][_'[:alnum:]]*,\s*\)*[_[:alpha:]][_'[:alnum:]]*\s*:" end="^$" keepend
 syn region  coqHypothesis       contained contains=coqHypothesisBody matchgroup=coqIdent start="^\([_[:alpha:]][_'[:alnum:]]*,\s*\)*[_[:alpha:]][_'[:alnum:]]*" matchgroup=NONE end="^\S"me=e-1
@@ -51,6 +67,7 @@ syn region  coqString            start=+"+ skip=+""+ end=+"+ extend
 " Synchronization
 syn sync minlines=50
 syn sync maxlines=500
+endif
 
 " Define the default highlighting.
 " For version 5.7 and earlier: only when not done already